@@ -0,0 +1,243 @@
+"""
+Authentication mode benchmark.
+
+The queries are benchmarked with every mode of authentication:
+- admin_secret: the admin secret, as the other benchmarks do
+- jwt_hs256, jwt_rs256, jwt_rs512: a pool of JWTs signed with the algorithm,
+  with realistic claims, which the requests rotate through
+- webhook: an authorization webhook stand-in (a WebhookSink), with a response
+  time and a Cache-Control max-age
+
+The JWT secret and the webhook are configured when graphql-engine starts, so
+a graphql-engine is launched for every mode but admin_secret. All the modes
+authorize the admin role, so that the queries run the same SQL and only the
+cost of authentication differs.
+
+For every mode and query, the throughput is measured with back to back
+requests, then the latency at a fixed rate of requests (by default 60% of the
+throughput of admin_secret), along with the number of webhook calls per
+request.
+"""
+
+import json
+import os
+import time
+
+import jwt
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import load_generator
+import workload
+from webhook_sink import WebhookSink
+
+auth_modes = ['admin_secret', 'jwt_hs256', 'jwt_rs256', 'jwt_rs512', 'webhook']
+
+jwt_algorithms = {'jwt_hs256': 'HS256', 'jwt_rs256': 'RS256', 'jwt_rs512': 'RS512'}
+
+# Used if graphql-engine is not given an admin secret, which JWT and webhook modes need
+default_admin_secret = 'hge-bench-auth-secret'
+
+jwt_issuer = 'https://hge-bench.example.com/'
+
+jwt_audience = 'hge-bench'
+
+# Share of the throughput of admin_secret at which latencies are compared
+default_rate_share = 0.6
+
+
+def gen_rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+
+def public_key_pem(private_key):
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+
+def mk_jwt_key(algorithm):
+    """The key to sign with, and the --jwt-secret of graphql-engine"""
+    if algorithm.startswith('HS'):
+        key = os.urandom(32).hex()
+        return (key, {'type': algorithm, 'key': key, 'audience': jwt_audience, 'issuer': jwt_issuer})
+    private_key = gen_rsa_key()
+    return (private_key, {'type': algorithm, 'key': public_key_pem(private_key), 'audience': jwt_audience, 'issuer': jwt_issuer})
+
+
+# Same as mk_claims_with_namespace_path of tests-py/validate.py, which can not be
+# imported here as it depends on the test suite
+def mk_claims_with_namespace_path(claims, hasura_claims, namespace_path):
+    if namespace_path is None:
+        claims['https://hasura.io/jwt/claims'] = hasura_claims
+    elif namespace_path == "$":
+        claims.update(hasura_claims)
+    elif namespace_path == "$.hasura_claims":
+        claims['hasura_claims'] = hasura_claims
+    elif namespace_path == "$.hasura['claims%']":
+        claims['hasura'] = {}
+        claims['hasura']['claims%'] = hasura_claims
+    else:
+        raise ValueError('Unsupported claims_namespace_path: {}'.format(namespace_path))
+    return claims
+
+
+def mk_claims(user_id, now, namespace_path=None):
+    """Claims of a token of an identity provider, for user user_id"""
+    claims = {
+        'sub': str(user_id),
+        'iss': jwt_issuer,
+        'aud': jwt_audience,
+        'iat': now,
+        'exp': now + 24 * 3600,
+        'name': 'Bench User {}'.format(user_id),
+        'email': 'user{}@hge-bench.example.com'.format(user_id),
+        'email_verified': True,
+        'scope': 'openid profile email'
+    }
+    hasura_claims = {
+        'x-hasura-allowed-roles': ['admin'],
+        'x-hasura-default-role': 'admin',
+        'x-hasura-user-id': str(user_id),
+        'x-hasura-org-id': str(user_id % 100)
+    }
+    return mk_claims_with_namespace_path(claims, hasura_claims, namespace_path)
+
+
+def mk_token_pool(algorithm, key, size):
+    now = int(time.time())
+    return [
+        jwt.encode(mk_claims(i, now), key, algorithm=algorithm).decode('utf-8')
+        for i in range(size)
+    ]
+
+
+def webhook_response(cache_max_age):
+    """
+    The session variables returned by the webhook. graphql-engine reads
+    Cache-Control from the response body
+    """
+    response = {'X-Hasura-Role': 'admin', 'X-Hasura-User-Id': '1'}
+    headers = {}
+    if cache_max_age is not None:
+        response['Cache-Control'] = headers['Cache-Control'] = 'max-age={}'.format(cache_max_age)
+    return (response, headers)
+
+
+def hge_auth_args(mode, admin_secret, jwt_conf=None, webhook_url=None):
+    args = [] if admin_secret else ['--admin-secret', default_admin_secret]
+    if mode in jwt_algorithms:
+        args += ['--jwt-secret', json.dumps(jwt_conf)]
+    elif mode == 'webhook':
+        args += ['--auth-hook', webhook_url]
+    return args
+
+
+def mode_workload(mode, query_str, headers_pool):
+    """A workload of the query, rotating through the headers"""
+    return workload.Workload(mode, [workload.Operation(mode, query_str, headers=h) for h in headers_pool])
+
+
+def check_auth(hge, query_str, headers):
+    """Run the query once with the headers, as requests of the mode do not go through graphql_q"""
+    resp = requests.post(hge.url + '/v1/graphql', json.dumps({'query': query_str}), headers=headers)
+    assert resp.status_code == 200 and 'errors' not in resp.json(), resp.text
+
+
+def latency_ms(summary, mode):
+    op = summary['operations'][mode]
+    return {
+        'mean_ms': op['latency']['mean'] / 1000.0,
+        **{'p{}_ms'.format(p): v / 1000.0 for (p, v) in op['latency']['dist'].items()},
+        'max_ms': op['latency']['max'] / 1000.0
+    }
+
+
+def run_mode_load(hge, mode, query_str, headers_pool, params, duration, rps=None):
+    (_, _, summary) = load_generator.run_load(
+        hge.url + '/v1/graphql', None, {}, params['threads'], params['connections'], duration,
+        rps=rps, workload=mode_workload(mode, query_str, headers_pool)
+    )
+    requests_count = summary['summary']['requests']
+    return {
+        'requests': requests_count,
+        'requests_per_sec': requests_count / float(duration),
+        'errors': sum(summary['summary']['errors'].values()),
+        'latency': latency_ms(summary, mode)
+    }
+
+
+def measure_mode(hge, mode, queries, headers_pool, params, duration, rates, sink=None):
+    """
+    Yields the throughput and the latency at a fixed rate of every query,
+    and the webhook calls per request
+    """
+    for (name, query_str) in queries:
+        check_auth(hge, query_str, headers_pool[0])
+        calls_before = sink.received() if sink else 0
+        print("Auth benchmark: {}, query {}, throughput for {}s".format(mode, name, duration))
+        throughput = run_mode_load(hge, mode, query_str, headers_pool, params, duration)
+        rps = rates.get(name) or max(1, int(default_rate_share * throughput['requests_per_sec']))
+        rates[name] = rps
+        print("Auth benchmark: {}, query {}, latency at {} req/s for {}s".format(mode, name, rps, duration))
+        fixed_rate = run_mode_load(hge, mode, query_str, headers_pool, params, duration, rps=rps)
+        calls = sink.received() - calls_before if sink else None
+        total_requests = throughput['requests'] + fixed_rate['requests']
+        yield {
+            'auth_mode': mode,
+            'query_name': name,
+            'tokens': len(headers_pool) if mode in jwt_algorithms else None,
+            'max_rps': throughput['requests_per_sec'],
+            'max_rps_latency': throughput['latency'],
+            'rps': rps,
+            'latency': fixed_rate['latency'],
+            'errors': throughput['errors'] + fixed_rate['errors'],
+            'webhook_calls_per_request': calls / float(total_requests) if calls is not None and total_requests else None,
+            'webhook_latency_ms': None,
+            'cache_max_age': None
+        }
+
+
+def run_auth_benchmark(hge, mk_hge, sink_port, modes, queries, params, duration, token_pool_size,
+                       webhook_latency_ms=0, cache_max_age=None, sink_workers=None):
+    """
+    Yields the measurements of every mode and query (a list of (name, query
+    text)). mk_hge(extra_args) makes the graphql-engine of a mode. The rate
+    of the latency tests of every query is the one of the first mode
+    """
+    admin_secret = hge.admin_secret()
+    rates = {}
+    for mode in modes:
+        if mode == 'admin_secret':
+            yield from measure_mode(hge, mode, queries, [hge.admin_auth_headers()], params, duration, rates)
+            continue
+        sink = None
+        if mode in jwt_algorithms:
+            algorithm = jwt_algorithms[mode]
+            print("Signing {} {} tokens".format(token_pool_size, algorithm))
+            (key, jwt_conf) = mk_jwt_key(algorithm)
+            headers_pool = [{'Authorization': 'Bearer ' + t} for t in mk_token_pool(algorithm, key, token_pool_size)]
+            extra_args = hge_auth_args(mode, admin_secret, jwt_conf=jwt_conf)
+        elif mode == 'webhook':
+            (response, response_headers) = webhook_response(cache_max_age)
+            sink = WebhookSink(sink_port, fields=None, delay_ms=webhook_latency_ms, workers=sink_workers,
+                               response=response, response_headers=response_headers)
+            sink.start()
+            headers_pool = [{'Authorization': 'Bearer opaque-token-{}'.format(i)} for i in range(token_pool_size)]
+            extra_args = hge_auth_args(mode, admin_secret, webhook_url=sink.url)
+        else:
+            raise ValueError('Unknown auth mode: ' + mode)
+        mode_hge = mk_hge(extra_args)
+        try:
+            mode_hge.run()
+            for result in measure_mode(mode_hge, mode, queries, headers_pool, params, duration, rates, sink):
+                result['webhook_latency_ms'] = webhook_latency_ms if sink else None
+                result['cache_max_age'] = cache_max_age if sink else None
+                yield result
+        finally:
+            mode_hge.teardown()
+            if sink:
+                sink.stop()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+"""
+Compare the benchmark results of a candidate version (or docker image) of
+graphql-engine against a baseline, and exit with a non-zero status if the
+candidate regresses beyond a threshold.
+
+For every query and requests/sec level run on both, a sample of the latencies
+is loaded through latencies_uri. Relative changes of p50 and p99 get
+bootstrap confidence intervals, and a one sided Mann-Whitney U test checks
+whether the candidate's latencies are stochastically greater. A percentile
+regresses if its change is beyond the threshold and its confidence interval
+is above zero; as the rank test barely reacts to a shift of the tail, it is
+only required to be significant for p50. Max throughput
+is compared using hge_bench.avg_query_max_rps. Results are read from the
+results GraphQL engine, or from the Parquet files of --results-parquet-dir.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from colorama import Fore, Style
+
+import latency_store
+import results_store
+
+
+class CompareError(Exception):
+    pass
+
+
+def get_results(store, version):
+    res = store.get_results(version)
+    if not res['latency'] and not res['max_rps']:
+        raise CompareError('No results found for ' + version)
+    return res
+
+
+def load_latencies_ms(uri, max_samples, rng):
+    return latency_store.load_sample(uri, max_samples, rng) / 1000.0
+
+
+def bootstrap_relative_change(baseline, candidate, q, n_boot, alpha, rng):
+    """
+    Relative change of the q-th percentile from baseline to candidate, with its
+    (1 - alpha) bootstrap confidence interval
+    """
+    estimate = np.percentile(candidate, q) / np.percentile(baseline, q) - 1
+    b = rng.choice(baseline, (n_boot, len(baseline)), replace=True)
+    c = rng.choice(candidate, (n_boot, len(candidate)), replace=True)
+    changes = np.percentile(c, q, axis=1) / np.percentile(b, q, axis=1) - 1
+    (lo, hi) = np.percentile(changes, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return (estimate, lo, hi)
+
+
+def compare_latencies(baseline, candidate, threshold, alpha, n_boot, max_samples, rng):
+    rows = []
+    base_by_key = {(r['cpu_key'], r['query_name'], r['requests_per_sec'], r['scale_factor']): r for r in baseline}
+    for cand in candidate:
+        key = (cand['cpu_key'], cand['query_name'], cand['requests_per_sec'], cand['scale_factor'])
+        base = base_by_key.get(key)
+        if not base or not base['latencies_uri'] or not cand['latencies_uri']:
+            continue
+        b = load_latencies_ms(base['latencies_uri'], max_samples, rng)
+        c = load_latencies_ms(cand['latencies_uri'], max_samples, rng)
+        # Does the candidate have greater latencies than the baseline?
+        p_value = stats.mannwhitneyu(c, b, alternative='greater').pvalue
+        for (metric, q) in [('p50', 50), ('p99', 99)]:
+            (change, lo, hi) = bootstrap_relative_change(b, c, q, n_boot, alpha, rng)
+            # A regression has to be beyond the threshold, and significant
+            regressed = change > threshold and lo > 0 and (metric != 'p50' or p_value < alpha)
+            rows.append({
+                'query': cand['query_name'],
+                'req/sec': cand['requests_per_sec'],
+                'scale': cand['scale_factor'],
+                'metric': metric + ' (ms)',
+                'baseline': np.percentile(b, q),
+                'candidate': np.percentile(c, q),
+                'change %': 100 * change,
+                'CI %': '[{:.1f}, {:.1f}]'.format(100 * lo, 100 * hi),
+                'p-value': p_value,
+                'regression': regressed
+            })
+    return rows
+
+
+def compare_max_rps(baseline, candidate, threshold):
+    rows = []
+    base_by_key = {(r['cpu_key'], r['query_name'], r['scale_factor']): r for r in baseline}
+    for cand in candidate:
+        base = base_by_key.get((cand['cpu_key'], cand['query_name'], cand['scale_factor']))
+        if not base:
+            continue
+        b = float(base['max_rps'])
+        c = float(cand['max_rps'])
+        change = c / b - 1 if b else 0
+        rows.append({
+            'query': cand['query_name'],
+            'req/sec': None,
+            'scale': cand['scale_factor'],
+            'metric': 'max throughput (req/s)',
+            'baseline': b,
+            'candidate': c,
+            'change %': 100 * change,
+            'CI %': None,
+            'p-value': None,
+            'regression': change < -threshold
+        })
+    return rows
+
+
+def run_compare(store, baseline_version, candidate_version, threshold=0.05, alpha=0.05, n_boot=1000, max_samples=10000, seed=0):
+    """Returns a DataFrame with one row for every comparison"""
+    rng = np.random.RandomState(seed)
+    baseline = get_results(store, baseline_version)
+    candidate = get_results(store, candidate_version)
+    rows = compare_latencies(baseline['latency'], candidate['latency'], threshold, alpha, n_boot, max_samples, rng)
+    rows += compare_max_rps(baseline['max_rps'], candidate['max_rps'], threshold)
+    if not rows:
+        raise CompareError('No common benchmarks between {} and {}'.format(baseline_version, candidate_version))
+    return pd.DataFrame(rows)
+
+
+def compare_paired_trials(pairs, metrics, alpha=0.05):
+    """
+    Paired comparison of interleaved A/B trials. pairs is a list of dicts with
+    the trial results of 'A' and 'B'. For every metric, returns the mean of the
+    paired differences (B - A) with its (1 - alpha) t confidence interval, the
+    same relative to the mean of A, and the p-value of a paired t test
+    """
+    def finite(x):
+        return float(x) if np.isfinite(x) else None
+    out = {}
+    for m in metrics:
+        a = np.array([p['A'][m] for p in pairs], dtype=np.float64)
+        b = np.array([p['B'][m] for p in pairs], dtype=np.float64)
+        d = b - a
+        n = len(d)
+        mean = d.mean()
+        if n > 1:
+            half_width = stats.t.ppf(1 - alpha / 2, n - 1) * d.std(ddof=1) / np.sqrt(n)
+            p_value = stats.ttest_rel(b, a).pvalue
+        else:
+            half_width = np.nan
+            p_value = np.nan
+        base = a.mean()
+        out[m] = {
+            'a_mean': finite(base),
+            'b_mean': finite(b.mean()),
+            'difference': finite(mean),
+            'ci': [finite(mean - half_width), finite(mean + half_width)],
+            'change': finite(mean / base) if base else None,
+            'change_ci': [finite((mean - half_width) / base), finite((mean + half_width) / base)] if base else None,
+            'p_value': finite(p_value),
+            'pairs': n
+        }
+    return out
+
+
+def print_paired_comparison(comparison, alpha=0.05):
+    rows = []
+    for (m, c) in comparison.items():
+        rows.append({
+            'metric': m,
+            'A': c['a_mean'],
+            'B': c['b_mean'],
+            'B - A': c['difference'],
+            'change %': 100 * c['change'] if c['change'] is not None else None,
+            'CI %': '[{:.2f}, {:.2f}]'.format(100 * c['change_ci'][0], 100 * c['change_ci'][1])
+                    if c['change_ci'] and None not in c['change_ci'] else None,
+            'p-value': c['p_value'],
+            'significant': c['p_value'] is not None and c['p_value'] < alpha
+        })
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(pd.DataFrame(rows).to_string(index=False))
+
+
+def print_table(df):
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(df.to_string(index=False))
+    regressions = df[df['regression']]
+    if len(regressions) > 0:
+        print(Fore.RED + '{} regression(s) found'.format(len(regressions)) + Style.RESET_ALL)
+    else:
+        print(Fore.GREEN + 'No regressions found' + Style.RESET_ALL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare benchmark results of a candidate against a baseline')
+    results_store.add_results_store_args(parser)
+    parser.add_argument('--baseline', help='Version or docker image of the baseline', required=True)
+    parser.add_argument('--candidate', help='Version or docker image of the candidate', required=True)
+    parser.add_argument('--threshold', help='Relative change beyond which a regression fails the comparison (default: 0.05)', type=float, default=0.05)
+    parser.add_argument('--alpha', help='Significance level of the tests and confidence intervals (default: 0.05)', type=float, default=0.05)
+    parser.add_argument('--bootstrap-samples', help='Number of bootstrap resamples (default: 1000)', type=int, default=1000)
+    parser.add_argument('--max-samples', help='Latency samples of each run are randomly subsampled to this size (default: 10000)', type=int, default=10000)
+    args = parser.parse_args(argv)
+    if not args.results_hge_url and not args.results_parquet_dir:
+        parser.error('--results-hge-url or --results-parquet-dir is required')
+
+    if args.results_parquet_dir:
+        store = results_store.ParquetResultsStore(args.results_parquet_dir)
+    else:
+        store = results_store.HGEResultsStore(results_store.mk_results_hge(args.results_hge_url, args.results_hge_admin_secret))
+    df = run_compare(
+        store, args.baseline, args.candidate,
+        threshold=args.threshold, alpha=args.alpha,
+        n_boot=args.bootstrap_samples, max_samples=args.max_samples
+    )
+    print_table(df)
+    return 1 if df['regression'].any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Response compression benchmark.
+
+A list query on hge_events, selecting all its columns, is benchmarked with
+limits from 1 to 10k rows, with and without Accept-Encoding: gzip. For
+every limit and encoding, the load is first run at saturation (requests back
+to back), and then at a fixed rate: by default half of the throughput
+without compression at saturation, so that both encodings are compared at the
+same rate. Every run measures the bytes of the response bodies on the wire,
+the CPU time of graphql-engine per request, and the latencies.
+
+aiohttp sends Accept-Encoding: gzip by default, so the encoding is always
+set explicitly, and responses are not decompressed by the load generator.
+"""
+
+import json
+
+import requests
+
+import load_generator
+import workload
+
+default_limits = [1, 10, 100, 1000, 10000]
+
+encodings = ['identity', 'gzip']
+
+schema = 'hge'
+
+table = 'events'
+
+# Fixed rate, as a share of the throughput at saturation without compression
+default_rate_share = 0.5
+
+
+def mk_query(pg):
+    columns = sorted(pg.get_all_columns_of_a_table(table, schema))
+    return '''
+query compression_rows($limit: Int!) {{
+  {schema}_{table}(limit: $limit, order_by: {{id: asc}}) {{
+    {columns}
+  }}
+}}'''.format(schema=schema, table=table, columns='\n    '.join(columns))
+
+
+def encoding_headers(encoding):
+    return {'Accept-Encoding': encoding}
+
+
+def response_sizes(hge, query, limit):
+    """Rows returned, and bytes of the response without and with compression"""
+    body = json.dumps({'query': query, 'variables': {'limit': limit}})
+    sizes = {}
+    for encoding in encodings:
+        resp = requests.post(
+            hge.url + '/v1/graphql', data=body, stream=True,
+            headers={**hge.admin_auth_headers(), **encoding_headers(encoding)}
+        )
+        # The raw stream is not decoded
+        content = resp.raw.read(decode_content=False)
+        assert resp.status_code == 200, content
+        sizes[encoding] = len(content)
+        if encoding == 'identity':
+            out = json.loads(content)
+            assert 'errors' not in out, out
+            rows = len(out['data']['{}_{}'.format(schema, table)])
+    return (rows, sizes)
+
+
+def get_cpu_seconds(hge):
+    stats = hge.get_process_stats()
+    return stats['cpu_seconds'] if stats else None
+
+
+def run(hge, query, limit, encoding, params, duration, rps=None):
+    op = workload.Operation('limit_{}'.format(limit), query, variables={'limit': limit})
+    cpu_before = get_cpu_seconds(hge)
+    (_, _, summary) = load_generator.run_load(
+        hge.url + '/v1/graphql', None, {**hge.admin_auth_headers(), **encoding_headers(encoding)},
+        params['threads'], params['connections'], duration, rps=rps,
+        workload=workload.Workload(op.name, [op]), decompress=False
+    )
+    cpu_after = get_cpu_seconds(hge)
+    requests_count = summary['summary']['requests']
+    latency = summary['operations'][op.name]['latency']
+    return {
+        'limit': limit,
+        'encoding': encoding,
+        'load': 'fixed_rate' if rps else 'saturation',
+        'rps': rps,
+        'duration': duration,
+        'requests': requests_count,
+        'requests_per_sec': requests_count / float(duration),
+        'errors': sum(summary['summary']['errors'].values()),
+        'bytes_per_request': summary['summary']['bytes'] / float(requests_count) if requests_count else None,
+        'cpu_ms_per_request': 1000.0 * (cpu_after - cpu_before) / requests_count
+            if cpu_before is not None and requests_count else None,
+        'latency': {
+            'mean_ms': latency['mean'] / 1000.0,
+            **{'p{}_ms'.format(p): v / 1000.0 for (p, v) in latency['dist'].items()},
+            'max_ms': latency['max'] / 1000.0
+        }
+    }
+
+
+def run_compression_benchmark(hge, pg, limits, params, duration, rps=None):
+    """
+    Yields the measurements of every limit and encoding, at saturation and
+    at a fixed rate (rps, or a share of the throughput without compression)
+    """
+    query = mk_query(pg)
+    hge.graphql_q(query, {'limit': 1})
+    for limit in limits:
+        (rows, sizes) = response_sizes(hge, query, limit)
+        print("Compression benchmark: limit {} ({} rows, {} bytes, {} bytes with gzip)".format(
+            limit, rows, sizes['identity'], sizes['gzip']))
+        results = []
+        for encoding in encodings:
+            print("Compression benchmark: limit {}, {}, saturation for {}s".format(limit, encoding, duration))
+            results.append(run(hge, query, limit, encoding, params, duration))
+        limit_rps = rps or max(1, int(default_rate_share * results[0]['requests_per_sec']))
+        for encoding in encodings:
+            print("Compression benchmark: limit {}, {}, {} req/s for {}s".format(limit, encoding, limit_rps, duration))
+            results.append(run(hge, query, limit, encoding, params, duration, rps=limit_rps))
+        for result in results:
+            result['rows'] = rows
+            result['uncompressed_bytes'] = sizes['identity']
+            result['compressed_bytes'] = sizes['gzip']
+            yield result
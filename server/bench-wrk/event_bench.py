@@ -0,0 +1,217 @@
+"""
+Event trigger delivery benchmark.
+
+Rows are inserted with SQL at a fixed rate in a table having an insert event
+trigger. The webhook of the trigger is a WebhookSink, which records the
+arrival time of every event. The delivery lag of an event is the difference
+between its arrival time and its created_at in the payload (the time at which
+the row was inserted).
+
+Eventing is configured when graphql-engine starts (--events-http-pool-size,
+--events-fetch-interval), so a graphql-engine is launched for every
+configuration, on a database of its own: graphql-engines sharing a database
+would share the delivery of the events. For every configuration, insert
+rates and webhook latencies are varied. Every trial measures the percentiles
+of the delivery lag, and the sustained rate of delivered events.
+"""
+
+import datetime
+import time
+
+import numpy as np
+import psycopg2
+
+from webhook_sink import WebhookSink
+
+database = 'hge_event_bench'
+
+table = 'events_source'
+
+event_trigger_name = 'hge_event_bench'
+
+default_insert_rates = [100, 1000, 5000]
+
+default_webhook_latencies_ms = [0, 50]
+
+# Rows are inserted in batches, every tick
+insert_tick = 0.01
+
+# Time allowed after the inserts for the remaining events to be delivered
+drain_timeout = 60
+
+
+def setup_database(pg):
+    """Create the database of the benchmark and its table. Returns a Postgres for it"""
+    event_pg = pg.create_database(database)
+    with event_pg.cursor() as cursor:
+        cursor.execute('''
+        CREATE TABLE {} (
+          id bigserial primary key,
+          payload text not null
+        );
+        '''.format(table))
+    return event_pg
+
+
+def create_event_trigger(hge, webhook):
+    hge.v1q_if_not_exists({'type': 'track_table', 'args': {'schema': 'public', 'name': table}})
+    hge.v1q({
+        'type': 'create_event_trigger',
+        'args': {
+            'name': event_trigger_name,
+            'table': {'schema': 'public', 'name': table},
+            'webhook': webhook,
+            'insert': {'columns': '*'},
+            'retry_conf': {'num_retries': 0},
+            'replace': True
+        }
+    })
+
+
+def reset(pg):
+    """
+    Empty the source table, and delete the events of the previous trial with
+    their invocation logs, so that undelivered ones are not fetched anymore
+    """
+    pg.delete_trigger_events(event_trigger_name)
+    pg.truncate_tables([table])
+
+
+def get_timezone_offset(pg):
+    """
+    Seconds to subtract from created_at to get a UTC time: created_at is a
+    TIMESTAMP set with NOW(), i.e. in the time zone of the database, which
+    graphql-engine sends as if it was in UTC
+    """
+    with pg.cursor() as cursor:
+        cursor.execute('SELECT extract(epoch from localtimestamp) - extract(epoch from now());')
+        return float(cursor.fetchone()[0])
+
+
+def parse_utc_time(value):
+    """Epoch of a time of a payload, e.g. 2020-06-01T12:34:56.123456Z"""
+    (secs, _, frac) = value.rstrip('Z').partition('.')
+    dt = datetime.datetime.strptime(secs, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp() + (float('0.' + frac) if frac else 0.0)
+
+
+def insert_rows(pg, rate, duration):
+    """
+    Insert rows at `rate` per second for `duration` seconds. Returns the rows
+    inserted, and the time taken
+    """
+    conn = psycopg2.connect(pg.url)
+    conn.autocommit = True
+    inserted = 0
+    try:
+        with conn.cursor() as cursor:
+            start = time.perf_counter()
+            while True:
+                elapsed = time.perf_counter() - start
+                if elapsed >= duration:
+                    break
+                n = int(rate * elapsed) - inserted
+                if n > 0:
+                    cursor.execute(
+                        'INSERT INTO {} (payload) SELECT md5(i::text) FROM generate_series(1, %s) AS i;'.format(table),
+                        (n,)
+                    )
+                    inserted += n
+                time.sleep(max(0, insert_tick - (time.perf_counter() - start - elapsed)))
+            return (inserted, time.perf_counter() - start)
+    finally:
+        conn.close()
+
+
+def count_event_errors(pg):
+    """Events whose delivery failed"""
+    with pg.cursor() as cursor:
+        cursor.execute(
+            'SELECT count(*) FROM hdb_catalog.event_log WHERE trigger_name = %s AND error;',
+            (event_trigger_name,)
+        )
+        return cursor.fetchone()[0]
+
+
+def lag_summary(lags):
+    if not len(lags):
+        return None
+    lags = np.array(lags) * 1000.0
+    return {
+        'mean_ms': float(lags.mean()),
+        'p50_ms': float(np.percentile(lags, 50)),
+        'p90_ms': float(np.percentile(lags, 90)),
+        'p99_ms': float(np.percentile(lags, 99)),
+        'max_ms': float(lags.max())
+    }
+
+
+def deliveries_per_second(arrivals):
+    """Number of events delivered in every second, from the first delivery"""
+    if not arrivals:
+        return []
+    counts = np.bincount((np.array(arrivals) - arrivals[0]).astype(int))
+    return [int(c) for c in counts]
+
+
+def measure_delivery(pg, sink_port, insert_rate, webhook_latency_ms, duration, tz_offset, sink_workers=None):
+    reset(pg)
+    with WebhookSink(sink_port, fields=('created_at',), delay_ms=webhook_latency_ms, workers=sink_workers) as sink:
+        (inserted, insert_seconds) = insert_rows(pg, insert_rate, duration)
+        backlog = inserted - sink.received()
+        drained = sink.wait_for(inserted, drain_timeout)
+        records = sink.stop()
+    arrivals = [r[0] for r in records]
+    lags = [arrival - (parse_utc_time(fields[0]) - tz_offset) for (arrival, fields) in records if fields and fields[0]]
+    per_second = deliveries_per_second(arrivals)
+    delivery_seconds = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else None
+    return {
+        'insert_rate': insert_rate,
+        'webhook_latency_ms': webhook_latency_ms,
+        'duration': duration,
+        'inserted': inserted,
+        'achieved_insert_rate': inserted / insert_seconds,
+        'delivered': len(records),
+        'errors': count_event_errors(pg),
+        'drained': drained,
+        'backlog_after_inserts': backlog,
+        'events_per_sec': len(records) / delivery_seconds if delivery_seconds else None,
+        # Whole seconds only, the last one is partial
+        'peak_events_per_sec': max(per_second[:-1]) if len(per_second) > 1 else None,
+        'lag': lag_summary(lags),
+        'deliveries_per_sec': per_second
+    }
+
+
+def run_event_benchmark(pg, mk_hge, sink_port, hge_confs, insert_rates, webhook_latencies_ms, duration, sink_workers=None):
+    """
+    For every (http pool size, fetch interval) of hge_confs, launch the
+    graphql-engine made by mk_hge(event_pg, extra_args), and yield the
+    measurements of every insert rate and webhook latency
+    """
+    webhook = 'http://127.0.0.1:{}/'.format(sink_port)
+    try:
+        for (pool_size, fetch_interval) in hge_confs:
+            extra_args = []
+            if pool_size:
+                extra_args += ['--events-http-pool-size', str(pool_size)]
+            if fetch_interval:
+                extra_args += ['--events-fetch-interval', str(fetch_interval)]
+            event_pg = setup_database(pg)
+            tz_offset = get_timezone_offset(event_pg)
+            hge = mk_hge(event_pg, extra_args)
+            hge.run()
+            try:
+                create_event_trigger(hge, webhook)
+                for latency in webhook_latencies_ms:
+                    for rate in insert_rates:
+                        print("Event benchmark: http pool size {}, fetch interval {}ms, {} inserts/s, webhook latency {}ms".format(
+                            pool_size or 'default', fetch_interval or 'default', rate, latency))
+                        result = measure_delivery(event_pg, sink_port, rate, latency, duration, tz_offset, sink_workers)
+                        result['http_pool_size'] = pool_size
+                        result['fetch_interval_ms'] = fetch_interval
+                        yield result
+            finally:
+                hge.teardown()
+    finally:
+        pg.drop_database(database)
@@ -1,11 +1,33 @@
 from sportsdb_setup import HGETestSetup, HGETestSetupArgs
-from run_hge import HGE
+import load_generator
+import latency_store
+import subscriptions_bench
+import startup_bench
+import metadata_bench
+import remote_join_bench
+import plan_cache_bench
+import mutation_bench
+import event_bench
+import scheduled_bench
+import auth_bench
+import compression_bench
+import scaling_bench
+import soak_bench
+import query_gen
+import results_store
+import saturation_search
+import compare
+import workload
+import telemetry
+import sql_cost
 import graphql
 import multiprocessing
 import json
 import os
+import random
+import itertools
+import sys
 import docker
-import ruamel.yaml as yaml
 import cpuinfo
 import subprocess
 import threading
@@ -36,14 +58,53 @@ class HGEWrkBench(HGETestSetup):
 
     rps_steps = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
 
+    load_generators = ['wrk', 'python']
+
+    # Metrics compared by the A/B mode
+    ab_metrics = ['p50_ms', 'p99_ms', 'mean_ms', 'throughput']
+
     def __init__(
             self, pg_url, remote_pg_url, pg_docker_image, hge_url=None,
             remote_hge_url=None, hge_docker_image=None,
             hge_args=[], skip_stack_build=False,
             graphql_queries_file='queries.graphql', connections=50,
-            duration=300, results_hge_url = None, results_hge_admin_secret = None
+            duration=300, results_hge_url = None, results_hge_admin_secret = None,
+            load_generator = 'wrk', subscriptions = None, subscriptions_per_connection = 1,
+            subscription_rows = 100, mutation_rate = 10, adaptive_rps = False,
+            slo_p99_ms = 100, slo_error_rate = 0.01, latency_probes = 5,
+            search_trial_duration = 10, latency_sample_size = latency_store.default_reservoir_size,
+            keep_raw_latencies = False, workload_file = None, telemetry_interval = 1,
+            ab_hge_docker_image = None, ab_hge_executable = None, ab_trials = 6,
+            ab_trial_duration = 10, scale_factor = 1, snapshot_dir = None,
+            startup_schema_copies = None, startup_trials = 3,
+            metadata_tables = None, metadata_roles = [1], metadata_one_by_one = True,
+            remote_join_fan_outs = None, remote_join_requests = 100,
+            plan_cache_kinds = None, plan_cache_working_sets = None,
+            plan_cache_requests = 1000, plan_cache_duration = 10,
+            results_parquet_dir = None, results_batch_size = None,
+            mutation_cases = None, mutation_batch_sizes = mutation_bench.default_batch_sizes,
+            mutation_rows = 20000, mutation_concurrency = 8, mutation_event_triggers = True,
+            event_rates = None, event_http_pool_sizes = [None], event_fetch_intervals = [None],
+            event_webhook_latencies = event_bench.default_webhook_latencies_ms, event_duration = 30,
+            event_sink_workers = None, scheduled_events = None, scheduled_cron_triggers = [0],
+            scheduled_webhook_latency = 0, scheduled_tolerance = None, scheduled_lead_time = 90,
+            scheduled_cron_minutes = 1, auth_modes = None, auth_token_pool_size = 1000,
+            auth_webhook_latency = 0, auth_webhook_cache_max_age = None, auth_duration = 30,
+            compression_limits = None, compression_duration = 30, compression_rps = None,
+            scaling_connections = None, scaling_hge_cores = scaling_bench.default_capabilities,
+            scaling_pg_connections = [None], scaling_duration = 30,
+            soak_duration = None, soak_rps = None, soak_interval = soak_bench.default_interval,
+            soak_window = soak_bench.default_window, soak_warmup = soak_bench.default_warmup,
+            soak_dump_interval = soak_bench.default_dump_interval,
+            generate_queries = None, generate_max_depth = query_gen.default_max_depth,
+            generate_max_breadth = query_gen.default_max_breadth, generate_fan_outs = query_gen.default_fan_outs,
+            generate_root_limit = query_gen.default_root_limit
     ):
         self.load_queries(graphql_queries_file)
+        self.workload = workload.load_workload(workload_file) if workload_file else None
+        if subscriptions:
+            # For the per poller statistics
+            hge_args = subscriptions_bench.with_poller_logs(hge_args)
         super().__init__(
             pg_url = pg_url,
             remote_pg_url = remote_pg_url,
@@ -52,12 +113,98 @@ class HGEWrkBench(HGETestSetup):
             remote_hge_url = remote_hge_url,
             hge_docker_image = hge_docker_image,
             hge_args = hge_args,
-            skip_stack_build = skip_stack_build
+            skip_stack_build = skip_stack_build,
+            ab_hge_docker_image = ab_hge_docker_image,
+            ab_hge_executable = ab_hge_executable,
+            scale_factor = scale_factor,
+            snapshot_dir = snapshot_dir
         )
         self.connections = connections
         self.duration = duration
+        self.load_generator = load_generator
+        self.subscriptions = subscriptions
+        self.subscriptions_per_connection = subscriptions_per_connection
+        self.subscription_rows = subscription_rows
+        self.mutation_rate = mutation_rate
+        self.adaptive_rps = adaptive_rps
+        self.slo = saturation_search.SLO(float(slo_p99_ms), float(slo_error_rate))
+        self.latency_probes = int(latency_probes)
+        self.search_trial_duration = int(search_trial_duration)
+        self.latency_sample_size = int(latency_sample_size)
+        self.keep_raw_latencies = keep_raw_latencies
+        self.telemetry_interval = float(telemetry_interval)
+        self.ab_trials = int(ab_trials)
+        self.ab_trial_duration = int(ab_trial_duration)
+        # Startup benchmark: numbers of copies of the sportsdb schema in the metadata
+        self.startup_schema_copies = startup_schema_copies
+        self.startup_trials = int(startup_trials)
+        # Metadata benchmark: numbers of synthetic tables and roles
+        self.metadata_tables = metadata_tables
+        self.metadata_roles = metadata_roles
+        self.metadata_one_by_one = metadata_one_by_one
+        # Remote join benchmark: numbers of parent rows of the queries
+        self.remote_join_fan_outs = remote_join_fan_outs
+        self.remote_join_requests = int(remote_join_requests)
+        # Plan cache benchmark: kinds of query shapes, and working set sizes
+        self.plan_cache_kinds = plan_cache_kinds
+        self.plan_cache_working_sets = plan_cache_working_sets
+        self.plan_cache_requests = int(plan_cache_requests)
+        self.plan_cache_duration = int(plan_cache_duration)
+        # Mutation benchmark: cases, batch sizes of inserts, and rows per case
+        self.mutation_cases = mutation_cases
+        self.mutation_batch_sizes = mutation_batch_sizes
+        self.mutation_rows = int(mutation_rows)
+        self.mutation_concurrency = int(mutation_concurrency)
+        self.mutation_event_triggers = mutation_event_triggers
+        # Event trigger benchmark: insert rates, and eventing configurations of graphql-engine
+        self.event_rates = event_rates
+        self.event_http_pool_sizes = event_http_pool_sizes
+        self.event_fetch_intervals = event_fetch_intervals
+        self.event_webhook_latencies = event_webhook_latencies
+        self.event_duration = int(event_duration)
+        self.event_sink_workers = int(event_sink_workers) if event_sink_workers is not None else None
+        # Scheduled trigger benchmark: numbers of one-off events due at once, and of cron triggers
+        self.scheduled_events = scheduled_events
+        self.scheduled_cron_triggers = scheduled_cron_triggers
+        self.scheduled_webhook_latency = float(scheduled_webhook_latency)
+        self.scheduled_tolerance = int(scheduled_tolerance) if scheduled_tolerance is not None else None
+        self.scheduled_lead_time = int(scheduled_lead_time)
+        self.scheduled_cron_minutes = int(scheduled_cron_minutes)
+        # Auth benchmark: modes of authentication, and configuration of the JWTs and the webhook
+        self.auth_modes = auth_modes
+        self.auth_token_pool_size = int(auth_token_pool_size)
+        self.auth_webhook_latency = float(auth_webhook_latency)
+        self.auth_webhook_cache_max_age = auth_webhook_cache_max_age
+        self.auth_duration = int(auth_duration)
+        # Compression benchmark: limits of the list query
+        self.compression_limits = compression_limits
+        self.compression_duration = int(compression_duration)
+        self.compression_rps = int(compression_rps) if compression_rps is not None else None
+        # Scalability benchmark: client connections, capabilities and pool sizes of graphql-engine
+        self.scaling_connections = scaling_connections
+        self.scaling_hge_cores = scaling_hge_cores
+        self.scaling_pg_connections = scaling_pg_connections
+        self.scaling_duration = int(scaling_duration)
+        # Soak benchmark: duration of the run, and its intervals, sliding windows and warm-up in seconds
+        self.soak_duration = int(soak_duration) if soak_duration is not None else None
+        self.soak_rps = int(soak_rps) if soak_rps is not None else None
+        self.soak_interval = int(soak_interval)
+        self.soak_window = int(soak_window)
+        self.soak_warmup = int(soak_warmup)
+        self.soak_dump_interval = int(soak_dump_interval)
+        # Families of queries generated from the relationships, replacing those of the queries file
+        self.generate_queries = generate_queries
+        self.generate_max_depth = int(generate_max_depth)
+        self.generate_max_breadth = int(generate_max_breadth)
+        self.generate_fan_outs = generate_fan_outs
+        self.generate_root_limit = int(generate_root_limit)
+        # Set once Postgres is up
+        self.pg_stat_statements = False
         self.results_hge_url = results_hge_url
         self.results_hge_admin_secret = results_hge_admin_secret
+        # Results are stored in Parquet files instead of the results HGE, if given
+        self.results_parquet_dir = results_parquet_dir
+        self.results_batch_size = results_batch_size
         self.extract_cpu_info()
         # NOTE: we generally want to do this just once; otherwise if we happen
         # to be editing the tree while this script is running the shasum will
@@ -68,18 +215,43 @@ class HGEWrkBench(HGETestSetup):
         self.graphql_queries_file = graphql_queries_file
         with open(self.graphql_queries_file) as f:
             queries = f.read()
+        # Shapes of the queries, if given in '# tags:' comments (see query_gen.py)
+        self.query_tags = query_gen.parse_tags(queries)
         self.query_names = []
         self.queries = []
         for oper in graphql.parse(queries).definitions:
             self.query_names.append(oper.name.value)
             self.queries.append(oper)
 
+    def query_name(self, query):
+        """Name of a query, or of a mixed workload"""
+        if isinstance(query, workload.Workload):
+            return query.name
+        return query.name.value
+
+    def query_text(self, query):
+        if isinstance(query, workload.Workload):
+            return query.text
+        return graphql.print_ast(query)
+
+    def test_query(self, query, hge=None):
+        """Run the query (every operation of a mixed workload) once, to check for errors"""
+        hge = hge or self.hge
+        if isinstance(query, workload.Workload):
+            rng = random.Random(query.seed)
+            for op in query.operations:
+                hge.graphql_q(op.query, op.sample_variables(rng), headers=op.headers)
+        else:
+            hge.graphql_q(graphql.print_ast(query))
+
     def get_wrk2_params(self):
         cpu_count = multiprocessing.cpu_count()
         return {
-            'threads': cpu_count,
-            'connections': self.connections,
-            'duration': self.duration
+            # The load generator is pinned to load_cpus in A/B mode
+            'threads': len(self.load_cpus) if self.load_cpus else cpu_count,
+            'connections': int(self.connections),
+            'duration': int(self.duration),
+            'load_generator': self.load_generator
         }
 
     def get_current_user(self):
@@ -96,16 +268,198 @@ class HGEWrkBench(HGETestSetup):
                     for (f, f_key) in files:
                         s3_client.upload_file(f, bucket, os.path.join(key, f_key))
 
-        query_str = graphql.print_ast(query)
+        query_str = self.query_text(query)
         params = self.get_wrk2_params()
         print(Fore.GREEN + "Running benchmark wrk2 for at {} req/s (duration: {}) for query\n".format(rps, params['duration']), query_str +  Style.RESET_ALL)
-        bench_script = os.path.join(self.lua_dir, 'bench-wrk2.lua')
         graphql_url = self.hge.url + '/v1/graphql'
         timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
         results_dir = self.results_root_dir
         tests_path = [str(rps), timestamp]
         results_dir = os.path.join(results_dir, *tests_path)
         os.makedirs(results_dir, exist_ok=True)
+        if self.pg_stat_statements:
+            # Explain before the reset, so that the EXPLAIN statements are not counted
+            operation_sqls = self.explain_operations(query)
+            self.pg.reset_pg_stat_statements()
+        with self.telemetry_sampler() as sampler:
+            result = self.run_wrk2(graphql_url, query, rps, params, results_dir)
+        latency_files = self.store_latencies(results_dir)
+        histogram_file = os.path.join(results_dir, 'latencies.hgrm')
+        histogram = self.get_latency_histogram(result, histogram_file)
+
+        summary_file = os.path.join(results_dir, 'summary.json')
+        with open(summary_file) as f:
+            summary = json.load(f)
+        if 'operations' in summary:
+            self.print_operations_summary(summary['operations'])
+        sql_costs = None
+        if self.pg_stat_statements:
+            sql_costs = sql_cost.attribute(
+                operation_sqls, self.pg.get_pg_stat_statements(), self.get_operation_stats(query, summary)
+            )
+            self.print_sql_costs(sql_costs)
+        latencies_file = os.path.join(results_dir, latency_store.HISTOGRAM_FILE)
+
+        def extract_data(v):
+            return v['data'] if isinstance(v, dict) and 'data' in v else v
+        tests_info = { k:extract_data(v) for (k, v) in self.gen_test_info(query, rps).items() }
+        tests_setup_file = os.path.join(results_dir, 'test_setup.json')
+        with open(tests_setup_file, 'w') as f:
+            f.write(json.dumps(tests_info, indent=2))
+
+        upload_files([
+            (x, os.path.join(*tests_path,y))
+            for (x,y) in [
+                    (summary_file, 'summary.json'),
+                    (histogram_file, 'latencies.hgrm'),
+                    (tests_setup_file, 'test_setup.json')
+            ] + [
+                (f, os.path.basename(f)) for f in latency_files
+            ]
+        ])
+        if self.upload_root_uri:
+            latencies_uri = uri_path_join(self.upload_root_uri, *tests_path, latency_store.HISTOGRAM_FILE)
+        else:
+            latencies_uri = pathlib.Path(latencies_file).as_uri()
+        self.insert_result(query, rps, summary, histogram, latencies_uri, sampler.samples, sql_costs)
+        return (summary, histogram)
+
+    def explain_operations(self, query):
+        """The SQL generated for every operation of the query"""
+        if isinstance(query, workload.Workload):
+            rng = random.Random(query.seed)
+            return {
+                op.name: self.hge.explain_sql(op.query, op.sample_variables(rng), op.headers)
+                for op in query.operations
+            }
+        return {self.query_name(query): self.hge.explain_sql(graphql.print_ast(query))}
+
+    def get_operation_stats(self, query, summary):
+        """Number of requests and mean latency (in ms) of every operation of the query"""
+        if isinstance(query, workload.Workload):
+            operations = summary.get('operations', {})
+            return {
+                op.name: (operations[op.name]['requests'], operations[op.name]['latency']['mean'] / 1000.0)
+                if op.name in operations else (0, None)
+                for op in query.operations
+            }
+        return {self.query_name(query): (summary['summary']['requests'], summary['latency']['mean'] / 1000.0)}
+
+    def print_sql_costs(self, sql_costs):
+        print(Fore.CYAN + "{:<30} {:>12} {:>14} {:>14} {:>10}".format('operation', 'SQL calls', 'Postgres (ms)', 'HGE (ms)', 'Postgres %') + Style.RESET_ALL)
+        for (op, v) in sorted(sql_costs['operations'].items()):
+            if 'postgres_ms_per_request' not in v:
+                continue
+            print(Fore.CYAN + "{:<30} {:>12} {:>14.3f} {:>14.3f} {:>10.1f}".format(
+                op, v['calls'], v['postgres_ms_per_request'], v['hge_ms_per_request'], 100 * v['postgres_share']
+            ) + Style.RESET_ALL)
+
+    def telemetry_sampler(self):
+        return telemetry.TelemetrySampler(self.hge, self.pg, self.telemetry_interval)
+
+    def set_telemetry(self, insert_var, samples):
+        insert_var['resource_usage'] = telemetry.summarise(samples)
+        insert_var['telemetry'] = {
+            'data': telemetry.as_rows(samples)
+        }
+
+    def run_wrk2(self, graphql_url, query, rps, params, results_dir):
+        if isinstance(query, workload.Workload):
+            return load_generator.run_wrk2(
+                graphql_url, None, self.hge.admin_auth_headers(), rps,
+                params['threads'], params['connections'], params['duration'],
+                results_dir, reservoir_size=self.latency_sample_size, workload=query,
+                cpus=self.load_cpus
+            )
+        query_str = graphql.print_ast(query)
+        if self.load_generator == 'python':
+            return load_generator.run_wrk2(
+                graphql_url, query_str, self.hge.admin_auth_headers(), rps,
+                params['threads'], params['connections'], params['duration'],
+                results_dir, reservoir_size=self.latency_sample_size, cpus=self.load_cpus
+            )
+        else:
+            return self.run_wrk2_docker(graphql_url, query_str, rps, params, results_dir)
+
+    def print_operations_summary(self, operations):
+        print(Fore.CYAN + "{:<30} {:>10} {:>8} {:>10} {:>10} {:>10}".format('operation', 'requests', 'errors', 'p50 (ms)', 'p99 (ms)', 'max (ms)') + Style.RESET_ALL)
+        for (op, v) in sorted(operations.items()):
+            print(Fore.CYAN + "{:<30} {:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                op, v['requests'], v['errors'],
+                v['latency']['dist']['50'] / 1000.0,
+                v['latency']['dist']['99'] / 1000.0,
+                v['latency']['max'] / 1000.0
+            ) + Style.RESET_ALL)
+
+    def store_latencies(self, results_dir):
+        """
+        Store the latencies of a wrk2 run as a histogram plus a sample, and
+        return the paths of the latency files
+        """
+        if os.path.exists(os.path.join(results_dir, latency_store.RAW_FILE)):
+            # Written by the wrk2 Lua script
+            return latency_store.compact_raw_latencies(
+                results_dir, self.latency_sample_size, keep_raw=self.keep_raw_latencies
+            )
+        files = [os.path.join(results_dir, latency_store.HISTOGRAM_FILE)]
+        if self.latency_sample_size:
+            files.append(os.path.join(results_dir, latency_store.SAMPLE_FILE))
+        return files
+
+    def short_trial(self, query, rps, duration, trial_dir, hge=None):
+        """
+        Run a short wrk2 trial at the given rate, against hge (by default the
+        graphql-engine under test). The results are not stored
+        """
+        hge = hge or self.hge
+        params = self.get_wrk2_params()
+        params['duration'] = duration
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        results_dir = os.path.join(self.results_root_dir, trial_dir, str(rps), timestamp)
+        os.makedirs(results_dir, exist_ok=True)
+        result = self.run_wrk2(hge.url + '/v1/graphql', query, rps, params, results_dir)
+        self.store_latencies(results_dir)
+        histogram = self.get_latency_histogram(result, os.path.join(results_dir, 'latencies.hgrm'))
+        with open(os.path.join(results_dir, 'summary.json')) as f:
+            summary = json.load(f)
+
+        def percentile(p):
+            return next((h['latency'] for h in histogram if h['percentile'] >= p), float('inf'))
+        errors = summary['summary']['errors']
+        # wrk counts the responses with a non 2xx status among the requests,
+        # the other errors are requests which got no response
+        no_response = sum(v for (k, v) in errors.items() if k != 'status')
+        return {
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'mean_ms': summary['latency']['mean'] / 1000.0,
+            'error_rate': sum(errors.values()) / float(max(1, summary['summary']['requests'] + no_response)),
+            'throughput': summary['summary']['requests'] / (summary['summary']['duration'] / 1000000.0)
+        }
+
+    def saturation_trial(self, query, rps):
+        """Run a short wrk2 trial at the given rate, for the saturation search"""
+        return self.short_trial(query, rps, self.search_trial_duration, 'saturation_search')
+
+    def adaptive_rps_test(self, query):
+        """
+        Find the knee of the query using SaturationSearch, and return the rates
+        at which latencies should be measured
+        """
+        query_str = self.query_text(query)
+        print(Fore.GREEN + "(Saturation search) Running wrk2 trials for query\n", query_str + Style.RESET_ALL)
+        self.test_query(query) # Test query once for errors
+        search = saturation_search.SaturationSearch(lambda rps: self.saturation_trial(query, rps), self.slo)
+        knee = search.run()
+        probes = saturation_search.latency_probes(knee, self.latency_probes)
+        search_info = search.to_json()
+        search_info['latency_probes'] = probes
+        self.insert_max_rps_result(query, knee, search_info)
+        print("Knee", knee, "req/s. Latency probes", probes)
+        return probes
+
+    def run_wrk2_docker(self, graphql_url, query_str, rps, params, results_dir):
+        bench_script = os.path.join(self.lua_dir, 'bench-wrk2.lua')
         wrk2_command = [
             'wrk2',
             '-R', str(rps),
@@ -124,7 +478,7 @@ class HGEWrkBench(HGETestSetup):
             'mode': 'rw'
         }
         self.docker_client = docker.from_env()
-        result = self.docker_client.containers.run(
+        return self.docker_client.containers.run(
             self.wrk_docker_image,
             detach = False,
             stdout = True,
@@ -134,38 +488,14 @@ class HGEWrkBench(HGETestSetup):
             environment = self.get_lua_env(),
             volumes = volumes,
             remove = True,
-            user = self.get_current_user()
+            user = self.get_current_user(),
+            cpuset_cpus = self.get_load_cpuset()
         ).decode('ascii')
-        histogram_file = os.path.join(results_dir, 'latencies.hgrm')
-        histogram = self.get_latency_histogram(result, histogram_file)
-
-        summary_file = os.path.join(results_dir, 'summary.json')
-        with open(summary_file) as f:
-            summary = json.load(f)
-        latencies_file = os.path.join(results_dir, 'latencies')
-
-        def extract_data(v):
-            return v['data'] if isinstance(v, dict) and 'data' in v else v
-        tests_info = { k:extract_data(v) for (k, v) in self.gen_test_info(query, rps).items() }
-        tests_setup_file = os.path.join(results_dir, 'test_setup.json')
-        with open(tests_setup_file, 'w') as f:
-            f.write(json.dumps(tests_info, indent=2))
 
-        upload_files([
-            (x, os.path.join(*tests_path,y))
-            for (x,y) in [
-                    (summary_file, 'summary.json'),
-                    (latencies_file, 'latencies'),
-                    (histogram_file, 'latencies.hgrm'),
-                    (tests_setup_file, 'test_setup.json')
-            ]
-        ])
-        if self.upload_root_uri:
-            latencies_uri = uri_path_join(self.upload_root_uri, *tests_path, 'latencies')
-        else:
-            latencies_uri = pathlib.Path(latencies_file).as_uri()
-        self.insert_result(query, rps, summary, histogram, latencies_uri)
-        return (summary, histogram)
+    def get_load_cpuset(self):
+        if self.load_cpus:
+            return ','.join(str(c) for c in self.load_cpus)
+        return None
 
     def get_latency_histogram(self, result, write_histogram_file):
         const_true = lambda l : True
@@ -234,13 +564,34 @@ class HGEWrkBench(HGETestSetup):
         }
 
     def max_rps_test(self, query):
-        query_str = graphql.print_ast(query)
+        query_str = self.query_text(query)
         print(Fore.GREEN + "(Compute maximum Request per second) Running wrk benchmark for query\n", query_str + Style.RESET_ALL)
-        self.hge.graphql_q(query_str) # Test query once for errors
-        bench_script = os.path.join(self.lua_dir + '/bench-wrk.lua')
+        self.test_query(query) # Test query once for errors
         graphql_url = self.hge.url + '/v1/graphql'
         params = self.get_wrk2_params()
         duration = 30
+        with self.telemetry_sampler() as sampler:
+            if isinstance(query, workload.Workload):
+                result = load_generator.run_wrk(
+                    graphql_url, None, self.hge.admin_auth_headers(),
+                    params['threads'], params['connections'], duration, workload=query, cpus=self.load_cpus
+                )
+            elif self.load_generator == 'python':
+                result = load_generator.run_wrk(
+                    graphql_url, query_str, self.hge.admin_auth_headers(),
+                    params['threads'], params['connections'], duration, cpus=self.load_cpus
+                )
+            else:
+                result = json.loads(self.run_wrk_docker(graphql_url, query_str, params, duration))
+        summary = result['summary']
+        # TODO explain this calculation. Why aren't we using wrk's reported 'max'? Should we call this avg_sustained_rps or something?
+        max_rps = round(summary['requests']/float(duration))
+        self.insert_max_rps_result(query, max_rps, samples=sampler.samples)
+        print("Max RPS", max_rps)
+        return max_rps
+
+    def run_wrk_docker(self, graphql_url, query_str, params, duration):
+        bench_script = os.path.join(self.lua_dir + '/bench-wrk.lua')
         wrk_command = [
             'wrk',
             '-t', str(params['threads']),
@@ -252,8 +603,7 @@ class HGEWrkBench(HGETestSetup):
             query_str
         ]
         self.docker_client = docker.from_env()
-
-        result = self.docker_client.containers.run(
+        return self.docker_client.containers.run(
             self.wrk_docker_image,
             detach = False,
             stdout = False,
@@ -263,14 +613,9 @@ class HGEWrkBench(HGETestSetup):
             environment = self.get_lua_env(),
             volumes = self.get_scripts_vol(),
             remove = True,
-            user = self.get_current_user()
+            user = self.get_current_user(),
+            cpuset_cpus = self.get_load_cpuset()
         )
-        summary = json.loads(result)['summary']
-        # TODO explain this calculation. Why aren't we using wrk's reported 'max'? Should we call this avg_sustained_rps or something?
-        max_rps = round(summary['requests']/float(duration))
-        self.insert_max_rps_result(query, max_rps)
-        print("Max RPS", max_rps)
-        return max_rps
 
     def get_version(self):
         script = os.path.join(fileLoc, 'gen-version.sh')
@@ -287,29 +632,7 @@ class HGEWrkBench(HGETestSetup):
                 del self.cpu_info[k]
 
     def get_results(self):
-        query = '''
-query results {
-  latency: hge_bench_latest_results {
-    query_name
-    requests_per_sec
-    docker_image
-    version
-    latencies_uri
-    latency_histogram {
-      percentile
-      latency
-    }
-  }
-  max_rps: hge_bench_avg_query_max_rps {
-    query_name
-    docker_image
-    version
-    max_rps
-  }
-}
-        '''
-        output = self.results_hge.graphql_q(query)
-        return output['data']
+        return self.results_store.get_results()
 
     def set_cpu_info(self, insert_var):
         cpu_key = self.cpu_info['brand'] + ' vCPUs: ' + str(self.cpu_info['count'])
@@ -328,14 +651,18 @@ query results {
     def set_query_info(self, insert_var, query):
         insert_var["query"] = {
             "data": {
-                "name" : query.name.value,
-                "query" : graphql.print_ast(query)
+                "name" : self.query_name(query),
+                "query" : self.query_text(query)
             },
             "on_conflict" : {
                 "constraint": "gql_query_query_key",
                 "update_columns": "query"
             }
         }
+        tags = self.query_tags.get(self.query_name(query))
+        if tags:
+            insert_var["query"]["data"]["tags"] = tags
+            insert_var["query"]["on_conflict"]["update_columns"] = ["query", "tags"]
 
     #TODO add executable shasum also
     def set_version_info(self, insert_var):
@@ -346,6 +673,7 @@ query results {
             insert_var["server_shasum"] = self.server_shasum
 
         insert_var['postgres_version'] = self.pg.get_server_version()
+        insert_var['scale_factor'] = self.scale_factor
         if self.scenario_name:
             insert_var['scenario_name'] = self.scenario_name
 
@@ -360,7 +688,26 @@ query results {
             'args': args
         }
 
-    def gen_max_rps_insert_var(self, query, max_rps):
+    def insert_bench_result(self, table, result, keys, query=None, **extra):
+        """
+        Insert the keys of result, and the extra columns, into the table,
+        along with the cpu, version and graphql-engine configuration
+        """
+        insert_var = dict()
+        self.set_cpu_info(insert_var)
+        self.set_version_info(insert_var)
+        self.set_hge_args_env_vars(insert_var)
+        for k in keys:
+            insert_var[k] = result[k]
+        insert_var.update(extra)
+        if query is not None:
+            self.set_query_info(insert_var, query)
+        self.results_store.insert(table, insert_var)
+
+    def result_query(self, result):
+        return self.queries[self.query_names.index(result['query_name'])]
+
+    def gen_max_rps_insert_var(self, query, max_rps, search_info=None, samples=None):
         insert_var = dict()
         self.set_cpu_info(insert_var)
         self.set_query_info(insert_var, query)
@@ -368,6 +715,13 @@ query results {
         self.set_hge_args_env_vars(insert_var)
         insert_var['max_rps'] = max_rps
         insert_var['wrk_parameters'] = self.get_wrk2_params()
+        if search_info:
+            insert_var['wrk_parameters']['duration'] = self.search_trial_duration
+            insert_var['slo'] = search_info['slo']
+            insert_var['latency_probes'] = search_info['latency_probes']
+            insert_var['saturation_search'] = search_info
+        if samples:
+            self.set_telemetry(insert_var, samples)
         return insert_var
 
     def plot_results(self):
@@ -388,88 +742,643 @@ query results {
         test_info['wrk2_parameters'] = self.get_wrk2_params()
         return test_info
 
-    def gen_result_insert_var(self, query, rps, summary, latency_histogram, latencies_uri):
+    def gen_result_insert_var(self, query, rps, summary, latency_histogram, latencies_uri, samples=None, sql_costs=None):
         insert_var = self.gen_test_info(query, rps)
         insert_var["summary"] = summary
         insert_var['latency_histogram'] = {
             'data' : latency_histogram
         }
         insert_var['latencies_uri'] = latencies_uri
+        if samples:
+            self.set_telemetry(insert_var, samples)
+        if sql_costs:
+            insert_var['sql_cost'] = sql_costs
         return insert_var
 
-    def insert_result(self, query, rps, summary, latency_histogram, latencies_uri):
-        result_var = self.gen_result_insert_var(query, rps, summary, latency_histogram, latencies_uri)
-        insert_query = """
-mutation insertResult($result: hge_bench_results_insert_input!) {
-  insert_hge_bench_results(objects: [$result]){
-    affected_rows
-  }
-}"""
-        variables = {'result': result_var}
-        self.results_hge.graphql_q(insert_query, variables)
-
-    def insert_max_rps_result(self, query, max_rps):
-        result_var = self.gen_max_rps_insert_var(query, max_rps)
-        insert_query = """
-mutation insertMaxRps($result: hge_bench_query_max_rps_insert_input!) {
-  insert_hge_bench_query_max_rps(objects: [$result]){
-    affected_rows
-  }
-}"""
-        variables = {'result': result_var}
-        self.results_hge.graphql_q(insert_query, variables)
-
-    def setup_results_schema(self):
-        if not self.results_hge_url:
-            self.results_hge_url = self.hge.url
-            self.results_hge_admin_secret = self.hge.admin_secret()
-        if self.results_hge_admin_secret:
-            results_hge_args = ['--admin-secret', self.results_hge_admin_secret]
+    def insert_result(self, query, rps, summary, latency_histogram, latencies_uri, samples=None, sql_costs=None):
+        result_var = self.gen_result_insert_var(query, rps, summary, latency_histogram, latencies_uri, samples, sql_costs)
+        self.results_store.insert('results', result_var)
+
+    def insert_max_rps_result(self, query, max_rps, search_info=None, samples=None):
+        result_var = self.gen_max_rps_insert_var(query, max_rps, search_info, samples)
+        self.results_store.insert('query_max_rps', result_var)
+
+    def setup_results_store(self):
+        if self.results_parquet_dir:
+            self.results_store = results_store.ParquetResultsStore(self.results_parquet_dir, self.results_batch_size or 50)
         else:
-            results_hge_args = []
-        self.results_hge = HGE(None, None, args=results_hge_args, log_file=None, url=self.results_hge_url)
-        results_table = {
-            'name' : 'results',
-            'schema': 'hge_bench'
-        }
-        if results_table in self.results_hge.get_all_tracked_tables():
-            return
-        schema_file = os.path.join(fileLoc, 'results_schema.yaml')
-        with open(schema_file) as f:
-            queries = yaml.safe_load(f)
-        self.results_hge.run_bulk(queries)
+            if not self.results_hge_url:
+                self.results_hge_url = self.hge.url
+                self.results_hge_admin_secret = self.hge.admin_secret()
+            self.results_hge = results_store.mk_results_hge(self.results_hge_url, self.results_hge_admin_secret)
+            self.results_store = results_store.HGEResultsStore(self.results_hge, self.results_batch_size or 1)
+        self.results_store.setup()
 
 
-    def run_query_benchmarks(self):
-        def get_results_root_dir(query):
-            if self.hge_docker_image:
-                ver_info = 'docker-tag-' + self.hge_docker_image.split(':')[1]
-            else:
-                ver_info = self.get_version()
-            query_name = query.name.value
-            # Store versioned runs under e.g. test_output/benchmark_runs/<hge_version>/
-            results_root_dir = os.path.abspath(os.path.join(self.work_dir, 'benchmark_runs'))
-            return os.path.join(results_root_dir, ver_info, query_name)
+    def get_results_root_dir(self, bench_name):
+        if self.hge_docker_image:
+            ver_info = 'docker-tag-' + self.hge_docker_image.split(':')[1]
+        else:
+            ver_info = self.get_version()
+        # Store versioned runs under e.g. test_output/benchmark_runs/<hge_version>/
+        results_root_dir = os.path.abspath(os.path.join(self.work_dir, 'benchmark_runs'))
+        return os.path.join(results_root_dir, ver_info, bench_name)
 
-        for query in self.queries:
+    def new_results_dir(self, bench_name, *path):
+        """A new directory, named after the current time, for the output of a run of a benchmark"""
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        results_dir = os.path.join(self.get_results_root_dir(bench_name), *path, timestamp)
+        os.makedirs(results_dir, exist_ok=True)
+        return results_dir
+
+    def write_json(self, results_dir, file_name, value):
+        with open(os.path.join(results_dir, file_name), 'w') as f:
+            f.write(json.dumps(value, indent=2))
+
+    def run_query_benchmarks(self):
+        # A mixed workload is benchmarked as a whole, instead of every query in isolation
+        queries = [self.workload] if self.workload else self.queries
+        for query in queries:
             try:
-                self.results_root_dir = get_results_root_dir(query)
-                max_rps = self.max_rps_test(query)
-                # The tests should definitely not be running very close to or higher than maximum requests per second
-                rps_steps = [ r for r in self.rps_steps if r < 0.6*max_rps]
+                self.results_root_dir = self.get_results_root_dir(self.query_name(query))
+                if self.adaptive_rps:
+                    rps_steps = self.adaptive_rps_test(query)
+                else:
+                    max_rps = self.max_rps_test(query)
+                    # The tests should definitely not be running very close to or higher than maximum requests per second
+                    rps_steps = [ r for r in self.rps_steps if r < int(0.6*max_rps)]
                 print("Benchmarking queries with wrk2 for the following requests/sec", rps_steps)
                 for rps in rps_steps:
-                    if rps < int(0.6*max_rps):
-                        self.wrk2_test(query, rps)
+                    self.wrk2_test(query, rps)
             except Exception:
-                print(Fore.RED + "Benchmarking Graphql Query '" + query.name.value + "' failed" + Style.RESET_ALL)
+                print(Fore.RED + "Benchmarking Graphql Query '" + self.query_name(query) + "' failed" + Style.RESET_ALL)
                 raise
 
+    def run_ab_benchmarks(self):
+        """
+        Compare graphql-engine A (under test) with B. At every requests/sec
+        step, short trials of A and B are interleaved, in alternating order so
+        that drift of the host cancels out, and the paired differences are
+        reported
+        """
+        queries = [self.workload] if self.workload else self.queries
+        for query in queries:
+            self.results_root_dir = self.get_results_root_dir(os.path.join('ab', self.query_name(query)))
+            self.test_query(query, self.ab_hge)
+            max_rps = self.max_rps_test(query)
+            rps_steps = [ r for r in self.rps_steps if r < int(0.6*max_rps)]
+            print("A/B benchmarking with interleaved wrk2 trials for the following requests/sec", rps_steps)
+            for rps in rps_steps:
+                self.ab_test(query, rps)
+
+    def ab_test(self, query, rps):
+        print(Fore.GREEN + "A/B test at {} req/s: {} pairs of {}s trials".format(rps, self.ab_trials, self.ab_trial_duration) + Style.RESET_ALL)
+        # Warm up both, which also reconnects the pool connections of A closed by the database clone
+        engines = [('A', self.hge), ('B', self.ab_hge)]
+        for (label, hge) in engines:
+            self.short_trial(query, rps, min(5, self.ab_trial_duration), os.path.join('warmup', label), hge)
+        pairs = []
+        for i in range(self.ab_trials):
+            order = list(engines)
+            if i % 2:
+                order.reverse()
+            pair = {}
+            for (label, hge) in order:
+                pair[label] = self.short_trial(query, rps, self.ab_trial_duration, label, hge)
+            pairs.append(pair)
+        comparison = compare.compare_paired_trials(pairs, self.ab_metrics)
+        compare.print_paired_comparison(comparison)
+        self.insert_ab_result(query, rps, pairs, comparison)
+        return comparison
+
+    def insert_ab_result(self, query, rps, pairs, comparison):
+        self.insert_bench_result(
+            'ab_results', {}, [], query=query,
+            b_version=self.ab_hge.get_version(),
+            requests_per_sec=rps,
+            trial_duration=self.ab_trial_duration,
+            wrk2_parameters=self.get_wrk2_params(),
+            cpu_sets={
+                'a': self.hge.cpus,
+                'b': self.ab_hge.cpus,
+                'load_generator': self.load_cpus
+            },
+            trials=pairs,
+            comparison=comparison
+        )
+
+    def get_subscription_params(self):
+        return {
+            'subscriptions': int(self.subscriptions),
+            'subscriptions_per_connection': int(self.subscriptions_per_connection),
+            'distinct_rows': int(self.subscription_rows),
+            'mutation_rate': float(self.mutation_rate),
+            'duration': int(self.duration),
+            'workers': multiprocessing.cpu_count()
+        }
+
+    def get_event_durations(self, limit):
+        with self.pg.cursor() as cursor:
+            cursor.execute('select id, duration from hge.events order by id limit %s', (limit,))
+            return cursor.fetchall()
+
+    def set_event_durations(self, id_durations):
+        with self.pg.cursor() as cursor:
+            cursor.executemany(
+                'update hge.events set duration = %s where id = %s',
+                [(d, i) for (i, d) in id_durations]
+            )
+
+    def run_subscription_benchmark(self):
+        params = self.get_subscription_params()
+        print(Fore.GREEN + "Running subscriptions fan-out benchmark with {subscriptions} subscriptions on {distinct_rows} rows, at {mutation_rate} mutations/sec (duration: {duration})".format(**params) + Style.RESET_ALL)
+        # The mutations overwrite column duration of the events, restore them afterwards
+        original_durations = self.get_event_durations(params['distinct_rows'])
+        row_ids = [i for (i, _) in original_durations]
+        try:
+            (histogram, summary, samples) = subscriptions_bench.run_fanout(
+                self.hge, row_ids,
+                subscriptions = params['subscriptions'],
+                subs_per_connection = params['subscriptions_per_connection'],
+                mutation_rate = params['mutation_rate'],
+                duration = params['duration'],
+                workers = params['workers'],
+                pg = self.pg
+            )
+        finally:
+            self.set_event_durations(original_durations)
+
+        results_dir = self.new_results_dir('subscriptions', str(params['subscriptions']))
+        self.write_json(results_dir, 'summary.json', summary)
+        latency_store.write_histogram(histogram, results_dir)
+        print(Fore.CYAN + "Delivered {deliveries} of {expected_deliveries} expected updates, {errors} errors".format(**summary) + Style.RESET_ALL)
+        if not summary['pollers']:
+            print(Fore.YELLOW + "No livequery-poller-log lines from graphql-engine: no per poller statistics" + Style.RESET_ALL)
+        print(Fore.CYAN + "Mean latency {:.2f} ms from the responses, {:.2f} ms from the requests of the mutations; {} updates arrived before the response".format(
+            summary['latency']['mean'] / 1000.0, summary['latency_upper_bound']['mean'] / 1000.0,
+            summary['clamped_deliveries']) + Style.RESET_ALL)
+        latency_histogram = self.get_latency_histogram(
+            load_generator.percentile_spectrum(histogram),
+            os.path.join(results_dir, 'latencies.hgrm')
+        )
+        self.insert_subscription_result(params, summary, latency_histogram, samples)
+        return summary
+
+    def insert_subscription_result(self, params, summary, latency_histogram, samples):
+        extra = {}
+        if summary['live_queries_state']:
+            extra['live_query_options'] = summary['live_queries_state']['options']
+        self.insert_bench_result(
+            'subscription_results', params, ['subscriptions', 'mutation_rate'],
+            connections=summary['connections'],
+            parameters=params,
+            summary=summary,
+            latency_histogram=latency_histogram,
+            telemetry={'data': telemetry.as_rows(samples)},
+            **extra
+        )
+
+    def run_startup_benchmark(self):
+        if self.hge_url:
+            raise ValueError('The startup benchmark needs to launch graphql-engine, which is not possible with --hge-url')
+        print(Fore.GREEN + "Running startup benchmark with {} copies of the sportsdb schema, {} trials each".format(
+            ', '.join(str(c) for c in sorted(set(self.startup_schema_copies))), self.startup_trials
+        ) + Style.RESET_ALL)
+        def mk_hge():
+            return self.mk_hge(self.pg, None, 'startup_hge.log', docker_image=self.hge_docker_image)
+        results_dir = self.new_results_dir('startup')
+        all_results = []
+        for (copies, size, trials) in startup_bench.run_startup_benchmark(
+                self.hge, mk_hge, self.pg, 'hge', self.startup_schema_copies, self.startup_trials):
+            summary = startup_bench.summarise_trials(trials)
+            self.print_startup_summary(summary)
+            self.insert_startup_result(copies, size, trials, summary)
+            all_results.append({'schema_copies': copies, 'metadata_size': size, 'trials': trials, 'summary': summary})
+        self.write_json(results_dir, 'startup.json', all_results)
+
+    def print_startup_summary(self, summary):
+        for (metric, s) in summary.items():
+            if metric.endswith('_bytes'):
+                fmt = '{:.1f} MB'
+                s = {k: v / (1024 * 1024) for (k, v) in s.items()}
+            else:
+                fmt = '{:.3f}s'
+            print(Fore.CYAN + "{:<20} median: {}  min: {}  max: {}".format(
+                metric, fmt.format(s['median']), fmt.format(s['min']), fmt.format(s['max'])
+            ) + Style.RESET_ALL)
+
+    def insert_startup_result(self, schema_copies, size, trials, summary):
+        self.insert_bench_result('startup_results', {}, [], schema_copies=schema_copies, metadata_size=size,
+                                 trials=trials, summary=summary)
+
+    def run_metadata_benchmark(self):
+        print(Fore.GREEN + "Running metadata benchmark with {} tables and {} roles".format(
+            ', '.join(str(n) for n in sorted(set(self.metadata_tables))),
+            ', '.join(str(m) for m in sorted(set(self.metadata_roles)))
+        ) + Style.RESET_ALL)
+        results_dir = self.new_results_dir('metadata')
+        results = []
+        for result in metadata_bench.run_metadata_benchmark(
+                self.hge, self.pg, self.metadata_tables, self.metadata_roles, self.metadata_one_by_one):
+            self.insert_metadata_result(result)
+            results.append(result)
+        self.write_json(results_dir, 'metadata.json', results)
+        df = metadata_bench.scaling_table(results)
+        df.to_csv(os.path.join(results_dir, 'scaling.csv'), index=False)
+        metadata_bench.plot_scaling(df, os.path.join(results_dir, 'scaling.png'))
+        print(Fore.CYAN + df.to_string(index=False) + Style.RESET_ALL)
+        print("Scaling curve:", os.path.join(results_dir, 'scaling.png'))
+
+    def insert_metadata_result(self, result):
+        self.insert_bench_result('metadata_results', result, [
+            'tables', 'roles', 'relationships', 'permissions', 'metadata_calls', 'introspection', 'memory'
+        ], one_by_one=result.get('one_by_one'), bulk_seconds=result['bulk_s'],
+            reload_metadata_seconds=result['reload_metadata_s'])
+
+    def run_remote_join_benchmark(self):
+        if self.skip_remote_graphql_setup:
+            raise ValueError('The remote join benchmark needs the remote graphql-engine')
+        print(Fore.GREEN + "Running remote join benchmark with fan-outs {}, {} requests each".format(
+            ', '.join(str(f) for f in sorted(set(self.remote_join_fan_outs))), self.remote_join_requests
+        ) + Style.RESET_ALL)
+        results_dir = self.new_results_dir('remote_join')
+        results = []
+        for result in remote_join_bench.run_remote_join_benchmark(
+                self.hge, self.remote_hge, self.pg, self.remote_join_fan_outs,
+                requests_count=self.remote_join_requests):
+            self.print_remote_join_result(result)
+            self.insert_remote_join_result(result)
+            results.append(result)
+        self.write_json(results_dir, 'remote_join.json', results)
+
+    def print_remote_join_result(self, result):
+        (local, remote, overhead) = (result['local'], result['remote'], result['overhead'])
+        print(Fore.CYAN + "{:<8} p50: {:.2f}ms  p99: {:.2f}ms  response: {} bytes".format(
+            'local', local['p50_ms'], local['p99_ms'], local['response_bytes']))
+        print("{:<8} p50: {:.2f}ms  p99: {:.2f}ms  response: {} bytes  upstream requests: {}  upstream response: {} bytes".format(
+            'remote', remote['p50_ms'], remote['p99_ms'], remote['response_bytes'],
+            remote['upstream_requests'], remote['upstream_response_bytes']))
+        print("{:<8} p50: {:+.2f}ms  p99: {:+.2f}ms".format(
+            'overhead', overhead['p50_ms'], overhead['p99_ms']) + Style.RESET_ALL)
+
+    def insert_remote_join_result(self, result):
+        self.insert_bench_result('remote_join_results', result, [
+            'table_name', 'column_name', 'ref_table', 'local_relationship', 'remote_relationship',
+            'fan_out', 'local', 'remote', 'overhead', 'local_query', 'remote_query'
+        ])
+
+    def run_plan_cache_benchmark(self):
+        hge_conf = dict()
+        self.set_hge_args_env_vars(hge_conf)
+        cache_size = plan_cache_bench.configured_plan_cache_size(hge_conf['hge_conf'])
+        working_sets = self.plan_cache_working_sets or plan_cache_bench.working_set_sizes(
+            cache_size, plan_cache_bench.default_working_set_ratios)
+        state = plan_cache_bench.plan_cache_state(self.hge)
+        print(Fore.GREEN + "Running plan cache benchmark with {} query shapes, working sets of {} (plan cache size {})".format(
+            ', '.join(self.plan_cache_kinds), ', '.join(str(n) for n in sorted(set(working_sets))), cache_size
+        ) + Style.RESET_ALL)
+        if state is not None:
+            print(Fore.YELLOW + "Plan cache: " + state + Style.RESET_ALL)
+        results_dir = self.new_results_dir('plan_cache')
+        all_results = []
+        for (_, results) in plan_cache_bench.run_plan_cache_benchmark(
+                self.hge, self.pg, self.get_wrk2_params(), self.plan_cache_kinds, working_sets, cache_size,
+                self.plan_cache_requests, self.plan_cache_duration):
+            for result in results:
+                result['plan_cache_state'] = state
+                self.insert_plan_cache_result(result)
+            all_results.extend(results)
+        self.write_json(results_dir, 'plan_cache.json', all_results)
+        df = plan_cache_bench.hit_rate_table(all_results)
+        df.to_csv(os.path.join(results_dir, 'hit_rate.csv'), index=False)
+        plan_cache_bench.plot_hit_rates(df, os.path.join(results_dir, 'hit_rate.png'))
+        print(Fore.CYAN + df.to_string(index=False) + Style.RESET_ALL)
+        print("Hit rate curve:", os.path.join(results_dir, 'hit_rate.png'))
+
+    def insert_plan_cache_result(self, result):
+        self.insert_bench_result('plan_cache_results', result, [
+            'kind', 'working_set', 'plans', 'plan_cache_size', 'plan_cache_state', 'cold', 'warm',
+            'expected_hit_rate', 'estimated_hit_rate', 'miss_penalty_ms'
+        ], throughput=result.get('throughput'))
+
+    def run_mutation_benchmark(self):
+        print(Fore.GREEN + "Running mutation benchmark: {}, insert batch sizes {}".format(
+            ', '.join(self.mutation_cases), ', '.join(str(b) for b in sorted(set(self.mutation_batch_sizes)))
+        ) + Style.RESET_ALL)
+        results_dir = self.new_results_dir('mutations')
+        results = []
+        event_triggers = [False, True] if self.mutation_event_triggers else [False]
+        sink_port = self.port_allocator.allocate_port(9100)
+        for result in mutation_bench.run_mutation_benchmark(
+                self.hge, self.pg, sink_port, self.mutation_cases, self.mutation_batch_sizes,
+                self.mutation_rows, self.mutation_concurrency, event_triggers):
+            print(Fore.CYAN + "{:.0f} rows/s, {:.0f} requests/s, p50: {:.2f}ms, p99: {:.2f}ms, WAL: {} bytes, max lock waits: {}".format(
+                result['rows_per_sec'], result['requests_per_sec'], result['latency']['p50_ms'],
+                result['latency']['p99_ms'], result['wal_bytes'], result['lock_waits']['max_waiting']
+            ) + Style.RESET_ALL)
+            self.insert_mutation_result(result)
+            results.append(result)
+        self.write_json(results_dir, 'mutations.json', results)
+
+    def insert_mutation_result(self, result):
+        self.insert_bench_result('mutation_results', result, [
+            'mutation_case', 'batch_size', 'event_triggers', 'concurrency', 'requests', 'rows', 'seconds',
+            'requests_per_sec', 'rows_per_sec', 'latency', 'wal_bytes', 'lock_waits'
+        ])
+
+    def run_event_benchmark(self):
+        if self.hge_url:
+            raise ValueError('The event trigger benchmark needs to launch graphql-engine, which is not possible with --hge-url')
+        print(Fore.GREEN + "Running event trigger benchmark at {} inserts/sec, webhook latencies {} ms (duration: {})".format(
+            ', '.join(str(r) for r in self.event_rates), ', '.join(str(l) for l in self.event_webhook_latencies),
+            self.event_duration
+        ) + Style.RESET_ALL)
+        def mk_hge(pg, extra_args):
+            return self.mk_hge(pg, None, 'event_hge.log', docker_image=self.hge_docker_image, extra_args=extra_args)
+        results_dir = self.new_results_dir('events')
+        sink_port = self.port_allocator.allocate_port(9100)
+        hge_confs = list(itertools.product(self.event_http_pool_sizes, self.event_fetch_intervals))
+        results = []
+        for result in event_bench.run_event_benchmark(
+                self.pg, mk_hge, sink_port, hge_confs, self.event_rates, self.event_webhook_latencies,
+                self.event_duration, self.event_sink_workers):
+            self.print_event_result(result)
+            self.insert_event_result(result)
+            results.append(result)
+        self.write_json(results_dir, 'events.json', results)
+
+    def print_event_result(self, result):
+        lag = result['lag']
+        if lag:
+            print(Fore.CYAN + "{} of {} events delivered, {:.0f} events/s, lag p50: {:.1f}ms, p99: {:.1f}ms, max: {:.1f}ms, errors: {}".format(
+                result['delivered'], result['inserted'], result['events_per_sec'] or 0,
+                lag['p50_ms'], lag['p99_ms'], lag['max_ms'], result['errors']
+            ) + Style.RESET_ALL)
+        else:
+            print(Fore.RED + "No event delivered out of {}".format(result['inserted']) + Style.RESET_ALL)
+
+    def insert_event_result(self, result):
+        self.insert_bench_result('event_results', result, [
+            'http_pool_size', 'fetch_interval_ms', 'insert_rate', 'webhook_latency_ms', 'duration', 'inserted',
+            'achieved_insert_rate', 'delivered', 'errors', 'backlog_after_inserts', 'events_per_sec',
+            'peak_events_per_sec', 'lag'
+        ])
+
+    def run_scheduled_benchmark(self):
+        print(Fore.GREEN + "Running scheduled trigger benchmark with {} one-off events and {} cron triggers".format(
+            ', '.join(str(n) for n in self.scheduled_events), ', '.join(str(k) for k in self.scheduled_cron_triggers)
+        ) + Style.RESET_ALL)
+        results_dir = self.new_results_dir('scheduled')
+        sink_port = self.port_allocator.allocate_port(9100)
+        results = []
+        for result in scheduled_bench.run_scheduled_benchmark(
+                self.hge, self.pg, sink_port, self.scheduled_events, self.scheduled_cron_triggers,
+                self.scheduled_webhook_latency, self.scheduled_tolerance, self.scheduled_lead_time,
+                self.scheduled_cron_minutes, scheduled_bench.drain_timeout, self.event_sink_workers):
+            self.print_scheduled_result(result)
+            self.insert_scheduled_result(result)
+            results.append(result)
+        self.write_json(results_dir, 'scheduled.json', results)
+
+    def print_scheduled_result(self, result):
+        for kind in ['one_off', 'cron']:
+            summary = result[kind]
+            if not summary['events']:
+                continue
+            lateness = summary['lateness']
+            print(Fore.CYAN + "{}: {} of {} events delivered, {} dead, {} errors".format(
+                kind, summary['delivered'], summary['events'], summary['dead'], summary['errors']
+            ) + Style.RESET_ALL)
+            if lateness:
+                print(Fore.CYAN + "  lateness p50: {:.0f}ms, p99: {:.0f}ms, max: {:.0f}ms, drained in {:.1f}s".format(
+                    lateness['p50_ms'], lateness['p99_ms'], lateness['max_ms'], summary['drain_seconds']
+                ) + Style.RESET_ALL)
+
+    def insert_scheduled_result(self, result):
+        self.insert_bench_result('scheduled_results', result, [
+            'one_off_events', 'cron_triggers', 'cron_minutes', 'webhook_latency_ms', 'tolerance_seconds',
+            'create_seconds', 'one_off', 'cron'
+        ])
+
+    def run_auth_benchmark(self):
+        if self.hge_url and self.auth_modes != ['admin_secret']:
+            raise ValueError('The auth benchmark needs to launch graphql-engine, which is not possible with --hge-url')
+        if self.workload:
+            raise ValueError('The auth benchmark runs the queries of the queries file, not mixed workloads')
+        print(Fore.GREEN + "Running auth benchmark with modes {} (duration: {})".format(
+            ', '.join(self.auth_modes), self.auth_duration
+        ) + Style.RESET_ALL)
+        def mk_hge(extra_args):
+            return self.mk_hge(self.pg, None, 'auth_hge.log', docker_image=self.hge_docker_image, extra_args=extra_args)
+        results_dir = self.new_results_dir('auth')
+        queries = [(self.query_name(q), self.query_text(q)) for q in self.queries]
+        sink_port = self.port_allocator.allocate_port(9100)
+        results = []
+        for result in auth_bench.run_auth_benchmark(
+                self.hge, mk_hge, sink_port, self.auth_modes, queries, self.get_wrk2_params(),
+                self.auth_duration, self.auth_token_pool_size, self.auth_webhook_latency,
+                self.auth_webhook_cache_max_age, self.event_sink_workers):
+            self.insert_auth_result(result)
+            results.append(result)
+        self.print_auth_results(results)
+        self.write_json(results_dir, 'auth.json', results)
+
+    def print_auth_results(self, results):
+        """Throughput and latency of every mode, relative to the first mode"""
+        baseline = {}
+        print(Fore.CYAN + "{:<14} {:<24} {:>10} {:>8} {:>10} {:>10} {:>8} {:>14}".format(
+            'mode', 'query', 'max rps', 'diff', 'p50 (ms)', 'p99 (ms)', 'diff', 'webhook calls'
+        ) + Style.RESET_ALL)
+        for r in results:
+            (base_rps, base_p99) = baseline.setdefault(r['query_name'], (r['max_rps'], r['latency']['p99_ms']))
+            calls = r['webhook_calls_per_request']
+            print(Fore.CYAN + "{:<14} {:<24} {:>10.0f} {:>7.1f}% {:>10.2f} {:>10.2f} {:>7.1f}% {:>14}".format(
+                r['auth_mode'], r['query_name'], r['max_rps'], 100 * (r['max_rps'] / base_rps - 1),
+                r['latency']['p50_ms'], r['latency']['p99_ms'], 100 * (r['latency']['p99_ms'] / base_p99 - 1),
+                '{:.2f}'.format(calls) if calls is not None else '-'
+            ) + Style.RESET_ALL)
+
+    def insert_auth_result(self, result):
+        self.insert_bench_result('auth_results', result, [
+            'auth_mode', 'tokens', 'max_rps', 'max_rps_latency', 'rps', 'latency', 'errors',
+            'webhook_calls_per_request', 'webhook_latency_ms', 'cache_max_age'
+        ], query=self.result_query(result))
+
+    def run_compression_benchmark(self):
+        print(Fore.GREEN + "Running compression benchmark with limits {} (duration: {})".format(
+            ', '.join(str(l) for l in self.compression_limits), self.compression_duration
+        ) + Style.RESET_ALL)
+        results_dir = self.new_results_dir('compression')
+        results = []
+        for result in compression_bench.run_compression_benchmark(
+                self.hge, self.pg, self.compression_limits, self.get_wrk2_params(),
+                self.compression_duration, self.compression_rps):
+            self.insert_compression_result(result)
+            results.append(result)
+        self.print_compression_results(results)
+        self.write_json(results_dir, 'compression.json', results)
+
+    def print_compression_results(self, results):
+        print(Fore.CYAN + "{:>6} {:<9} {:<11} {:>10} {:>14} {:>10} {:>10} {:>10}".format(
+            'limit', 'encoding', 'load', 'req/s', 'bytes/req', 'CPU (ms)', 'p50 (ms)', 'p99 (ms)'
+        ) + Style.RESET_ALL)
+        for r in results:
+            cpu = r['cpu_ms_per_request']
+            print(Fore.CYAN + "{:>6} {:<9} {:<11} {:>10.0f} {:>14.0f} {:>10} {:>10.2f} {:>10.2f}".format(
+                r['limit'], r['encoding'], r['load'], r['requests_per_sec'], r['bytes_per_request'] or 0,
+                '{:.3f}'.format(cpu) if cpu is not None else '-', r['latency']['p50_ms'], r['latency']['p99_ms']
+            ) + Style.RESET_ALL)
+
+    def insert_compression_result(self, result):
+        self.insert_bench_result('compression_results', result, [
+            'rows', 'encoding', 'load', 'rps', 'duration', 'requests', 'requests_per_sec', 'errors',
+            'bytes_per_request', 'uncompressed_bytes', 'compressed_bytes', 'cpu_ms_per_request', 'latency'
+        ], row_limit=result['limit'])
+
+    def run_scaling_benchmark(self):
+        if self.hge_url:
+            raise ValueError('The scalability benchmark needs to launch graphql-engine, which is not possible with --hge-url')
+        if self.workload:
+            raise ValueError('The scalability benchmark runs the queries of the queries file, not mixed workloads')
+        print(Fore.GREEN + "Running scalability benchmark with client connections {}, capabilities {} and pool sizes {} (duration: {})".format(
+            ', '.join(str(c) for c in self.scaling_connections), ', '.join(str(n) for n in self.scaling_hge_cores),
+            ', '.join(str(p or 'default') for p in self.scaling_pg_connections), self.scaling_duration
+        ) + Style.RESET_ALL)
+        def mk_hge(extra_args, cpus):
+            return self.mk_hge(self.pg, None, 'scaling_hge.log', docker_image=self.hge_docker_image, cpus=cpus, extra_args=extra_args)
+        results_dir = self.new_results_dir('scaling')
+        queries = [(self.query_name(q), self.query_text(q)) for q in self.queries]
+        points = []
+        for point in scaling_bench.run_scaling_benchmark(
+                mk_hge, queries, self.scaling_hge_cores, self.scaling_pg_connections,
+                self.scaling_connections, self.scaling_duration):
+            print(Fore.CYAN + "{:.0f} req/s, p99 {:.2f} ms".format(point['requests_per_sec'], point['latency']['p99_ms']) + Style.RESET_ALL)
+            self.insert_scaling_result(point)
+            points.append(point)
+        fits = scaling_bench.fit_scaling(points)
+        for fit in fits:
+            self.insert_scaling_fit(fit)
+        report = scaling_bench.scaling_report(fits)
+        print(Fore.CYAN + report + Style.RESET_ALL)
+        with open(os.path.join(results_dir, 'scaling_report.txt'), 'w') as f:
+            f.write(report + '\n')
+        self.write_json(results_dir, 'scaling.json', {'points': points, 'fits': fits})
+        for plot_file in scaling_bench.plot_scaling(points, fits, results_dir):
+            print("Scaling plot written to", plot_file)
+
+    def insert_scaling_result(self, result):
+        self.insert_bench_result('scaling_results', result, [
+            'hge_capabilities', 'pg_connections', 'client_connections', 'requests', 'requests_per_sec',
+            'errors', 'latency'
+        ], query=self.result_query(result))
+
+    def insert_scaling_fit(self, fit):
+        self.insert_bench_result('scaling_fits', fit, [
+            'dimension', 'hge_capabilities', 'pg_connections', 'lambda', 'sigma', 'kappa', 'r_squared',
+            'peak_concurrency', 'peak_throughput', 'points'
+        ], query=self.result_query(fit))
+
+    def run_soak_benchmark(self):
+        soak_load = self.workload or soak_bench.soak_workload(
+            [(self.query_name(q), self.query_text(q)) for q in self.queries])
+        print(Fore.GREEN + "Running soak benchmark of {} for {}s (interval: {}s, window: {}s, warm-up: {}s)".format(
+            soak_load.name, self.soak_duration, self.soak_interval, self.soak_window, self.soak_warmup
+        ) + Style.RESET_ALL)
+        results_dir = self.new_results_dir('soak')
+        self.test_query(soak_load)
+        result = soak_bench.run_soak_benchmark(
+            self.hge, self.pg, soak_load, self.get_wrk2_params(), self.soak_duration, results_dir,
+            rps=self.soak_rps, interval=self.soak_interval, window=self.soak_window, warmup=self.soak_warmup,
+            dump_interval=self.soak_dump_interval, telemetry_interval=self.telemetry_interval, cpus=self.load_cpus
+        )
+        result['workload'] = soak_load.name
+        self.insert_soak_result(result)
+        self.print_soak_result(result)
+        self.write_json(results_dir, 'soak.json', result)
+        plot_file = os.path.join(results_dir, 'soak.png')
+        soak_bench.plot_soak(result, plot_file)
+        print("Soak plot written to", plot_file)
+
+    def print_soak_result(self, result):
+        print(Fore.CYAN + "{} requests at {} req/s, {} errors".format(
+            result['requests'], result['rps'], result['errors']) + Style.RESET_ALL)
+        for (metric, trend) in result['trends'].items():
+            if not trend:
+                print(Fore.CYAN + "{:<14} not enough samples".format(metric) + Style.RESET_ALL)
+                continue
+            print((Fore.RED if trend['flagged'] else Fore.CYAN) + "{:<14} {:+.2%}/hour (p={:.3g}, R^2={:.3f}){}".format(
+                metric, trend['growth_per_hour'] or 0, trend['p_value'], trend['r_squared'],
+                ' significant positive trend' if trend['flagged'] else ''
+            ) + Style.RESET_ALL)
+
+    def insert_soak_result(self, result):
+        self.insert_bench_result('soak_results', result, [
+            'workload', 'duration', 'rps', 'requests', 'errors', 'intervals', 'windows', 'trends', 'dev_state'
+        ], memory_growth_flagged=any(
+            (result['trends'].get(m) or {}).get('flagged', False) for m in ['rss_bytes', 'gc_live_bytes']),
+            latency_drift_flagged=(result['trends'].get('p99_ms') or {}).get('flagged', False),
+            **{k + '_seconds': result[k] for k in ['interval', 'window', 'warmup']})
+
+    def generate_benchmark_queries(self):
+        """Replace the queries of the queries file with queries generated from the relationships of schema hge"""
+        schema = 'hge'
+        print(Fore.GREEN + "Generating queries of families {} from the relationships of schema {}".format(
+            ', '.join(self.generate_queries), schema
+        ) + Style.RESET_ALL)
+        columns = {t: self.pg.get_all_columns_of_a_table(t, schema) for t in self.pg.get_all_tables_in_a_schema(schema)}
+        graph = query_gen.relationship_graph(
+            self.hge.export_metadata(), self.pg.get_all_fk_constraints(schema), columns, schema)
+        queries = query_gen.generate_queries(
+            graph, self.pg, self.generate_queries, max_depth=self.generate_max_depth,
+            max_breadth=self.generate_max_breadth, fan_outs=self.generate_fan_outs,
+            root_limit=self.generate_root_limit
+        )
+        queries_file = os.path.join(self.work_dir, 'generated_queries.graphql')
+        with open(queries_file, 'w') as f:
+            f.write(query_gen.format_queries_file(queries, schema))
+        print("{} queries written to {}".format(len(queries), queries_file))
+        self.load_queries(queries_file)
+
     def run_tests(self):
         with self.graphql_engines_setup():
-            self.setup_results_schema()
-            if self.run_benchmarks:
-                self.run_query_benchmarks()
+            self.setup_results_store()
+            if self.generate_queries:
+                self.generate_benchmark_queries()
+            self.pg_stat_statements = self.pg.enable_pg_stat_statements()
+            if self.workload:
+                self.workload.resolve(self.pg)
+            try:
+                if self.run_benchmarks and self.startup_schema_copies:
+                    self.run_startup_benchmark()
+                elif self.run_benchmarks and self.metadata_tables:
+                    self.run_metadata_benchmark()
+                elif self.run_benchmarks and self.remote_join_fan_outs:
+                    self.run_remote_join_benchmark()
+                elif self.run_benchmarks and self.plan_cache_kinds:
+                    self.run_plan_cache_benchmark()
+                elif self.run_benchmarks and self.mutation_cases:
+                    self.run_mutation_benchmark()
+                elif self.run_benchmarks and self.event_rates:
+                    self.run_event_benchmark()
+                elif self.run_benchmarks and self.scheduled_events:
+                    self.run_scheduled_benchmark()
+                elif self.run_benchmarks and self.auth_modes:
+                    self.run_auth_benchmark()
+                elif self.run_benchmarks and self.compression_limits:
+                    self.run_compression_benchmark()
+                elif self.run_benchmarks and self.scaling_connections:
+                    self.run_scaling_benchmark()
+                elif self.run_benchmarks and self.soak_duration:
+                    self.run_soak_benchmark()
+                elif self.run_benchmarks and self.ab_mode:
+                    self.run_ab_benchmarks()
+                elif self.run_benchmarks and self.subscriptions:
+                    self.run_subscription_benchmark()
+                elif self.run_benchmarks:
+                    self.run_query_benchmarks()
+            finally:
+                # Results of a failed run are kept too
+                self.results_store.flush()
             if not self.skip_plots:
                 self.plot_results()
 
@@ -502,14 +1411,83 @@ class HGEWrkBenchArgs(HGETestSetupArgs):
         wrk_opts.add_argument('--set-scenario-name', metavar='HASURA_BENCH_SCENARIO_NAME', help='Set a name for the test scenario. This will be shown in logs', required=False)
         wrk_opts.add_argument('--results-hge-url', metavar='HASURA_BENCH_RESULTS_HGE_URL', help='The GraphQL engine to which the results should be uploaded', required=False)
         wrk_opts.add_argument('--results-hge-admin-secret', metavar='HASURA_BENCH_RESULTS_HGE_ADMIN_SECRET', help='Admin secret of the GraphQL engine to which the results should be uploaded', required=False)
+        wrk_opts.add_argument('--results-parquet-dir', metavar='HASURA_BENCH_RESULTS_PARQUET_DIR', help='Store the results in Parquet files in this directory instead of uploading them to a GraphQL engine. See results_store.py for exporting them later', required=False)
+        wrk_opts.add_argument('--results-batch-size', metavar='HASURA_BENCH_RESULTS_BATCH_SIZE', help='Number of results stored at a time (default: 50 with --results-parquet-dir, 1 otherwise)', type=int, required=False)
         wrk_opts.add_argument('--skip-plots', help='Skip plotting', action='store_true', required=False)
         wrk_opts.add_argument('--run-benchmarks', metavar='HASURA_BENCH_RUN_BENCHMARKS', help='Whether benchmarks should be run or not', default=True, type=boolean_string)
+        wrk_opts.add_argument('--subscriptions', metavar='HASURA_BENCH_SUBSCRIPTIONS', help='Run the subscriptions fan-out benchmark with these many subscriptions, instead of the query benchmarks', type=int, required=False)
+        wrk_opts.add_argument('--subscriptions-per-connection', metavar='HASURA_BENCH_SUBSCRIPTIONS_PER_CONNECTION', help='Number of subscriptions on each websocket connection (default: 1)', type=int, required=False)
+        wrk_opts.add_argument('--subscription-rows', metavar='HASURA_BENCH_SUBSCRIPTION_ROWS', help='Number of distinct rows the subscriptions are spread over (default: 100)', type=int, required=False)
+        wrk_opts.add_argument('--mutation-rate', metavar='HASURA_BENCH_MUTATION_RATE', help='Mutations per second during the subscriptions benchmark (default: 10)', type=float, required=False)
+        wrk_opts.add_argument('--adaptive-rps', help='Find the knee of each query with a saturation search against the latency SLO, instead of a fixed 30s max throughput run and fixed requests/sec steps', action='store_true', required=False)
+        wrk_opts.add_argument('--slo-p99-ms', metavar='HASURA_BENCH_SLO_P99_MS', help='p99 latency SLO in milliseconds for the saturation search (default: 100)', type=float, required=False)
+        wrk_opts.add_argument('--slo-error-rate', metavar='HASURA_BENCH_SLO_ERROR_RATE', help='Error rate SLO for the saturation search (default: 0.01)', type=float, required=False)
+        wrk_opts.add_argument('--latency-probes', metavar='HASURA_BENCH_LATENCY_PROBES', help='Number of latency benchmarks placed logarithmically below the knee (default: 5)', type=int, required=False)
+        wrk_opts.add_argument('--search-trial-duration', metavar='HASURA_BENCH_SEARCH_TRIAL_DURATION', help='Duration in seconds of each saturation search trial (default: 10)', type=int, required=False)
+        wrk_opts.add_argument('--latency-sample-size', metavar='HASURA_BENCH_LATENCY_SAMPLE_SIZE', help='Size of the random sample of latencies stored along with the latency histogram of each run. Set to 0 to store only the histogram (default: 10000)', type=int, required=False)
+        wrk_opts.add_argument('--keep-raw-latencies', help='Keep the text file with every latency sample written by wrk2, in the work directory', action='store_true', required=False)
+        wrk_opts.add_argument('--workload-file', metavar='HASURA_BENCH_WORKLOAD_FILE', help='Benchmark the weighted mix of operations defined in this scenario file (see workload.py), instead of every query in the queries file. Needs the python load generator', required=False)
+        wrk_opts.add_argument('--telemetry-interval', metavar='HASURA_BENCH_TELEMETRY_INTERVAL', help='Interval in seconds at which resource usage of graphql-engine and Postgres is sampled during benchmarks (default: 1)', type=float, required=False)
+        wrk_opts.add_argument('--ab-trials', metavar='HASURA_BENCH_AB_TRIALS', help='A/B mode: number of pairs of interleaved trials of A and B at every requests/sec step (default: 6)', type=int, required=False)
+        wrk_opts.add_argument('--ab-trial-duration', metavar='HASURA_BENCH_AB_TRIAL_DURATION', help='A/B mode: duration in seconds of each trial (default: 10)', type=int, required=False)
+        wrk_opts.add_argument('--startup-schema-copies', metavar='HASURA_BENCH_STARTUP_SCHEMA_COPIES', help='Run the startup benchmark instead of the query benchmarks, with metadata having these many (comma separated) copies of the sportsdb schema, e.g. 0,2,8', required=False)
+        wrk_opts.add_argument('--startup-trials', metavar='HASURA_BENCH_STARTUP_TRIALS', help='Startup benchmark: number of launches of graphql-engine for each metadata size (default: 3)', type=int, required=False)
+        wrk_opts.add_argument('--metadata-tables', metavar='HASURA_BENCH_METADATA_TABLES', help='Run the metadata benchmark instead of the query benchmarks, with these many (comma separated) synthetic tables, e.g. 100,1000,5000', required=False)
+        wrk_opts.add_argument('--metadata-roles', metavar='HASURA_BENCH_METADATA_ROLES', help='Metadata benchmark: numbers (comma separated) of roles with permissions on every table (default: 1)', required=False)
+        wrk_opts.add_argument('--metadata-skip-one-by-one', help='Metadata benchmark: only apply the metadata in bulk, as applying it one call at a time is quadratic', action='store_true', required=False)
+        wrk_opts.add_argument('--remote-join-fan-outs', metavar='HASURA_BENCH_REMOTE_JOIN_FAN_OUTS', help='Run the remote join benchmark instead of the query benchmarks, with these many (comma separated) parent rows per query, e.g. 1,10,100,1000', required=False)
+        wrk_opts.add_argument('--remote-join-requests', metavar='HASURA_BENCH_REMOTE_JOIN_REQUESTS', help='Remote join benchmark: number of sequential requests timed for each query (default: 100)', type=int, required=False)
+        wrk_opts.add_argument('--plan-cache-shapes', metavar='HASURA_BENCH_PLAN_CACHE_SHAPES', help='Run the plan cache benchmark instead of the query benchmarks, with these (comma separated) kinds of query shapes: ' + ', '.join(plan_cache_bench.shape_kinds), required=False)
+        wrk_opts.add_argument('--plan-cache-working-sets', metavar='HASURA_BENCH_PLAN_CACHE_WORKING_SETS', help='Plan cache benchmark: numbers (comma separated) of distinct query shapes (default: from 0.25 to 4 times the plan cache size)', required=False)
+        wrk_opts.add_argument('--plan-cache-requests', metavar='HASURA_BENCH_PLAN_CACHE_REQUESTS', help='Plan cache benchmark: number of sequential requests timed for each working set (default: 1000)', type=int, required=False)
+        wrk_opts.add_argument('--plan-cache-duration', metavar='HASURA_BENCH_PLAN_CACHE_DURATION', help='Plan cache benchmark: duration in seconds of the throughput test of each working set (default: 10)', type=int, required=False)
+        wrk_opts.add_argument('--mutations', metavar='HASURA_BENCH_MUTATIONS', help='Run the mutation benchmark instead of the query benchmarks, with these (comma separated) cases, or "all": ' + ', '.join(mutation_bench.mutation_cases), required=False)
+        wrk_opts.add_argument('--mutation-batch-sizes', metavar='HASURA_BENCH_MUTATION_BATCH_SIZES', help='Mutation benchmark: numbers (comma separated) of objects per insert (default: 1,10,100,1000,10000)', required=False)
+        wrk_opts.add_argument('--mutation-rows', metavar='HASURA_BENCH_MUTATION_ROWS', help='Mutation benchmark: rows inserted, updated or deleted by every case (default: 20000)', type=int, required=False)
+        wrk_opts.add_argument('--mutation-concurrency', metavar='HASURA_BENCH_MUTATION_CONCURRENCY', help='Mutation benchmark: number of concurrent clients (default: 8)', type=int, required=False)
+        wrk_opts.add_argument('--mutation-skip-event-triggers', help='Mutation benchmark: only run the cases without an event trigger on the table', action='store_true', required=False)
+        wrk_opts.add_argument('--event-rates', metavar='HASURA_BENCH_EVENT_RATES', help='Run the event trigger benchmark instead of the query benchmarks, with these (comma separated) rates of inserts per second, e.g. 100,1000,5000', required=False)
+        wrk_opts.add_argument('--event-http-pool-sizes', metavar='HASURA_BENCH_EVENT_HTTP_POOL_SIZES', help='Event trigger benchmark: values (comma separated) of --events-http-pool-size of graphql-engine (default: its default)', required=False)
+        wrk_opts.add_argument('--event-fetch-intervals', metavar='HASURA_BENCH_EVENT_FETCH_INTERVALS', help='Event trigger benchmark: values (comma separated) of --events-fetch-interval of graphql-engine, in milliseconds (default: its default)', required=False)
+        wrk_opts.add_argument('--event-webhook-latencies', metavar='HASURA_BENCH_EVENT_WEBHOOK_LATENCIES', help='Event trigger benchmark: response times (comma separated) of the webhook in milliseconds (default: 0,50)', required=False)
+        wrk_opts.add_argument('--event-duration', metavar='HASURA_BENCH_EVENT_DURATION', help='Event trigger benchmark: duration in seconds of the inserts of each trial (default: 30)', type=int, required=False)
+        wrk_opts.add_argument('--event-sink-workers', metavar='HASURA_BENCH_EVENT_SINK_WORKERS', help='Event and scheduled trigger benchmarks: processes of the webhook sink (default: half the CPUs)', type=int, required=False)
+        wrk_opts.add_argument('--scheduled-events', metavar='HASURA_BENCH_SCHEDULED_EVENTS', help='Run the scheduled trigger benchmark instead of the query benchmarks, with these (comma separated) numbers of one-off events due at the same time, e.g. 100,1000,10000', required=False)
+        wrk_opts.add_argument('--scheduled-cron-triggers', metavar='HASURA_BENCH_SCHEDULED_CRON_TRIGGERS', help='Scheduled trigger benchmark: numbers (comma separated) of cron triggers firing every minute (default: 0)', required=False)
+        wrk_opts.add_argument('--scheduled-webhook-latency', metavar='HASURA_BENCH_SCHEDULED_WEBHOOK_LATENCY', help='Scheduled trigger benchmark: response time of the webhook in milliseconds (default: 0)', type=float, required=False)
+        wrk_opts.add_argument('--scheduled-tolerance', metavar='HASURA_BENCH_SCHEDULED_TOLERANCE', help='Scheduled trigger benchmark: tolerance_seconds of the events, after which they are dead (default: that of graphql-engine, 6 hours)', type=int, required=False)
+        wrk_opts.add_argument('--scheduled-lead-time', metavar='HASURA_BENCH_SCHEDULED_LEAD_TIME', help='Scheduled trigger benchmark: minimum seconds between the creation of the events and their due time, more than 60 for cron triggers (default: 90)', type=int, required=False)
+        wrk_opts.add_argument('--scheduled-cron-minutes', metavar='HASURA_BENCH_SCHEDULED_CRON_MINUTES', help='Scheduled trigger benchmark: minutes of cron events measured from the due time (default: 1)', type=int, required=False)
+        wrk_opts.add_argument('--auth-modes', metavar='HASURA_BENCH_AUTH_MODES', help='Run the auth benchmark instead of the query benchmarks, with these (comma separated) modes of authentication, or "all": ' + ', '.join(auth_bench.auth_modes), required=False)
+        wrk_opts.add_argument('--auth-token-pool-size', metavar='HASURA_BENCH_AUTH_TOKEN_POOL_SIZE', help='Auth benchmark: number of distinct tokens the requests rotate through (default: 1000)', type=int, required=False)
+        wrk_opts.add_argument('--auth-webhook-latency', metavar='HASURA_BENCH_AUTH_WEBHOOK_LATENCY', help='Auth benchmark: response time of the auth webhook in milliseconds (default: 0)', type=float, required=False)
+        wrk_opts.add_argument('--auth-webhook-cache-max-age', metavar='HASURA_BENCH_AUTH_WEBHOOK_CACHE_MAX_AGE', help='Auth benchmark: max-age in seconds of the Cache-Control returned by the auth webhook (default: none)', type=int, required=False)
+        wrk_opts.add_argument('--auth-duration', metavar='HASURA_BENCH_AUTH_DURATION', help='Auth benchmark: duration in seconds of the throughput and latency tests (default: 30)', type=int, required=False)
+        wrk_opts.add_argument('--compression-limits', metavar='HASURA_BENCH_COMPRESSION_LIMITS', help='Run the compression benchmark instead of the query benchmarks, with these (comma separated) limits of the list query on hge_events, e.g. 1,10,100,1000,10000', required=False)
+        wrk_opts.add_argument('--compression-duration', metavar='HASURA_BENCH_COMPRESSION_DURATION', help='Compression benchmark: duration in seconds of every run (default: 30)', type=int, required=False)
+        wrk_opts.add_argument('--compression-rps', metavar='HASURA_BENCH_COMPRESSION_RPS', help='Compression benchmark: requests per second of the fixed rate runs (default: half the throughput without compression)', type=int, required=False)
+        wrk_opts.add_argument('--scaling-connections', metavar='HASURA_BENCH_SCALING_CONNECTIONS', help='Run the scalability benchmark instead of the query benchmarks, with these (comma separated) numbers of client connections, e.g. 1,2,4,8,16,32,64,128', required=False)
+        wrk_opts.add_argument('--scaling-hge-cores', metavar='HASURA_BENCH_SCALING_HGE_CORES', help='Scalability benchmark: (comma separated) capabilities of graphql-engine (+RTS -N), each pinned to as many CPUs (default: 1,2,4,8)', required=False)
+        wrk_opts.add_argument('--scaling-pg-connections', metavar='HASURA_BENCH_SCALING_PG_CONNECTIONS', help='Scalability benchmark: (comma separated) Postgres pool sizes of graphql-engine (--connections) (default: that of graphql-engine)', required=False)
+        wrk_opts.add_argument('--scaling-duration', metavar='HASURA_BENCH_SCALING_DURATION', help='Scalability benchmark: duration in seconds of every run (default: 30)', type=int, required=False)
+        wrk_opts.add_argument('--soak-duration', metavar='HASURA_BENCH_SOAK_DURATION', help='Run the soak benchmark instead of the query benchmarks: the workload file, or the queries, at a fixed rate for this many seconds, e.g. 28800', type=int, required=False)
+        wrk_opts.add_argument('--soak-rps', metavar='HASURA_BENCH_SOAK_RPS', help='Soak benchmark: requests per second (default: half the throughput at saturation)', type=int, required=False)
+        wrk_opts.add_argument('--soak-interval', metavar='HASURA_BENCH_SOAK_INTERVAL', help='Soak benchmark: seconds between measurements (default: 60)', type=int, required=False)
+        wrk_opts.add_argument('--soak-window', metavar='HASURA_BENCH_SOAK_WINDOW', help='Soak benchmark: seconds of the sliding windows of the charts (default: 600)', type=int, required=False)
+        wrk_opts.add_argument('--soak-warmup', metavar='HASURA_BENCH_SOAK_WARMUP', help='Soak benchmark: seconds excluded from the trends (default: 600)', type=int, required=False)
+        wrk_opts.add_argument('--soak-dump-interval', metavar='HASURA_BENCH_SOAK_DUMP_INTERVAL', help='Soak benchmark: seconds between dumps of /dev/subscriptions and /dev/plan_cache (default: 600)', type=int, required=False)
+        wrk_opts.add_argument('--generate-queries', metavar='HASURA_BENCH_GENERATE_QUERIES', help='Benchmark queries generated from the foreign key relationships instead of those of the queries file, of these (comma separated) families, or "all": ' + ', '.join(query_gen.families), required=False)
+        wrk_opts.add_argument('--generate-max-depth', metavar='HASURA_BENCH_GENERATE_MAX_DEPTH', help='Generated queries: maximum depth of the chains of relationships (default: 5)', type=int, required=False)
+        wrk_opts.add_argument('--generate-max-breadth', metavar='HASURA_BENCH_GENERATE_MAX_BREADTH', help='Generated queries: maximum number of sibling relationships, filters and aggregates (default: 5)', type=int, required=False)
+        wrk_opts.add_argument('--generate-fan-outs', metavar='HASURA_BENCH_GENERATE_FAN_OUTS', help='Generated queries: (comma separated) limits of the array relationship of the fan_out family (default: 1,10,100,1000)', required=False)
+        wrk_opts.add_argument('--generate-root-limit', metavar='HASURA_BENCH_GENERATE_ROOT_LIMIT', help='Generated queries: limit of the root fields (default: 10)', type=int, required=False)
+        wrk_opts.add_argument('--load-generator', metavar='HASURA_BENCH_LOAD_GENERATOR', help='Load generator to be used for benchmarks. "wrk" runs wrk/wrk2 in docker, "python" uses the native asyncio load generator', choices=HGEWrkBench.load_generators, required=False)
 
     def get_s3_caller_identity(self):
         return boto3.client('sts').get_caller_identity()
 
     def parse_wrk_options(self):
-        self.connections, self.duration, self.graphql_queries_file, self.res_hge_url, upload_root_uri, self.res_hge_admin_secret, self.run_benchmarks, self.scenario_name = \
+        self.connections, self.duration, self.graphql_queries_file, self.res_hge_url, upload_root_uri, self.res_hge_admin_secret, self.run_benchmarks, self.scenario_name, self.load_generator = \
             self.get_params([
                 ('connections', 'HASURA_BENCH_CONNECTIONS'),
                 ('duration', 'HASURA_BENCH_DURATION'),
@@ -519,7 +1497,146 @@ class HGEWrkBenchArgs(HGETestSetupArgs):
                 ('results_hge_admin_secret', 'HASURA_BENCH_RESULTS_HGE_ADMIN_SECRET'),
                 ('run_benchmarks', 'HASURA_BENCH_RUN_BENCHMARKS'),
                 ('set_scenario_name', 'HASURA_BENCH_SCENARIO_NAME'),
+                ('load_generator', 'HASURA_BENCH_LOAD_GENERATOR'),
             ])
+        self.subscriptions, self.subscriptions_per_connection, self.subscription_rows, self.mutation_rate = \
+            self.get_params([
+                'subscriptions',
+                'subscriptions_per_connection',
+                'subscription_rows',
+                'mutation_rate'
+            ])
+        self.subscriptions_per_connection = self.subscriptions_per_connection or 1
+        self.subscription_rows = self.subscription_rows or 100
+        self.mutation_rate = self.mutation_rate or 10
+        self.slo_p99_ms, self.slo_error_rate, self.latency_probes, self.search_trial_duration = \
+            self.get_params([
+                'slo_p99_ms',
+                'slo_error_rate',
+                'latency_probes',
+                'search_trial_duration'
+            ])
+        self.slo_p99_ms = self.slo_p99_ms or 100
+        self.slo_error_rate = self.slo_error_rate or 0.01
+        self.latency_probes = self.latency_probes or 5
+        self.search_trial_duration = self.search_trial_duration or 10
+        self.adaptive_rps = self.parsed_args.adaptive_rps
+        # Zero is a valid sample size, hence not using get_param
+        self.latency_sample_size = self.parsed_args.latency_sample_size
+        if self.latency_sample_size is None:
+            self.latency_sample_size = int(os.getenv('HASURA_BENCH_LATENCY_SAMPLE_SIZE', latency_store.default_reservoir_size))
+        self.keep_raw_latencies = self.parsed_args.keep_raw_latencies
+        self.telemetry_interval = self.get_param('telemetry_interval') or 1
+        self.ab_trials = self.get_param('ab_trials') or 6
+        self.ab_trial_duration = self.get_param('ab_trial_duration') or 10
+        self.workload_file = self.get_param('workload_file', 'HASURA_BENCH_WORKLOAD_FILE')
+        startup_schema_copies = self.get_param('startup_schema_copies')
+        self.startup_schema_copies = [int(c) for c in startup_schema_copies.split(',')] if startup_schema_copies else None
+        self.startup_trials = self.get_param('startup_trials') or 3
+        metadata_tables, metadata_roles = self.get_params(['metadata_tables', 'metadata_roles'])
+        self.metadata_tables = [int(n) for n in metadata_tables.split(',')] if metadata_tables else None
+        self.metadata_roles = [int(m) for m in (metadata_roles or '1').split(',')]
+        self.metadata_one_by_one = not self.parsed_args.metadata_skip_one_by_one
+        remote_join_fan_outs = self.get_param('remote_join_fan_outs')
+        self.remote_join_fan_outs = [int(f) for f in remote_join_fan_outs.split(',')] if remote_join_fan_outs else None
+        self.remote_join_requests = self.get_param('remote_join_requests') or 100
+        plan_cache_shapes, plan_cache_working_sets = self.get_params(['plan_cache_shapes', 'plan_cache_working_sets'])
+        self.plan_cache_kinds = plan_cache_shapes.split(',') if plan_cache_shapes else None
+        for kind in self.plan_cache_kinds or []:
+            if kind not in plan_cache_bench.shape_kinds:
+                raise ValueError('Unknown kind of query shapes: ' + kind)
+        self.plan_cache_working_sets = [int(n) for n in plan_cache_working_sets.split(',')] if plan_cache_working_sets else None
+        self.plan_cache_requests = self.get_param('plan_cache_requests') or 1000
+        self.plan_cache_duration = self.get_param('plan_cache_duration') or 10
+        self.results_parquet_dir, self.results_batch_size = self.get_params(['results_parquet_dir', 'results_batch_size'])
+        mutations, mutation_batch_sizes = self.get_params(['mutations', 'mutation_batch_sizes'])
+        self.mutation_cases = (mutation_bench.mutation_cases if mutations == 'all' else mutations.split(',')) if mutations else None
+        for case in self.mutation_cases or []:
+            if case not in mutation_bench.mutation_cases:
+                raise ValueError('Unknown mutation case: ' + case)
+        self.mutation_batch_sizes = [int(b) for b in mutation_batch_sizes.split(',')] if mutation_batch_sizes else mutation_bench.default_batch_sizes
+        self.mutation_rows = self.get_param('mutation_rows') or 20000
+        self.mutation_concurrency = self.get_param('mutation_concurrency') or 8
+        self.mutation_event_triggers = not self.parsed_args.mutation_skip_event_triggers
+        event_rates, event_http_pool_sizes, event_fetch_intervals, event_webhook_latencies = self.get_params([
+            'event_rates', 'event_http_pool_sizes', 'event_fetch_intervals', 'event_webhook_latencies'
+        ])
+        self.event_rates = [int(r) for r in event_rates.split(',')] if event_rates else None
+        self.event_http_pool_sizes = [int(n) for n in event_http_pool_sizes.split(',')] if event_http_pool_sizes else [None]
+        self.event_fetch_intervals = [int(i) for i in event_fetch_intervals.split(',')] if event_fetch_intervals else [None]
+        self.event_webhook_latencies = [float(l) for l in event_webhook_latencies.split(',')] if event_webhook_latencies else event_bench.default_webhook_latencies_ms
+        self.event_duration = self.get_param('event_duration') or 30
+        self.event_sink_workers = self.get_param('event_sink_workers')
+        scheduled_events, scheduled_cron_triggers = self.get_params(['scheduled_events', 'scheduled_cron_triggers'])
+        self.scheduled_events = [int(n) for n in scheduled_events.split(',')] if scheduled_events else None
+        self.scheduled_cron_triggers = [int(k) for k in scheduled_cron_triggers.split(',')] if scheduled_cron_triggers else [0]
+        self.scheduled_webhook_latency = self.get_param('scheduled_webhook_latency') or 0
+        self.scheduled_tolerance = self.get_param('scheduled_tolerance')
+        self.scheduled_lead_time = self.get_param('scheduled_lead_time') or 90
+        self.scheduled_cron_minutes = self.get_param('scheduled_cron_minutes') or 1
+        auth_modes = self.get_param('auth_modes')
+        self.auth_modes = (auth_bench.auth_modes if auth_modes == 'all' else auth_modes.split(',')) if auth_modes else None
+        for mode in self.auth_modes or []:
+            if mode not in auth_bench.auth_modes:
+                raise ValueError('Unknown auth mode: ' + mode)
+        self.auth_token_pool_size = self.get_param('auth_token_pool_size') or 1000
+        self.auth_webhook_latency = self.get_param('auth_webhook_latency') or 0
+        self.auth_webhook_cache_max_age = self.get_param('auth_webhook_cache_max_age')
+        self.auth_duration = self.get_param('auth_duration') or 30
+        compression_limits = self.get_param('compression_limits')
+        self.compression_limits = [int(l) for l in compression_limits.split(',')] if compression_limits else None
+        self.compression_duration = self.get_param('compression_duration') or 30
+        self.compression_rps = self.get_param('compression_rps')
+        scaling_connections = self.get_param('scaling_connections')
+        self.scaling_connections = [int(c) for c in scaling_connections.split(',')] if scaling_connections else None
+        scaling_hge_cores = self.get_param('scaling_hge_cores')
+        self.scaling_hge_cores = [int(n) for n in scaling_hge_cores.split(',')] if scaling_hge_cores else scaling_bench.default_capabilities
+        scaling_pg_connections = self.get_param('scaling_pg_connections')
+        self.scaling_pg_connections = [int(c) for c in scaling_pg_connections.split(',')] if scaling_pg_connections else [None]
+        self.scaling_duration = self.get_param('scaling_duration') or 30
+        self.soak_duration = self.get_param('soak_duration')
+        self.soak_rps = self.get_param('soak_rps')
+        self.soak_interval = self.get_param('soak_interval') or soak_bench.default_interval
+        self.soak_window = self.get_param('soak_window') or soak_bench.default_window
+        self.soak_warmup = self.get_param('soak_warmup') or soak_bench.default_warmup
+        self.soak_dump_interval = self.get_param('soak_dump_interval') or soak_bench.default_dump_interval
+        generate_queries = self.get_param('generate_queries')
+        self.generate_queries = (query_gen.families if generate_queries == 'all' else generate_queries.split(',')) if generate_queries else None
+        for family in self.generate_queries or []:
+            if family not in query_gen.families:
+                raise ValueError('Unknown query family: ' + family)
+        self.generate_max_depth = self.get_param('generate_max_depth') or query_gen.default_max_depth
+        self.generate_max_breadth = self.get_param('generate_max_breadth') or query_gen.default_max_breadth
+        generate_fan_outs = self.get_param('generate_fan_outs')
+        self.generate_fan_outs = [int(f) for f in generate_fan_outs.split(',')] if generate_fan_outs else query_gen.default_fan_outs
+        self.generate_root_limit = self.get_param('generate_root_limit') or query_gen.default_root_limit
+        # run_tests runs a single benchmark mode
+        modes = [
+            ('--startup-schema-copies', self.startup_schema_copies),
+            ('--metadata-tables', self.metadata_tables),
+            ('--remote-join-fan-outs', self.remote_join_fan_outs),
+            ('--plan-cache-shapes', self.plan_cache_kinds),
+            ('--mutations', self.mutation_cases),
+            ('--event-rates', self.event_rates),
+            ('--scheduled-events', self.scheduled_events),
+            ('--auth-modes', self.auth_modes),
+            ('--compression-limits', self.compression_limits),
+            ('--scaling-connections', self.scaling_connections),
+            ('--soak-duration', self.soak_duration),
+            ('--ab-hge-docker-image/--ab-hge-executable', self.ab_hge_docker_image or self.ab_hge_executable),
+            ('--subscriptions', self.subscriptions)
+        ]
+        selected = [flag for (flag, value) in modes if value]
+        if len(selected) > 1:
+            raise ValueError('Only one benchmark mode can be run at a time, got: ' + ', '.join(selected))
+        if self.workload_file:
+            # wrk's Lua scripts can only send a fixed query
+            if self.load_generator == 'wrk':
+                raise ValueError('Mixed workloads need the python load generator')
+            self.load_generator = 'python'
+        self.load_generator = self.load_generator or 'wrk'
+        if self.load_generator not in HGEWrkBench.load_generators:
+            raise ValueError('Unknown load generator: ' + self.load_generator)
         self.upload_root_uri = None
         if upload_root_uri:
             p = urlparse(upload_root_uri)
@@ -549,10 +1666,89 @@ class HGEWrkBenchWithArgs(HGEWrkBenchArgs, HGEWrkBench):
             skip_stack_build = self.skip_stack_build,
             graphql_queries_file = self.graphql_queries_file,
             connections = self.connections,
-            duration = self.duration
+            duration = self.duration,
+            results_hge_url = self.res_hge_url,
+            results_hge_admin_secret = self.res_hge_admin_secret,
+            load_generator = self.load_generator,
+            subscriptions = self.subscriptions,
+            subscriptions_per_connection = self.subscriptions_per_connection,
+            subscription_rows = self.subscription_rows,
+            mutation_rate = self.mutation_rate,
+            adaptive_rps = self.adaptive_rps,
+            slo_p99_ms = self.slo_p99_ms,
+            slo_error_rate = self.slo_error_rate,
+            latency_probes = self.latency_probes,
+            search_trial_duration = self.search_trial_duration,
+            latency_sample_size = self.latency_sample_size,
+            keep_raw_latencies = self.keep_raw_latencies,
+            workload_file = self.workload_file,
+            telemetry_interval = self.telemetry_interval,
+            ab_hge_docker_image = self.ab_hge_docker_image,
+            ab_hge_executable = self.ab_hge_executable,
+            ab_trials = self.ab_trials,
+            ab_trial_duration = self.ab_trial_duration,
+            scale_factor = self.scale_factor,
+            snapshot_dir = self.snapshot_dir,
+            startup_schema_copies = self.startup_schema_copies,
+            startup_trials = self.startup_trials,
+            metadata_tables = self.metadata_tables,
+            metadata_roles = self.metadata_roles,
+            metadata_one_by_one = self.metadata_one_by_one,
+            remote_join_fan_outs = self.remote_join_fan_outs,
+            remote_join_requests = self.remote_join_requests,
+            plan_cache_kinds = self.plan_cache_kinds,
+            plan_cache_working_sets = self.plan_cache_working_sets,
+            plan_cache_requests = self.plan_cache_requests,
+            plan_cache_duration = self.plan_cache_duration,
+            results_parquet_dir = self.results_parquet_dir,
+            results_batch_size = self.results_batch_size,
+            mutation_cases = self.mutation_cases,
+            mutation_batch_sizes = self.mutation_batch_sizes,
+            mutation_rows = self.mutation_rows,
+            mutation_concurrency = self.mutation_concurrency,
+            mutation_event_triggers = self.mutation_event_triggers,
+            event_rates = self.event_rates,
+            event_http_pool_sizes = self.event_http_pool_sizes,
+            event_fetch_intervals = self.event_fetch_intervals,
+            event_webhook_latencies = self.event_webhook_latencies,
+            event_duration = self.event_duration,
+            event_sink_workers = self.event_sink_workers,
+            scheduled_events = self.scheduled_events,
+            scheduled_cron_triggers = self.scheduled_cron_triggers,
+            scheduled_webhook_latency = self.scheduled_webhook_latency,
+            scheduled_tolerance = self.scheduled_tolerance,
+            scheduled_lead_time = self.scheduled_lead_time,
+            scheduled_cron_minutes = self.scheduled_cron_minutes,
+            auth_modes = self.auth_modes,
+            auth_token_pool_size = self.auth_token_pool_size,
+            auth_webhook_latency = self.auth_webhook_latency,
+            auth_webhook_cache_max_age = self.auth_webhook_cache_max_age,
+            auth_duration = self.auth_duration,
+            compression_limits = self.compression_limits,
+            compression_duration = self.compression_duration,
+            compression_rps = self.compression_rps,
+            scaling_connections = self.scaling_connections,
+            scaling_hge_cores = self.scaling_hge_cores,
+            scaling_pg_connections = self.scaling_pg_connections,
+            scaling_duration = self.scaling_duration,
+            soak_duration = self.soak_duration,
+            soak_rps = self.soak_rps,
+            soak_interval = self.soak_interval,
+            soak_window = self.soak_window,
+            soak_warmup = self.soak_warmup,
+            soak_dump_interval = self.soak_dump_interval,
+            generate_queries = self.generate_queries,
+            generate_max_depth = self.generate_max_depth,
+            generate_max_breadth = self.generate_max_breadth,
+            generate_fan_outs = self.generate_fan_outs,
+            generate_root_limit = self.generate_root_limit
         )
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['compare']:
+        sys.exit(compare.main(sys.argv[2:]))
+    if sys.argv[1:2] == ['export-results']:
+        sys.exit(results_store.main(sys.argv[2:]))
     bench = HGEWrkBenchWithArgs()
     bench.run_tests()
 
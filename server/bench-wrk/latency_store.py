@@ -0,0 +1,218 @@
+"""
+Compact storage of latency samples.
+
+Instead of a text file with one line per latency sample, a benchmark run
+stores an encoded (compressed) HdrHistogram of the latencies, and optionally a
+uniformly downsampled reservoir of the samples. latencies_uri of a result
+points to the histogram file; the reservoir, when present, sits next to it.
+
+Older results whose latencies_uri points to the raw 'latencies' text file can
+still be read.
+"""
+
+import os
+import random
+from collections import OrderedDict
+from io import BytesIO
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+from hdrh.histogram import HdrHistogram
+
+# Latencies are in microseconds
+LOWEST_LATENCY = 1
+HIGHEST_LATENCY = 60 * 60 * 1000 * 1000
+SIGNIFICANT_DIGITS = 3
+
+RAW_FILE = 'latencies'
+HISTOGRAM_FILE = 'latencies.hdr'
+SAMPLE_FILE = 'latencies.sample.npy'
+
+default_reservoir_size = 10000
+
+
+def new_histogram():
+    return HdrHistogram(LOWEST_LATENCY, HIGHEST_LATENCY, SIGNIFICANT_DIGITS)
+
+
+def clamp(latency_us):
+    return max(LOWEST_LATENCY, min(int(latency_us), HIGHEST_LATENCY))
+
+
+class Reservoir:
+    """Uniform random sample of a stream of values (Algorithm R)"""
+
+    def __init__(self, size, rng=random):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.values = []
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            i = self.rng.randrange(self.seen)
+            if i < self.size:
+                self.values[i] = value
+
+    def merge(self, other):
+        """Merge with another reservoir, keeping the sample uniform over both streams"""
+        merged = Reservoir(self.size, self.rng)
+        merged.seen = self.seen + other.seen
+        if merged.seen == 0:
+            return merged
+        # Take from each reservoir in proportion to the values it has seen
+        n = min(self.size, len(self.values) + len(other.values))
+        from_self = min(len(self.values), int(round(n * self.seen / float(merged.seen))))
+        from_other = min(len(other.values), n - from_self)
+        merged.values = self.rng.sample(self.values, from_self) + self.rng.sample(other.values, from_other)
+        return merged
+
+
+def write_histogram(histogram, results_dir):
+    path = os.path.join(results_dir, HISTOGRAM_FILE)
+    with open(path, 'wb') as f:
+        f.write(histogram.encode())
+    return path
+
+
+def write_sample(values, results_dir):
+    path = os.path.join(results_dir, SAMPLE_FILE)
+    np.save(path, np.array(values, dtype=np.uint32))
+    return path
+
+
+def compact_raw_latencies(results_dir, reservoir_size=default_reservoir_size, keep_raw=False):
+    """
+    Convert the raw latencies file written by the wrk2 Lua scripts into a
+    histogram and a reservoir sample. Returns the paths of the files written
+    """
+    raw_file = os.path.join(results_dir, RAW_FILE)
+    histogram = new_histogram()
+    reservoir = Reservoir(reservoir_size)
+    with open(raw_file) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                v = clamp(float(line))
+                histogram.record_value(v)
+                reservoir.add(v)
+    files = [write_histogram(histogram, results_dir)]
+    if reservoir_size:
+        files.append(write_sample(reservoir.values, results_dir))
+    if not keep_raw:
+        os.remove(raw_file)
+    return files
+
+
+def uri_read(uri):
+    p = urlparse(uri)
+    if p.scheme == 'file':
+        with urlopen(uri) as f:
+            return f.read()
+    elif p.scheme == 's3':
+        s3 = boto3.resource('s3')
+        obj = s3.Object(bucket_name=p.netloc, key=p.path.lstrip('/'))
+        with BytesIO() as data:
+            obj.download_fileobj(data)
+            return data.getvalue()
+    raise ValueError('Unsupported latencies uri: ' + uri)
+
+
+def is_histogram_uri(uri):
+    return urlparse(uri).path.endswith(HISTOGRAM_FILE)
+
+
+def sample_uri(histogram_uri):
+    return histogram_uri[:-len(HISTOGRAM_FILE)] + SAMPLE_FILE
+
+
+def load_histogram(uri):
+    return HdrHistogram.decode(uri_read(uri))
+
+
+def histogram_distribution(histogram):
+    """The recorded values of the histogram and their counts, as arrays"""
+    values = []
+    counts = []
+    for item in histogram.get_recorded_iterator():
+        values.append(item.value_iterated_to)
+        counts.append(item.count_at_value_iterated_to)
+    return (np.array(values, dtype=np.float64), np.array(counts, dtype=np.int64))
+
+
+def load_raw(uri):
+    # Parses the whole file in one go, rather than a float() per line
+    return np.fromstring(uri_read(uri).decode(), dtype=np.float64, sep=' ')
+
+
+def load_distribution(uri):
+    """
+    Sorted latencies (in microseconds) and their counts, without expanding
+    histograms
+    """
+    if is_histogram_uri(uri):
+        return histogram_distribution(load_histogram(uri))
+    (values, counts) = np.unique(load_raw(uri), return_counts=True)
+    return (values, counts.astype(np.int64))
+
+
+def load_sample(uri, max_samples=default_reservoir_size, rng=np.random):
+    """
+    A uniform sample of at most max_samples latencies (in microseconds). Uses
+    the stored reservoir if there is one, otherwise draws from the histogram
+    """
+    if is_histogram_uri(uri):
+        try:
+            values = np.load(BytesIO(uri_read(sample_uri(uri)))).astype(np.float64)
+        except (OSError, ClientError):
+            (bins, counts) = load_distribution(uri)
+            size = min(max_samples, int(counts.sum()))
+            return rng.choice(bins, size, p=counts / float(counts.sum()))
+    else:
+        values = load_raw(uri)
+    if len(values) > max_samples:
+        values = rng.choice(values, max_samples, replace=False)
+    return values
+
+
+class LatencyCache:
+    """
+    Least recently used cache of latency arrays, keyed by latencies_uri. Least
+    recently used entries are evicted once the arrays held exceed max_bytes
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, max_samples=default_reservoir_size):
+        self.max_bytes = max_bytes
+        self.max_samples = max_samples
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key, load):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = load()
+        self.entries[key] = value
+        self.size += self.nbytes(value)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            (_, evicted) = self.entries.popitem(last=False)
+            self.size -= self.nbytes(evicted)
+        return value
+
+    @staticmethod
+    def nbytes(value):
+        if isinstance(value, tuple):
+            return sum(a.nbytes for a in value)
+        return value.nbytes
+
+    def distribution(self, uri):
+        return self.get(('distribution', uri), lambda: load_distribution(uri))
+
+    def sample(self, uri):
+        return self.get(('sample', uri), lambda: load_sample(uri, self.max_samples))
@@ -0,0 +1,401 @@
+"""
+A native Python replacement for the wrk/wrk2 docker images used by
+hge_wrk_bench.py.
+
+Each worker process runs its own asyncio event loop (uvloop when it is
+installed) and drives a share of the connections. In constant throughput mode
+every connection follows a fixed request schedule, and latencies are measured
+from the time a request was *supposed* to be sent, which is how wrk2 corrects
+for coordinated omission. summary.json and the 'Detailed Percentile spectrum'
+text have the same shape as those produced by the Lua scripts in
+wrk-websocket-server/bench_scripts. Latencies are stored as described in
+latency_store.py.
+"""
+
+import asyncio
+import datetime
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import aiohttp
+
+import latency_store
+from latency_store import new_histogram, LOWEST_LATENCY, HIGHEST_LATENCY
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+class LoadGeneratorError(Exception):
+    """Exception type for the load generator"""
+
+
+def new_event_loop():
+    if uvloop:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def split_evenly(total, parts):
+    """Split an integer total into parts which differ by at most one"""
+    (q, r) = divmod(total, parts)
+    return [q + 1 if i < r else q for i in range(parts)]
+
+
+class WorkerStats:
+
+    def __init__(self, reservoir_size):
+        self.histogram = new_histogram()
+        self.reservoir = latency_store.Reservoir(reservoir_size)
+        self.requests = 0
+        self.bytes = 0
+        self.errors = {
+            'connect': 0,
+            'read': 0,
+            'write': 0,
+            'status': 0,
+            'timeout': 0
+        }
+        # Number of requests completed in every second of the run
+        self.per_second = {}
+        # Latency histograms and error counts of every operation of a
+        # mixed workload
+        self.operations = {}
+
+    def operation(self, op):
+        if op not in self.operations:
+            self.operations[op] = {'histogram': new_histogram(), 'errors': 0}
+        return self.operations[op]
+
+    def record(self, latency_us, completed_at, op=None):
+        latency_us = max(LOWEST_LATENCY, min(int(latency_us), HIGHEST_LATENCY))
+        self.histogram.record_value(latency_us)
+        self.reservoir.add(latency_us)
+        self.requests += 1
+        sec = int(completed_at)
+        self.per_second[sec] = self.per_second.get(sec, 0) + 1
+        if op is not None:
+            self.operation(op)['histogram'].record_value(latency_us)
+
+    def record_error(self, kind, op=None):
+        self.errors[kind] += 1
+        if op is not None:
+            self.operation(op)['errors'] += 1
+
+    def as_result(self):
+        return {
+            'histogram': self.histogram.encode(),
+            'sample': (self.reservoir.seen, self.reservoir.values),
+            'requests': self.requests,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'per_second': list(self.per_second.values()),
+            'operations': {
+                op: {'histogram': v['histogram'].encode(), 'errors': v['errors']}
+                for (op, v) in self.operations.items()
+            }
+        }
+
+
+async def run_connection(session, request, stats, start, deadline, interval):
+    """
+    Send requests one after another on a single connection till the deadline.
+    If interval is given, request n is scheduled at start + n*interval and its
+    latency is measured from that scheduled time (coordinated omission
+    correction). Otherwise requests are sent back to back.
+    """
+    loop = asyncio.get_event_loop()
+    n = 0
+    while True:
+        now = loop.time()
+        if interval:
+            intended = start + n * interval
+            if intended >= deadline:
+                break
+            if intended > now:
+                await asyncio.sleep(intended - now)
+        else:
+            if now >= deadline:
+                break
+            intended = now
+        n += 1
+        (op, url, body, headers) = request()
+        try:
+            async with session.post(url, data=body, headers=headers) as resp:
+                payload = await resp.read()
+                stats.bytes += len(payload)
+                if resp.status > 399:
+                    stats.record_error('status', op)
+        except asyncio.TimeoutError:
+            stats.record_error('timeout', op)
+            continue
+        except aiohttp.ClientConnectorError:
+            stats.record_error('connect', op)
+            continue
+        except aiohttp.ClientError:
+            stats.record_error('read', op)
+            continue
+        end = loop.time()
+        stats.record((end - intended) * 1000000, end - start, op)
+
+
+async def run_worker_async(url, body, headers, connections, rps, duration, start_time, timeout, reservoir_size, workload=None, seed=None, decompress=True):
+    loop = asyncio.get_event_loop()
+    stats = WorkerStats(reservoir_size)
+    if connections == 0:
+        return stats
+    # Convert the common wall clock start time to this loop's clock
+    start = loop.time() + max(0.0, start_time - time.time())
+    deadline = start + duration
+    interval = connections / float(rps) if rps else None
+    connector = aiohttp.TCPConnector(limit=connections, force_close=False)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    if workload:
+        # Every request is sampled from the mix of operations
+        rng = random.Random(seed)
+
+        def request():
+            (op, op_body, op_headers) = workload.sample(rng)
+            return (op, url, op_body, {**headers, **op_headers})
+    else:
+        def request():
+            return (None, url, body, headers)
+
+    # Without decompression, the bytes counted are those of the (compressed) bodies on the wire
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout, auto_decompress=decompress) as session:
+        # Stagger the connections within one interval so that requests are
+        # spread uniformly instead of being sent in bursts
+        conns = [
+            run_connection(
+                session, request, stats,
+                start + (i * interval / connections if interval else 0),
+                deadline, interval
+            )
+            for i in range(connections)
+        ]
+        await asyncio.gather(*conns)
+    return stats
+
+
+def run_worker(worker_args):
+    loop = new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        stats = loop.run_until_complete(run_worker_async(*worker_args))
+    finally:
+        loop.close()
+    return stats.as_result()
+
+
+def get_stat_summary(values):
+    """Same shape as get_stat_summary in bench-lib-wrk2.lua"""
+    if not values:
+        return {'min': 0, 'max': 0, 'stdev': 0, 'mean': 0, 'dist': {}}
+    values = sorted(values)
+    mean = sum(values) / float(len(values))
+    stdev = math.sqrt(sum((x - mean) ** 2 for x in values) / float(len(values)))
+
+    def percentile(p):
+        return values[min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1)]
+    return {
+        'min': values[0],
+        'max': values[-1],
+        'stdev': stdev,
+        'mean': mean,
+        'dist': {str(p): percentile(p) for p in [95, 98, 99]}
+    }
+
+
+def get_histogram_summary(histogram):
+    return {
+        'min': histogram.get_min_value(),
+        'max': histogram.get_max_value(),
+        'stdev': histogram.get_stddev(),
+        'mean': histogram.get_mean_value(),
+        'dist': {
+            str(p): histogram.get_value_at_percentile(p)
+            for p in [95, 98, 99]
+        }
+    }
+
+
+def get_operation_summary(histogram, errors, duration):
+    """Latency summary (in microseconds) of an operation of a mixed workload"""
+    requests = histogram.get_total_count()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'requests_per_sec': requests / float(duration),
+        'latency': {
+            'mean': histogram.get_mean_value(),
+            'max': histogram.get_max_value(),
+            'dist': {
+                str(p): histogram.get_value_at_percentile(p)
+                for p in [50, 90, 95, 99, 99.9]
+            }
+        }
+    }
+
+
+def merge_worker_results(worker_results, duration, reservoir_size):
+    histogram = new_histogram()
+    reservoir = latency_store.Reservoir(reservoir_size)
+    per_second = []
+    errors = {}
+    operations = {}
+    requests = 0
+    total_bytes = 0
+    for res in worker_results:
+        histogram.decode_and_add(res['histogram'])
+        worker_reservoir = latency_store.Reservoir(reservoir_size)
+        (worker_reservoir.seen, worker_reservoir.values) = res['sample']
+        reservoir = reservoir.merge(worker_reservoir)
+        per_second.extend(res['per_second'])
+        requests += res['requests']
+        total_bytes += res['bytes']
+        for (k, v) in res['errors'].items():
+            errors[k] = errors.get(k, 0) + v
+        for (op, v) in res['operations'].items():
+            if op not in operations:
+                operations[op] = {'histogram': new_histogram(), 'errors': 0}
+            operations[op]['histogram'].decode_and_add(v['histogram'])
+            operations[op]['errors'] += v['errors']
+    summary = {
+        'time': datetime.datetime.now().astimezone().strftime('%c %Z'),
+        'latency': get_histogram_summary(histogram),
+        'summary': {
+            'duration': int(duration * 1000000),
+            'requests': requests,
+            'bytes': total_bytes,
+            'errors': errors
+        },
+        'requests': get_stat_summary(per_second)
+    }
+    if operations:
+        summary['operations'] = {
+            op: get_operation_summary(v['histogram'], v['errors'], duration)
+            for (op, v) in operations.items()
+        }
+    return (histogram, reservoir.values, summary)
+
+
+class TextWriter(io.StringIO):
+    """A text buffer which also accepts bytes, whatever hdrh writes to it"""
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        return super().write(data)
+
+
+def percentile_spectrum(histogram):
+    """The 'Detailed Percentile spectrum' section of wrk2's output, in milliseconds"""
+    out = TextWriter()
+    out.write('  Detailed Percentile spectrum:\n')
+    histogram.output_percentile_distribution(out, 1000.0)
+    return out.getvalue()
+
+
+def format_output(url, histogram, summary, threads, connections, duration):
+    """
+    Mimic wrk2's text output, so that it can be parsed by
+    HGEWrkBench.get_latency_histogram
+    """
+    out = TextWriter()
+    out.write('Running {}s test @ {}\n'.format(duration, url))
+    out.write('  {} threads and {} connections\n'.format(threads, connections))
+    out.write('  Latency Distribution (HdrHistogram - Recorded Latency)\n')
+    for p in [50, 75, 90, 99, 99.9, 99.99, 99.999, 100]:
+        out.write('{:7.3f}%  {:.2f}ms\n'.format(p, histogram.get_value_at_percentile(p) / 1000.0))
+    out.write('\n' + percentile_spectrum(histogram))
+    out.write('----------------------------------------------------------\n')
+    reqs = summary['summary']['requests']
+    out.write('  {} requests in {:.2f}s, {} bytes read\n'.format(reqs, duration, summary['summary']['bytes']))
+    errors = summary['summary']['errors']
+    if any(errors.values()):
+        out.write('  Socket errors: connect {connect}, read {read}, write {write}, timeout {timeout}\n'.format(**errors))
+        out.write('  Non-2xx or 3xx responses: {status}\n'.format(**errors))
+    out.write('Requests/sec: {:.2f}\n'.format(reqs / float(duration)))
+    return out.getvalue()
+
+
+def pin_cpus(cpus):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+
+def run_load(url, body, headers, threads, connections, duration, rps=None, timeout=60, reservoir_size=latency_store.default_reservoir_size, workload=None, cpus=None, decompress=True):
+    """
+    Run the load in `threads` worker processes, each with its own event loop.
+    With rps set, the load is open-loop at a constant throughput (wrk2);
+    otherwise every connection sends requests back to back (wrk).
+    If a workload (see workload.py) is given, every request is sampled from
+    it instead of sending body, and latencies are also reported per operation.
+    The worker processes are pinned to cpus, if given. With decompress=False,
+    compressed responses are not decompressed, and the bytes reported are the
+    bytes of the response bodies on the wire.
+    """
+    threads = max(1, min(threads, connections))
+    conn_shares = split_evenly(connections, threads)
+    # Give every worker a share of the rate proportional to its connections
+    rps_shares = [rps * c / float(connections) if rps else None for c in conn_shares]
+    # Let all the workers start at the same time, after they have been forked
+    start_time = time.time() + 1
+    worker_args = [
+        (url, body, headers, c, r, duration, start_time, timeout, reservoir_size,
+         workload, workload.seed + i if workload else None, decompress)
+        for (i, (c, r)) in enumerate(zip(conn_shares, rps_shares))
+    ]
+    with multiprocessing.Pool(threads, initializer=pin_cpus, initargs=(cpus,)) as pool:
+        worker_results = pool.map(run_worker, worker_args)
+    return merge_worker_results(worker_results, duration, reservoir_size)
+
+
+def graphql_request_body(query_str):
+    return json.dumps({'query': query_str})
+
+
+def run_wrk2(url, query_str, headers, rps, threads, connections, duration, results_dir, reservoir_size=latency_store.default_reservoir_size, workload=None, cpus=None):
+    """
+    Equivalent of running bench-wrk2.lua with wrk2. Writes summary.json, the
+    latency histogram and a sample of latencies into results_dir, and returns
+    wrk2 like text output. With a workload, query_str is not used.
+    """
+    (histogram, sample, summary) = run_load(
+        url, graphql_request_body(query_str) if query_str else None, headers,
+        threads, connections, duration, rps=rps, reservoir_size=reservoir_size,
+        workload=workload, cpus=cpus
+    )
+    with open(os.path.join(results_dir, 'summary.json'), 'w') as f:
+        f.write(json.dumps(summary) + '\n')
+    latency_store.write_histogram(histogram, results_dir)
+    if reservoir_size:
+        latency_store.write_sample(sample, results_dir)
+    return format_output(url, histogram, summary, threads, connections, duration)
+
+
+def run_wrk(url, query_str, headers, threads, connections, duration, workload=None, cpus=None):
+    """
+    Equivalent of running bench-wrk.lua with wrk. Returns the same output as
+    what the done hook of bench-lib-wrk.lua writes
+    """
+    (_, _, summary) = run_load(
+        url, graphql_request_body(query_str) if query_str else None, headers,
+        threads, connections, duration, workload=workload, cpus=cpus
+    )
+    result = {
+        'time': summary['time'],
+        'summary': summary['summary'],
+        'requests': summary['requests']
+    }
+    if 'operations' in summary:
+        result['operations'] = summary['operations']
+    return result
@@ -0,0 +1,240 @@
+"""
+Metadata scale benchmark.
+
+Synthesises N tables, each referring to the previous one with a foreign key
+(a chain), and M roles with a row level select permission on every table. For
+every (N, M), the metadata (tracking the tables, an object and an array
+relationship along each foreign key, and the permissions) is applied:
+- one call at a time, measuring the latency of every call by its type
+- in a single bulk call
+and then measured are the time taken by reload_metadata, the latency of the
+introspection query (as admin, and as one of the roles), and the resident
+memory of graphql-engine. Every metadata call rebuilds the schema cache, so
+applying it one call at a time is quadratic in the size of the metadata.
+"""
+
+import json
+import time
+
+import graphql
+import numpy as np
+import pandas as pd
+import requests
+
+# Avoid tkinter dependency
+import matplotlib
+matplotlib.use('agg')
+import matplotlib.pyplot as plt
+
+from psycopg2.sql import SQL, Identifier
+
+schema = 'hge_metadata_bench'
+
+# Introspection queries timed at every step
+introspection_repeats = 5
+
+
+def table_name(i):
+    return 't_{}'.format(i)
+
+
+def role_name(j):
+    return 'role_{}'.format(j)
+
+
+def create_tables(pg, n):
+    """Tables t_0 .. t_(n-1), t_i referring to t_(i-1)"""
+    print("Creating {} tables in schema {}".format(n, schema))
+    with pg.cursor() as cursor:
+        cursor.execute(SQL('DROP SCHEMA IF EXISTS {} CASCADE; CREATE SCHEMA {};').format(
+            Identifier(schema), Identifier(schema)))
+        for i in range(n):
+            parent = SQL('') if i == 0 else SQL(', parent_id integer references {}.{} (id)').format(
+                Identifier(schema), Identifier(table_name(i - 1)))
+            cursor.execute(SQL('CREATE TABLE {}.{} (id serial primary key, name text, owner_id integer{});').format(
+                Identifier(schema), Identifier(table_name(i)), parent))
+
+
+def drop_tables(pg):
+    pg.drop_schema(schema)
+
+
+def qualified(i):
+    return {'schema': schema, 'name': table_name(i)}
+
+
+def track_table_queries(n):
+    return [{'type': 'track_table', 'args': qualified(i)} for i in range(n)]
+
+
+def relationship_queries(n):
+    queries = []
+    for i in range(1, n):
+        queries.append({
+            'type': 'create_object_relationship',
+            'args': {'table': qualified(i), 'name': 'parent', 'using': {'foreign_key_constraint_on': 'parent_id'}}
+        })
+        queries.append({
+            'type': 'create_array_relationship',
+            'args': {
+                'table': qualified(i - 1), 'name': 'children',
+                'using': {'foreign_key_constraint_on': {'table': qualified(i), 'column': 'parent_id'}}
+            }
+        })
+    return queries
+
+
+def permission_queries(n, m):
+    return [
+        {
+            'type': 'create_select_permission',
+            'args': {
+                'table': qualified(i),
+                'role': role_name(j),
+                'permission': {
+                    'columns': ['id', 'name', 'owner_id'] + (['parent_id'] if i > 0 else []),
+                    'filter': {'owner_id': {'_eq': 'X-Hasura-User-Id'}}
+                }
+            }
+        }
+        for j in range(m)
+        for i in range(n)
+    ]
+
+
+def metadata_queries(n, m):
+    """The metadata calls, in the order they have to be applied"""
+    return track_table_queries(n) + relationship_queries(n) + permission_queries(n, m)
+
+
+def timed_v1q(hge, q):
+    start = time.perf_counter()
+    resp = requests.post(hge.url + '/v1/query', json.dumps(q), headers=hge.admin_auth_headers())
+    elapsed = time.perf_counter() - start
+    assert resp.status_code == 200, (resp.status_code, resp.json())
+    return elapsed
+
+
+def latency_stats(latencies):
+    latencies = np.array(latencies) * 1000.0
+    return {
+        'calls': len(latencies),
+        'total_s': float(latencies.sum()) / 1000.0,
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        # Latency of the last calls, when the metadata is the largest
+        'last_10pct_mean_ms': float(latencies[-max(1, len(latencies) // 10):].mean())
+    }
+
+
+def apply_one_by_one(hge, queries):
+    """Apply the metadata calls one by one. Returns the latency stats by type of call"""
+    by_type = {}
+    for q in queries:
+        by_type.setdefault(q['type'], []).append(timed_v1q(hge, q))
+    out = {t: latency_stats(lats) for (t, lats) in by_type.items()}
+    out['total_s'] = sum(s['total_s'] for s in out.values())
+    return out
+
+
+def apply_bulk(hge, queries):
+    return timed_v1q(hge, {'type': 'bulk', 'args': queries})
+
+
+def time_introspection(hge, headers=None):
+    query = {'query': graphql.get_introspection_query()}
+    latencies = []
+    for _ in range(introspection_repeats):
+        start = time.perf_counter()
+        resp = requests.post(hge.url + '/v1/graphql', json.dumps(query), headers={**hge.admin_auth_headers(), **(headers or {})})
+        latencies.append(time.perf_counter() - start)
+        assert resp.status_code == 200 and 'errors' not in resp.json(), resp.text
+    return {
+        'median_ms': float(np.median(latencies)) * 1000.0,
+        'min_ms': float(min(latencies)) * 1000.0,
+        'response_bytes': len(resp.content)
+    }
+
+
+def measure_point(hge, original_metadata, n, m, one_by_one=True):
+    """Measurements for n tables and m roles. The tables have to be created already"""
+    queries = metadata_queries(n, m)
+    out = {
+        'tables': n,
+        'roles': m,
+        'relationships': len(relationship_queries(n)),
+        'permissions': n * m,
+        'metadata_calls': len(queries)
+    }
+    if one_by_one:
+        hge.replace_metadata(original_metadata)
+        print("Applying {} metadata calls one by one".format(len(queries)))
+        out['one_by_one'] = apply_one_by_one(hge, queries)
+    hge.replace_metadata(original_metadata)
+    print("Applying {} metadata calls in bulk".format(len(queries)))
+    out['bulk_s'] = apply_bulk(hge, queries)
+    out['reload_metadata_s'] = timed_v1q(hge, {'type': 'reload_metadata', 'args': {}})
+    out['introspection'] = {'admin': time_introspection(hge)}
+    if m > 0:
+        out['introspection']['role'] = time_introspection(
+            hge, {'X-Hasura-Role': role_name(0), 'X-Hasura-User-Id': '1'})
+    process = hge.get_process_stats()
+    # Not the peak (VmHWM): it is over the whole lifetime of the process, so
+    # would be the same for every point after the largest one
+    out['memory'] = {'rss_bytes': process['rss_bytes'] if process else None}
+    return out
+
+
+def run_metadata_benchmark(hge, pg, table_counts, role_counts, one_by_one=True):
+    """
+    Yields the measurements for every number of tables and of roles, growing.
+    The metadata of hge is restored afterwards
+    """
+    original_metadata = hge.export_metadata()
+    try:
+        for n in sorted(set(table_counts)):
+            create_tables(pg, n)
+            for m in sorted(set(role_counts)):
+                print("Metadata benchmark with {} tables and {} roles".format(n, m))
+                yield measure_point(hge, original_metadata, n, m, one_by_one)
+            hge.replace_metadata(original_metadata)
+    finally:
+        hge.replace_metadata(original_metadata)
+        drop_tables(pg)
+
+
+def scaling_table(results):
+    """The scaling curve, one row per number of tables and of roles"""
+    rows = []
+    for r in results:
+        rows.append({
+            'tables': r['tables'],
+            'roles': r['roles'],
+            'metadata calls': r['metadata_calls'],
+            'one by one (s)': r['one_by_one']['total_s'] if 'one_by_one' in r else None,
+            'bulk (s)': r['bulk_s'],
+            'reload_metadata (s)': r['reload_metadata_s'],
+            'introspection (ms)': r['introspection']['admin']['median_ms'],
+            'rss (MB)': r['memory']['rss_bytes'] / (1024 * 1024) if r['memory']['rss_bytes'] else None
+        })
+    return pd.DataFrame(rows)
+
+
+def plot_scaling(df, out_file):
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+    for roles, group in df.groupby('roles'):
+        label = '{} roles'.format(roles)
+        for (column, style) in [('bulk (s)', '-'), ('one by one (s)', '--'), ('reload_metadata (s)', ':')]:
+            if group[column].notnull().any():
+                axes[0].plot(group['tables'], group[column], style, marker='o', label='{}, {}'.format(column, label))
+        axes[1].plot(group['tables'], group['introspection (ms)'], marker='o', label=label)
+        axes[2].plot(group['tables'], group['rss (MB)'], marker='o', label=label)
+    for (ax, ylabel) in zip(axes, ['Time (s)', 'Introspection latency (ms)', 'Resident memory (MB)']):
+        ax.set(xlabel='Tables', ylabel=ylabel)
+        ax.set_xscale('log')
+        ax.grid(True)
+        ax.legend(fontsize='small')
+    fig.savefig(out_file, bbox_inches='tight', dpi=100)
+    plt.close(fig)
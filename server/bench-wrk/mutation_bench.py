@@ -0,0 +1,344 @@
+"""
+Mutation benchmark.
+
+Mutations are run on two synthetic tables, parents and children (with a
+foreign key to parents), tracked with an object relationship children.parent
+and an array relationship parents.children. The cases are:
+- insert: insert_parents with batches of 1 to 10k objects
+- insert_nested_array: parents inserted along with their children
+- insert_nested_object: children inserted along with their parent
+- update_inc / update_set: update_parents_by_pk with _inc / _set
+- delete_by_pk: delete_parents_by_pk
+- delete_by_predicate: delete_parents of the rows having a value
+Every case is run without and with an event trigger (on insert, update and
+delete) on the parents table. Its webhook is a WebhookSink, responding at
+once, so the cases with the trigger include the delivery of the events by
+graphql-engine (fetching them, calling the webhook and writing the
+invocation logs), running alongside the mutations, on top of capturing them.
+
+The tables are emptied (and seeded for updates and deletes) before every
+case, so that runs can be repeated. Every case sends its mutations with a
+number of concurrent clients, and measures the latencies of the requests, the
+rows affected per second, the bytes of WAL written by Postgres, and the number
+of backends waiting for locks, sampled during the case.
+"""
+
+import concurrent.futures
+import json
+import threading
+import time
+
+import numpy as np
+import requests
+from psycopg2.sql import SQL, Identifier
+
+from webhook_sink import WebhookSink
+
+schema = 'hge_mutation_bench'
+
+tables = ['parents', 'children']
+
+event_trigger_name = 'hge_mutation_bench_parents'
+
+default_batch_sizes = [1, 10, 100, 1000, 10000]
+
+mutation_cases = [
+    'insert', 'insert_nested_array', 'insert_nested_object',
+    'update_inc', 'update_set', 'delete_by_pk', 'delete_by_predicate'
+]
+
+# Children of every parent in nested inserts
+children_per_parent = 10
+
+# Distinct values of parents.value, i.e. rows deleted by a predicate are rows / value_buckets
+value_buckets = 100
+
+lock_wait_sample_interval = 0.1
+
+
+def create_tables(pg):
+    print("Creating tables of schema", schema)
+    with pg.cursor() as cursor:
+        cursor.execute(SQL('''
+        DROP SCHEMA IF EXISTS {schema} CASCADE;
+        CREATE SCHEMA {schema};
+        CREATE TABLE {schema}.parents (
+          id serial primary key,
+          name text not null,
+          value integer not null,
+          updated_at timestamptz not null default now()
+        );
+        CREATE INDEX ON {schema}.parents (value);
+        CREATE TABLE {schema}.children (
+          id serial primary key,
+          parent_id integer not null references {schema}.parents (id) on delete cascade,
+          name text not null,
+          value integer not null
+        );
+        CREATE INDEX ON {schema}.children (parent_id);
+        ''').format(schema=Identifier(schema)))
+
+
+def track_tables(hge):
+    hge.run_bulk(
+        [{'type': 'track_table', 'args': {'schema': schema, 'name': t}} for t in tables] + [
+            {
+                'type': 'create_object_relationship',
+                'args': {
+                    'table': {'schema': schema, 'name': 'children'},
+                    'name': 'parent',
+                    'using': {'foreign_key_constraint_on': 'parent_id'}
+                }
+            },
+            {
+                'type': 'create_array_relationship',
+                'args': {
+                    'table': {'schema': schema, 'name': 'parents'},
+                    'name': 'children',
+                    'using': {'foreign_key_constraint_on': {'table': {'schema': schema, 'name': 'children'}, 'column': 'parent_id'}}
+                }
+            }
+        ]
+    )
+
+
+def create_event_trigger(hge, webhook):
+    hge.v1q({
+        'type': 'create_event_trigger',
+        'args': {
+            'name': event_trigger_name,
+            'table': {'schema': schema, 'name': 'parents'},
+            'webhook': webhook,
+            'insert': {'columns': '*'},
+            'update': {'columns': '*'},
+            'delete': {'columns': '*'},
+            'retry_conf': {'num_retries': 0}
+        }
+    })
+
+
+def delete_event_trigger(hge):
+    hge.v1q({'type': 'delete_event_trigger', 'args': {'name': event_trigger_name}})
+
+
+def reset_tables(pg, seed_rows=0):
+    """Empty the tables and the events of the trigger, and insert seed_rows parents"""
+    pg.truncate_tables(tables, schema)
+    pg.delete_trigger_events(event_trigger_name)
+    if seed_rows:
+        with pg.cursor() as cursor:
+            cursor.execute(SQL('''
+            INSERT INTO {}.parents (name, value)
+            SELECT 'parent ' || i, i % %s FROM generate_series(1, %s) AS i;
+            ''').format(Identifier(schema)), (value_buckets, seed_rows))
+    with pg.cursor() as cursor:
+        cursor.execute(SQL('ANALYZE {}.parents, {}.children;').format(Identifier(schema), Identifier(schema)))
+
+
+def parent_object(i, with_children=False):
+    obj = {'name': 'parent {}'.format(i), 'value': i % value_buckets}
+    if with_children:
+        obj['children'] = {'data': [
+            {'name': 'child {}'.format(j), 'value': j} for j in range(children_per_parent)
+        ]}
+    return obj
+
+
+def child_object(i):
+    return {'name': 'child {}'.format(i), 'value': i, 'parent': {'data': parent_object(i)}}
+
+
+def request_body(query, variables):
+    return json.dumps({'query': query, 'variables': variables})
+
+
+def mk_requests(case, batch_size, total_rows):
+    """
+    The request bodies of a case, and the number of rows the case is expected
+    to need seeded
+    """
+    insert_parents = '''
+mutation insert_parents($objects: [{schema}_parents_insert_input!]!) {{
+  insert_{schema}_parents(objects: $objects) {{ affected_rows }}
+}}'''.format(schema=schema)
+    if case == 'insert':
+        n = max(1, total_rows // batch_size)
+        return ([request_body(insert_parents, {'objects': [parent_object(r * batch_size + i) for i in range(batch_size)]})
+                 for r in range(n)], 0)
+    elif case == 'insert_nested_array':
+        # batch_size counts the parents, each inserted with its children
+        n = max(1, total_rows // (batch_size * (1 + children_per_parent)))
+        return ([request_body(insert_parents, {'objects': [parent_object(r * batch_size + i, True) for i in range(batch_size)]})
+                 for r in range(n)], 0)
+    elif case == 'insert_nested_object':
+        query = '''
+mutation insert_children($objects: [{schema}_children_insert_input!]!) {{
+  insert_{schema}_children(objects: $objects) {{ affected_rows }}
+}}'''.format(schema=schema)
+        n = max(1, total_rows // (batch_size * 2))
+        return ([request_body(query, {'objects': [child_object(r * batch_size + i) for i in range(batch_size)]})
+                 for r in range(n)], 0)
+    elif case in ['update_inc', 'update_set']:
+        if case == 'update_inc':
+            (var_type, update) = ('Int!', '_inc: {value: $v}')
+        else:
+            (var_type, update) = ('String!', '_set: {name: $v}')
+        query = '''
+mutation update_parent($id: Int!, $v: {var_type}) {{
+  update_{schema}_parents_by_pk(pk_columns: {{id: $id}}, {update}) {{ id }}
+}}'''.format(schema=schema, var_type=var_type, update=update)
+        return ([request_body(query, {'id': i, 'v': 1 if case == 'update_inc' else 'updated {}'.format(i)})
+                 for i in range(1, total_rows + 1)], total_rows)
+    elif case == 'delete_by_pk':
+        query = '''
+mutation delete_parent($id: Int!) {{
+  delete_{schema}_parents_by_pk(id: $id) {{ id }}
+}}'''.format(schema=schema)
+        return ([request_body(query, {'id': i}) for i in range(1, total_rows + 1)], total_rows)
+    elif case == 'delete_by_predicate':
+        query = '''
+mutation delete_parents($v: Int!) {{
+  delete_{schema}_parents(where: {{value: {{_eq: $v}}}}) {{ affected_rows }}
+}}'''.format(schema=schema)
+        return ([request_body(query, {'v': v}) for v in range(value_buckets)], total_rows)
+    raise ValueError('Unknown mutation case: ' + case)
+
+
+def affected_rows(resp):
+    """Rows affected by a mutation, from its response"""
+    data = next(iter(resp['data'].values()))
+    if data is None:
+        return 0
+    return data.get('affected_rows', 1)
+
+
+class LockWaitSampler:
+    """Samples the backends waiting for locks, in a thread"""
+
+    def __init__(self, pg, interval=lock_wait_sample_interval):
+        self.pg = pg
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.samples.append(self.pg.get_lock_waits())
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+    def summary(self):
+        samples = self.samples or [0]
+        return {
+            'samples': len(samples),
+            'max_waiting': max(samples),
+            'mean_waiting': float(np.mean(samples)),
+            'waiting_fraction': sum(1 for s in samples if s > 0) / float(len(samples))
+        }
+
+
+def run_requests(hge, bodies, concurrency):
+    """Send the requests with concurrent clients. Returns the latencies in ms and the rows affected"""
+    headers = {**hge.admin_auth_headers(), 'Content-Type': 'application/json'}
+    local = threading.local()
+
+    def send(body):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        resp = local.session.post(hge.url + '/v1/graphql', data=body, headers=headers)
+        elapsed = time.perf_counter() - start
+        out = resp.json()
+        assert resp.status_code == 200 and 'errors' not in out, resp.text
+        return (elapsed * 1000.0, affected_rows(out))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, bodies))
+    return ([r[0] for r in results], sum(r[1] for r in results))
+
+
+def latency_summary(latencies):
+    latencies = np.array(latencies)
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max())
+    }
+
+
+def measure_case(hge, pg, case, batch_size, event_triggers, total_rows, concurrency):
+    (bodies, seed_rows) = mk_requests(case, batch_size, total_rows)
+    reset_tables(pg, seed_rows)
+    lsn = pg.get_wal_lsn()
+    with LockWaitSampler(pg) as sampler:
+        start = time.perf_counter()
+        (latencies, rows) = run_requests(hge, bodies, concurrency)
+        elapsed = time.perf_counter() - start
+    wal_bytes = pg.get_wal_bytes_since(lsn)
+    return {
+        'mutation_case': case,
+        'batch_size': batch_size,
+        'event_triggers': event_triggers,
+        'concurrency': concurrency,
+        'requests': len(bodies),
+        'rows': rows,
+        'seconds': elapsed,
+        'requests_per_sec': len(bodies) / elapsed,
+        'rows_per_sec': rows / elapsed,
+        'latency': latency_summary(latencies),
+        'wal_bytes': wal_bytes,
+        'wal_bytes_per_row': wal_bytes / float(rows) if rows else None,
+        'lock_waits': sampler.summary()
+    }
+
+
+def case_batch_sizes(case, batch_sizes):
+    # Updates and deletes affect one row, or a predicate's rows, per request
+    if case.startswith('insert'):
+        return sorted(set(batch_sizes))
+    return [1]
+
+
+def run_cases(hge, pg, cases, batch_sizes, total_rows, concurrency, with_triggers):
+    for case in cases:
+        for batch_size in case_batch_sizes(case, batch_sizes):
+            print("Mutation benchmark: {}, batch size {}, {}".format(
+                case, batch_size, 'with event triggers (delivery included)' if with_triggers else 'without event triggers'))
+            yield measure_case(hge, pg, case, batch_size, with_triggers, total_rows, concurrency)
+
+
+def run_mutation_benchmark(hge, pg, sink_port, cases, batch_sizes, total_rows, concurrency, event_triggers=[False, True]):
+    """
+    Yields the measurements of every case, batch size, without and with event
+    triggers, whose events are delivered to a WebhookSink on sink_port
+    """
+    create_tables(pg)
+    track_tables(hge)
+    try:
+        for with_triggers in event_triggers:
+            if not with_triggers:
+                yield from run_cases(hge, pg, cases, batch_sizes, total_rows, concurrency, False)
+                continue
+            with WebhookSink(sink_port, fields=None) as sink:
+                create_event_trigger(hge, sink.url)
+                try:
+                    yield from run_cases(hge, pg, cases, batch_sizes, total_rows, concurrency, True)
+                finally:
+                    delete_event_trigger(hge)
+    finally:
+        hge.run_bulk([
+            {'type': 'untrack_table', 'args': {'table': {'schema': schema, 'name': t}, 'cascade': True}}
+            for t in reversed(tables)
+        ])
+        pg.delete_trigger_events(event_trigger_name)
+        pg.drop_schema(schema)
@@ -0,0 +1,322 @@
+"""
+End to end benchmark of the query plan cache.
+
+Working sets of distinct query shapes are sent to graphql-engine, for working
+set sizes around the configured plan cache size (--query-plan-cache-size,
+default 4000). The shapes of a working set differ by:
+- aliases: the same query under a unique alias
+- selections: different selection sets over the sportsdb tables
+- literals: the same query with a different literal inlined
+- variables: the same query with a different value of a variable, which is a
+  single plan whatever the size of the working set (the control)
+Every working set has its own shapes, disjoint from those of the smaller
+sets sent before it, so that its first requests are misses.
+For every kind of shapes and working set size are measured:
+- cold latencies: of the first request of every shape, which is a miss
+- warm latencies: of sequential requests to shapes picked at random, once all
+  have been sent, along with the hit rate that an LRU cache of the configured
+  size has for the same sequence of requests, if /dev/plan_cache shows that
+  plans are cached
+- throughput: of a closed loop load picking shapes at random
+Once a kind is swept, its hit rate is estimated from the warm latencies, as
+the mean latency is linear in the hit rate between the warm latency of the
+smallest working set (all hits) and the cold latency (all misses).
+"""
+
+import collections
+import json
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+# Avoid tkinter dependency
+import matplotlib
+matplotlib.use('agg')
+import matplotlib.pyplot as plt
+
+import load_generator
+import workload
+
+shape_kinds = ['aliases', 'selections', 'literals', 'variables']
+
+# Default of graphql-engine
+default_plan_cache_size = 4000
+
+default_working_set_ratios = [0.25, 0.5, 0.9, 1.1, 2, 4]
+
+# Columns of a table combined into selection sets
+max_selection_columns = 16
+
+
+def configured_plan_cache_size(hge_conf):
+    """The plan cache size graphql-engine is run with, from its arguments or environment"""
+    args = hge_conf.get('args') or []
+    for (i, arg) in enumerate(args):
+        if arg == '--query-plan-cache-size' and i + 1 < len(args):
+            return int(args[i + 1])
+        if arg.startswith('--query-plan-cache-size='):
+            return int(arg.split('=', 1)[1])
+    env = hge_conf.get('env') or {}
+    if env.get('HASURA_GRAPHQL_QUERY_PLAN_CACHE_SIZE'):
+        return int(env['HASURA_GRAPHQL_QUERY_PLAN_CACHE_SIZE'])
+    return default_plan_cache_size
+
+
+def plan_cache_state(hge):
+    """
+    What /dev/plan_cache reports: the number of cached plans, a message if the
+    cache is disabled, or None if developer APIs are not enabled
+    """
+    dump = hge.dev_api('plan_cache')
+    if dump is None or isinstance(dump, str):
+        return dump
+    return '{} plans'.format(len(dump))
+
+
+def cached_plans(hge):
+    """The number of plans in /dev/plan_cache, None if it is not available or the cache is disabled"""
+    dump = hge.dev_api('plan_cache')
+    return len(dump) if isinstance(dump, (list, dict)) else None
+
+
+def working_set_sizes(cache_size, ratios):
+    return sorted(set(max(1, int(round(cache_size * r))) for r in ratios))
+
+
+def get_tables_columns(pg, schema='hge'):
+    """Columns (other than id) of the tables with an id column"""
+    return [
+        (t, sorted(c for c in pg.get_all_columns_of_a_table(t, schema) if c != 'id')[:max_selection_columns])
+        for t in sorted(set(pg.get_all_tables_with_column('id', schema)))
+    ]
+
+
+def alias_shapes(table, n, offset=0, schema='hge'):
+    return [
+        ('query {{ s{i}: {schema}_{table}(limit: 1) {{ id }} }}'.format(i=i, schema=schema, table=table), {})
+        for i in range(offset, offset + n)
+    ]
+
+
+def selection_shapes(tables_columns, n, offset=0, schema='hge'):
+    """Distinct subsets of the columns of every table, the smaller subsets first, skipping the first offset"""
+    shapes = []
+    k = 1
+    n += offset
+    while len(shapes) < n:
+        candidates = [(t, cols) for (t, cols) in tables_columns if k < 2 ** len(cols)]
+        if not candidates:
+            raise ValueError('The tables have only {} distinct selection sets'.format(len(shapes)))
+        for (table, cols) in candidates:
+            selection = ' '.join(['id'] + [c for (j, c) in enumerate(cols) if k & (1 << j)])
+            shapes.append(('query {{ {schema}_{table}(limit: 1) {{ {selection} }} }}'.format(
+                schema=schema, table=table, selection=selection), {}))
+            if len(shapes) == n:
+                break
+        k += 1
+    return shapes[offset:]
+
+
+def literal_shapes(table, n, offset=0, schema='hge'):
+    return [
+        ('query {{ {schema}_{table}(where: {{id: {{_eq: {i}}}}}) {{ id }} }}'.format(i=i, schema=schema, table=table), {})
+        for i in range(offset + 1, offset + n + 1)
+    ]
+
+
+def variable_shapes(table, n, offset=0, schema='hge'):
+    query = 'query q($id: Int!) {{ {schema}_{table}(where: {{id: {{_eq: $id}}}}) {{ id }} }}'.format(schema=schema, table=table)
+    return [(query, {'id': i}) for i in range(offset + 1, offset + n + 1)]
+
+
+def mk_shapes(kind, tables_columns, n, offset=0):
+    """n requests, as (query, variables), of the given kind, after the first offset ones"""
+    table = max(tables_columns, key=lambda x: len(x[1]))[0]
+    if kind == 'aliases':
+        return alias_shapes(table, n, offset)
+    elif kind == 'selections':
+        return selection_shapes(tables_columns, n, offset)
+    elif kind == 'literals':
+        return literal_shapes(table, n, offset)
+    elif kind == 'variables':
+        return variable_shapes(table, n, offset)
+    raise ValueError('Unknown kind of query shapes: ' + kind)
+
+
+def lru_hit_rate(keys, capacity, warm_up=()):
+    """Hit rate of an LRU cache of the given capacity over keys, once warm_up has been seen"""
+    cache = collections.OrderedDict()
+
+    def lookup(key):
+        hit = key in cache
+        if hit:
+            cache.move_to_end(key)
+        else:
+            cache[key] = None
+            if len(cache) > capacity:
+                cache.popitem(last=False)
+        return hit
+
+    for key in warm_up:
+        lookup(key)
+    hits = sum(1 for key in keys if lookup(key))
+    return hits / float(len(keys)) if keys else None
+
+
+def time_requests(hge, shapes):
+    headers = {**hge.admin_auth_headers(), 'Content-Type': 'application/json'}
+    latencies = []
+    with requests.Session() as session:
+        for (query, variables) in shapes:
+            body = json.dumps({'query': query, 'variables': variables})
+            start = time.perf_counter()
+            resp = session.post(hge.url + '/v1/graphql', data=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            assert resp.status_code == 200 and 'errors' not in resp.json(), resp.text
+            latencies.append(elapsed * 1000.0)
+    return latencies
+
+
+def latency_summary(latencies):
+    latencies = np.array(latencies)
+    return {
+        'requests': len(latencies),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+
+def shapes_workload(kind, shapes, seed):
+    """A workload picking the shapes uniformly at random"""
+    if kind == 'variables':
+        # A single query, with the values picked at random
+        operations = [workload.Operation(kind, shapes[0][0], variables={'id': {'choice': [v['id'] for (_, v) in shapes]}})]
+    else:
+        operations = [workload.Operation(kind, query) for (query, _) in shapes]
+    return workload.Workload(kind, operations, seed=seed)
+
+
+def measure_throughput(hge, kind, shapes, params, duration, seed):
+    (_, _, summary) = load_generator.run_load(
+        hge.url + '/v1/graphql', None, hge.admin_auth_headers(),
+        params['threads'], params['connections'], duration,
+        workload=shapes_workload(kind, shapes, seed)
+    )
+    requests_count = summary['summary']['requests']
+    return {
+        'duration': duration,
+        'requests': requests_count,
+        'requests_per_sec': requests_count / float(duration),
+        'errors': summary['summary']['errors'],
+        'latency_us': summary['latency']
+    }
+
+
+def measure_working_set(hge, kind, shapes, cache_size, requests_count, params, duration, seed=0):
+    """Measurements for one working set of shapes"""
+    keys = [q if kind != 'variables' else q + json.dumps(v) for (q, v) in shapes]
+    print("Sending the {} shapes of the working set once".format(len(shapes)))
+    cold = time_requests(hge, shapes)
+    # The LRU simulation is only meaningful if graphql-engine caches plans
+    plans_cached = cached_plans(hge)
+    if not plans_cached:
+        print("No cached plans in /dev/plan_cache after the shapes were sent (is the plan cache enabled, and are "
+              "the developer APIs?), not reporting the expected hit rate")
+    rng = random.Random(seed)
+    order = [rng.randrange(len(shapes)) for _ in range(requests_count)]
+    print("Sending {} requests to shapes picked at random".format(requests_count))
+    warm = time_requests(hge, [shapes[i] for i in order])
+    # Plans are cached by query, not by the values of its variables
+    plan_keys = [shapes[i][0] for i in order]
+    out = {
+        'kind': kind,
+        'working_set': len(set(keys)),
+        'plans': len(set(q for (q, _) in shapes)),
+        'plan_cache_size': cache_size,
+        'cold': latency_summary(cold),
+        'warm': latency_summary(warm),
+        'expected_hit_rate': lru_hit_rate(plan_keys, cache_size, warm_up=[q for (q, _) in shapes]) if plans_cached else None
+    }
+    if duration:
+        print("Closed loop load for {}s".format(duration))
+        out['throughput'] = measure_throughput(hge, kind, shapes, params, duration, seed)
+    return out
+
+
+def estimate_hit_rates(results):
+    """
+    Set estimated_hit_rate and miss_penalty_ms of the results of a kind, the
+    warm latency of the smallest working set being taken as that of a hit
+    """
+    if not results:
+        return
+    smallest = min(results, key=lambda r: r['working_set'])
+    hit_ms = smallest['warm']['mean_ms']
+    miss_ms = float(np.median([r['cold']['mean_ms'] for r in results]))
+    for r in results:
+        r['miss_penalty_ms'] = miss_ms - hit_ms
+        if miss_ms > hit_ms:
+            r['estimated_hit_rate'] = min(1.0, max(0.0, (miss_ms - r['warm']['mean_ms']) / (miss_ms - hit_ms)))
+        else:
+            r['estimated_hit_rate'] = None
+
+
+def run_plan_cache_benchmark(hge, pg, params, kinds, working_sets, cache_size, requests_count=1000, duration=10):
+    """Yields the results of every kind of shapes, for all the working set sizes"""
+    tables_columns = get_tables_columns(pg)
+    for kind in kinds:
+        results = []
+        # Shapes already sent, which the next working set does not reuse
+        offset = 0
+        for n in sorted(set(working_sets)):
+            print("Plan cache benchmark: {} {} (plan cache size {})".format(n, kind, cache_size))
+            shapes = mk_shapes(kind, tables_columns, n, offset)
+            offset += n
+            results.append(measure_working_set(hge, kind, shapes, cache_size, requests_count, params, duration))
+        estimate_hit_rates(results)
+        yield (kind, results)
+
+
+def hit_rate_table(results):
+    """The hit rate curve, one row per kind of shapes and working set size"""
+    rows = []
+    for r in results:
+        throughput = r.get('throughput')
+        rows.append({
+            'kind': r['kind'],
+            'working set': r['working_set'],
+            'working set / cache size': r['working_set'] / float(r['plan_cache_size']),
+            'expected hit rate': r['expected_hit_rate'],
+            'estimated hit rate': r['estimated_hit_rate'],
+            'cold p50 (ms)': r['cold']['p50_ms'],
+            'warm p50 (ms)': r['warm']['p50_ms'],
+            'warm p99 (ms)': r['warm']['p99_ms'],
+            'rps': throughput['requests_per_sec'] if throughput else None
+        })
+    return pd.DataFrame(rows)
+
+
+def plot_hit_rates(df, out_file):
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+    for kind, group in df.groupby('kind'):
+        x = group['working set / cache size']
+        axes[0].plot(x, group['estimated hit rate'], marker='o', label='{}, estimated'.format(kind))
+        if group['expected hit rate'].notnull().any():
+            axes[0].plot(x, group['expected hit rate'], '--', label='{}, LRU'.format(kind))
+        axes[1].plot(x, group['warm p50 (ms)'], marker='o', label='{}, warm'.format(kind))
+        axes[1].plot(x, group['cold p50 (ms)'], ':', label='{}, cold'.format(kind))
+        if group['rps'].notnull().any():
+            axes[2].plot(x, group['rps'], marker='o', label=kind)
+    for (ax, ylabel) in zip(axes, ['Hit rate', 'Latency p50 (ms)', 'Requests/sec']):
+        ax.set(xlabel='Working set / plan cache size', ylabel=ylabel)
+        ax.set_xscale('log')
+        ax.axvline(1.0, color='grey', linewidth=0.5)
+        ax.grid(True)
+        ax.legend(fontsize='small')
+    fig.savefig(out_file, bbox_inches='tight', dpi=100)
+    plt.close(fig)
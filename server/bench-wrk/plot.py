@@ -4,12 +4,13 @@
 import matplotlib
 matplotlib.use('agg')
 
+import latency_store
+import results_store
 import dash
 from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
 import dash_html_components as html
-from urllib.request import urlopen
 import pandas as pd
 import json
 
@@ -22,8 +23,7 @@ from io import BytesIO
 import sys
 import argparse
 import base64
-from urllib.parse import urlparse
-import boto3
+import functools
 
 def as_pairs(l, pair_size=2):
     if len(l) < pair_size:
@@ -76,6 +76,89 @@ def throughput_figure(df):
     plt.close()
     return out_fig
 
+def percentile_latency(histogram, pctl):
+    """Latency at percentile pctl (a fraction) of a latency histogram"""
+    entries = sorted(histogram, key=lambda e: float(e['percentile']))
+    for e in entries:
+        if float(e['percentile']) >= pctl:
+            return float(e['latency'])
+    return float(entries[-1]['latency'])
+
+
+def latency_vs_scale_data(latency_results, scenarios, percentiles=(0.5, 0.99)):
+    """Latency percentiles of each query against the scale factor of the dataset"""
+    results = get_scenario_results(latency_results, scenarios)
+    data = []
+    for (snro, req_results) in results:
+        ver_info = snro['version'] or snro['docker_image'].split(':')[1]
+        for r in req_results:
+            if not r['latency_histogram']:
+                continue
+            for pctl in percentiles:
+                data.append({
+                    'version': ver_info,
+                    'query name': snro['query_name'],
+                    'scale factor': r['scale_factor'],
+                    'percentile': '{:g}th'.format(pctl * 100),
+                    'latency': percentile_latency(r['latency_histogram'], pctl)
+                })
+    return pd.DataFrame(data)
+
+
+def latency_vs_scale_figure(df):
+    sns.set_style("whitegrid")
+    pctls = list(dict.fromkeys(df['percentile']))
+    fig, axes = plt.subplots(1, len(pctls), figsize=(14,6), squeeze=False)
+    for (ax, pctl) in zip(axes[0], pctls):
+        sns.lineplot(
+            x='scale factor', y='latency', hue='query name', style='version',
+            markers=True, data=df[df['percentile'] == pctl], ax=ax
+        )
+        ax.set_xscale('log')
+        ax.set(
+            title='{} percentile'.format(pctl),
+            xlabel='Dataset size (x sportsdb)',
+            ylabel='Latency (ms)'
+        )
+        ax.set_ylim(0, None)
+    out_fig = gen_plot_figure_data(plt)
+    plt.close()
+    return out_fig
+
+
+def throughput_vs_scale_data(max_rps_results, scenarios):
+    """Max throughput of each query against the scale factor of the dataset"""
+    results = get_scenario_results(max_rps_results, scenarios)
+    data = []
+    for (snro, req_results) in results:
+        ver_info = snro['version'] or snro['docker_image'].split(':')[1]
+        for r in req_results:
+            data.append({
+                'version': ver_info,
+                'query name': snro['query_name'],
+                'scale factor': r['scale_factor'],
+                'max throughput': float(r['max_rps'])
+            })
+    return pd.DataFrame(data)
+
+
+def throughput_vs_scale_figure(df):
+    sns.set_style("whitegrid")
+    fig, ax = plt.subplots(figsize=(14,6))
+    sns.lineplot(
+        x='scale factor', y='max throughput', hue='query name', style='version',
+        markers=True, data=df, ax=ax
+    )
+    ax.set_xscale('log')
+    ax.set(
+        xlabel='Dataset size (x sportsdb)',
+        ylabel='Throughput (req/s)'
+    )
+    plt.ylim(0, None)
+    out_fig = gen_plot_figure_data(plt)
+    plt.close()
+    return out_fig
+
 def gen_plot_figure_data(plt):
     with BytesIO() as out_img:
         plt.savefig(out_img, format='png', bbox_inches='tight', dpi=100)
@@ -84,20 +167,11 @@ def gen_plot_figure_data(plt):
     return "data:image/png;base64,{}".format(encoded)
 
 
-def uri_readlines(uri):
-    print('Latency file:', uri)
-    p = urlparse(uri)
-    if p.scheme == 'file':
-        return urlopen(uri).readlines()
-    elif p.scheme == 's3':
-        s3 = boto3.resource('s3')
-        obj = s3.Object(bucket_name=p.netloc, key=p.path.lstrip('/'))
-        with BytesIO() as data:
-            obj.download_fileobj(data)
-            return data.getvalue().splitlines()
-
-
-def violin_plot_data(latency_results, scenarios):
+def violin_plot_data(latency_results, scenarios, latency_cache):
+    """
+    One row per version and requests/sec, holding the latency distribution
+    (in ms) of the run, and a sample of its latencies for the strip plot
+    """
     y_label = 'latency (ms)'
     x_label = 'version'
     category_label = 'req/sec'
@@ -106,76 +180,110 @@ def violin_plot_data(latency_results, scenarios):
     for (snro, req_results) in results:
         ver_info = snro['version'] or snro['docker_image'].split(':')[1]
         if req_results:
-            latencies = uri_readlines(req_results[0]['latencies_uri'])
-            for x in latencies:
-                if isinstance(x, bytes):
-                    x = x.decode()
-                val_ms = float(x)/1000.0
-                data.append({
-                    y_label: val_ms,
-                    x_label: ver_info,
-                    category_label: snro['requests_per_sec']
-                })
+            uri = req_results[0]['latencies_uri']
+            print('Latency file:', uri)
+            (values, counts) = latency_cache.distribution(uri)
+            data.append({
+                x_label: ver_info,
+                category_label: snro['requests_per_sec'],
+                y_label: values / 1000.0,
+                'counts': counts,
+                'sample': latency_cache.sample(uri) / 1000.0
+            })
     return pd.DataFrame(data)
 
 
-def violin_plot_figure(df):
+def weighted_percentile(values, counts, pctl):
+    """Percentile of sorted values, each occurring counts times"""
+    cum_counts = np.cumsum(counts)
+    i = np.searchsorted(cum_counts, pctl / 100.0 * cum_counts[-1])
+    return values[min(i, len(values) - 1)]
+
+
+def violin_density(values, counts, bw=0.02, grid_size=512):
+    """
+    Gaussian kernel density estimate of sorted values occurring counts times.
+    The values are binned on a grid before smoothing, so the cost does not grow
+    with the number of samples. Like seaborn, bw is relative to the standard
+    deviation. Returns the grid and the density on it
+    """
+    weights = counts / float(counts.sum())
+    (lo, hi) = (values[0], values[-1])
+    if hi <= lo:
+        return (np.array([lo, lo]), np.array([1.0, 1.0]))
+    mean = np.dot(values, weights)
+    std = np.sqrt(np.dot((values - mean) ** 2, weights))
+    step = (hi - lo) / grid_size
+    (hist, _) = np.histogram(values, bins=grid_size, range=(lo, hi), weights=weights)
+    # Kernel width in grid bins
+    sigma = max(bw * std / step, 0.5)
+    radius = int(np.ceil(3 * sigma))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    # Pad so that the tails of the kernel are not cut off
+    padded = np.concatenate([np.zeros(radius), hist, np.zeros(radius)])
+    density = np.convolve(padded, kernel, mode='same') / step
+    grid = lo + (np.arange(-radius, grid_size + radius) + 0.5) * step
+    return (grid, density)
+
+
+def violin_plot_figure(df, max_strip_points=2000):
     y_label = 'latency (ms)'
     x_label = 'version'
     category_label = 'req/sec'
     sns.set_style("whitegrid")
-    plt.figure(figsize=(14,6))
-
-    # All points latency plot
-    ax = sns.stripplot(
-        x=x_label, y=y_label, hue=category_label,
-        data=df, palette=sns.color_palette(["#AAAAAA"]),
-        jitter=0.40, size=2.2, dodge=True)
-    plt.setp(ax.collections, zorder=-1000)
-
-    # Plot percentiles using boxplot whisker caps:
-    percentiles = [(99.9, 'red'), (99, 'blue'), (95, 'green')]
-    for pctl, color in percentiles:
-        ax = sns.boxplot(
-            x=x_label, y=y_label, hue=category_label, data=df,
-            showfliers=False, showbox=False,
-            # Showing bottom percentiles just seemed to add visual noise:
-            whis=[0, pctl],
-            capprops={'color': color, 'linewidth': 1},
-            # hide all but cap:
-            whiskerprops={'linewidth': 0}
-        )
-        # Keep boxplots from adding nonsense to legend:
-        handles, _ = ax.get_legend_handles_labels()
-        for h in handles:
-            h.remove()
+    fig, ax = plt.subplots(figsize=(14,6))
 
-    # This will get overwritten; add back below:
-    pctl_legend = plt.legend(
+    versions = list(dict.fromkeys(df[x_label]))
+    rps_levels = sorted(set(df[category_label]))
+    palette = sns.color_palette("Set1", len(rps_levels))
+    width = 0.8 / len(rps_levels)
+    percentiles = [(99.9, 'red'), (99, 'blue'), (95, 'green'), (50, 'black')]
+    rng = np.random.RandomState(0)
+
+    rows = df.to_dict('records')
+    densities = [violin_density(r[y_label], r['counts']) for r in rows]
+    # All violins get the same area (number of samples may differ)
+    max_density = max(d.max() for (_, d) in densities)
+    for (r, (grid, density)) in zip(rows, densities):
+        hue = rps_levels.index(r[category_label])
+        x = versions.index(r[x_label]) - 0.4 + width * (hue + 0.5)
+        half_width = density / max_density * width / 2
+
+        # Latency points, from the sample of the run
+        sample = r['sample']
+        if len(sample) > max_strip_points:
+            sample = rng.choice(sample, max_strip_points, replace=False)
+        jitter = rng.uniform(-0.4 * width, 0.4 * width, len(sample))
+        ax.scatter(x + jitter, sample, color="#AAAAAA", s=2.2, linewidths=0, zorder=-1000)
+
+        ax.fill_betweenx(grid, x - half_width, x + half_width, color=palette[hue], linewidth=0)
+
+        # Percentile markers
+        for pctl, color in percentiles:
+            y = weighted_percentile(r[y_label], r['counts'], pctl)
+            ax.hlines(y, x - width / 4, x + width / 4, color=color, linewidth=1)
+
+    rps_legend = plt.legend(
+        title=category_label, loc='upper right',
+        handles=[
+            mpatches.Patch(color=palette[i], label=str(rps))
+            for i, rps in enumerate(rps_levels)
+        ]
+    )
+    ax.add_artist(rps_legend)
+    plt.legend(
         title='Percentile markers', loc='upper left',
         handles=[
             mpatches.Patch(color=c, label=str(pctl)+"th")
-            for pctl, c in percentiles
+            for pctl, c in percentiles[:-1]
         ] +
         [mpatches.Patch(color="black", label='median')]
     )
 
-    # See: https://seaborn.pydata.org/generated/seaborn.violinplot.html
-    sns.violinplot(
-        x=x_label, y=y_label, hue=category_label, data=df, palette="Set1",
-        scale_hue=True,
-        # All violins get the same area (number of samples may differ):
-        scale="area",
-        # More granular violins:
-        bw=.02,
-        # This seems to wreck things:
-        # width=1.5,
-        linewidth=0,
-        # inner="quartile"
-    )
-
-    # Add back percentile legend:
-    ax.add_artist(pctl_legend)
+    ax.set_xticks(range(len(versions)))
+    ax.set_xticklabels(versions)
+    ax.set(xlabel=x_label, ylabel=y_label)
 
     approx_target_y_tics = 20
 
@@ -247,10 +355,13 @@ def y_fmt(y, pos):
                 return tx.format(val=val, suffix=suffix[i])
     return y
 
-def run_dash_server(bench_results):
+def run_dash_server(bench_results, latency_cache_mb=512, figure_cache_size=64):
     latency_results = bench_results['latency']
     max_rps_results = bench_results['max_rps']
     latency_results.sort(key=lambda x : x['version'] or x['docker_image'])
+    # Results from before the dataset could be scaled
+    for x in latency_results + max_rps_results:
+        x.setdefault('scale_factor', 1)
 
     app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
 
@@ -259,7 +370,15 @@ def run_dash_server(bench_results):
 
 
     rows = []
-    plot_types = ['latency histogram','latency violins', 'max throughput']
+    plot_types = [
+        'latency histogram','latency violins', 'max throughput',
+        'latency vs data size', 'throughput vs data size'
+    ]
+    # Plots of several queries, and plots not having a requests/sec
+    multi_query_plots = ['max throughput', 'latency vs data size', 'throughput vs data size']
+    throughput_plots = ['max throughput', 'throughput vs data size']
+    # Plots across the scale factors of the dataset
+    data_size_plots = ['latency vs data size', 'throughput vs data size']
     plots_filters_1 = [
         dbc.Col([
             html.Label('Plot type'),
@@ -285,7 +404,14 @@ def run_dash_server(bench_results):
 
             ],
             id='rps-div'
-        ), width=3)
+        ), width=3),
+        dbc.Col(html.Div(
+            children=[
+                html.Label('Dataset scale factor'),
+                dcc.Dropdown(id='scale-factor', multi=False)
+            ],
+            id='scale-factor-div'
+        ), width=2)
     ]
     rows.append(dbc.Row(plots_filters_1))
 
@@ -325,7 +451,7 @@ def run_dash_server(bench_results):
         relvnt_q = [
             x for x in latency_results
             if x['query_name'] in query_names and
-            (x['requests_per_sec'] in rps_list or plot_type == 'max throughput')
+            (x['requests_per_sec'] in rps_list or plot_type in throughput_plots)
         ]
         uniq_vers = list(set([
             (x['version'], x['docker_image'])
@@ -384,7 +510,7 @@ def run_dash_server(bench_results):
         [ Input('plot-type', 'value') ],
     )
     def query_dropdown_multi(plot_type):
-        return plot_type == 'max throughput'
+        return plot_type in multi_query_plots
 
     @app.callback(
         Output('query-name', 'value'),
@@ -392,7 +518,7 @@ def run_dash_server(bench_results):
         [ State('query-name', 'value') ]
     )
     def updateQueryValue(plot_type, options, multi, query_names):
-        if plot_type == 'max throughput':
+        if plot_type in multi_query_plots:
             return updateMultiValue(options, query_names, 4)
         else:
             return updateSingleValue(options, query_names)
@@ -402,8 +528,9 @@ def run_dash_server(bench_results):
         Output('rps', 'options'),
         [ Input('plot-type', 'value'),  Input('query-name', 'value') ]
     )
-    def updateRPSOptions(plot_type, query_name):
-        relvnt_q = [ x for x in latency_results if x['query_name'] ==  query_name ]
+    def updateRPSOptions(plot_type, query_names):
+        query_names = as_list(query_names)
+        relvnt_q = [ x for x in latency_results if x['query_name'] in query_names ]
         rps = list( set( [x['requests_per_sec'] for x in relvnt_q ] ) )
         return [
             {
@@ -418,7 +545,7 @@ def run_dash_server(bench_results):
         [ State('rps', 'value') ]
     )
     def updateRPSValue(plot_type, options, rps):
-        if plot_type == 'latency histogram':
+        if plot_type in ['latency histogram', 'latency vs data size']:
             return updateSingleValue(options, rps)
         else:
             rps = as_list(rps)
@@ -438,7 +565,36 @@ def run_dash_server(bench_results):
         [ Input('plot-type', 'value') ],
     )
     def rps_dropdown_style(plot_type):
-        if plot_type == 'max throughput':
+        if plot_type in throughput_plots:
+            return { 'display': 'none' }
+        else:
+            return {'display': 'block'}
+
+    @app.callback(
+        Output('scale-factor', 'options'),
+        [ Input('plot-type', 'value'), Input('query-name', 'value') ]
+    )
+    def updateScaleFactorOptions(plot_type, query_names):
+        query_names = as_list(query_names)
+        results = max_rps_results if plot_type in throughput_plots else latency_results
+        scale_factors = set(x['scale_factor'] for x in results if x['query_name'] in query_names)
+        return [ {'label': '{}x'.format(x), 'value': x} for x in sorted(scale_factors) ]
+
+    @app.callback(
+        Output('scale-factor', 'value'),
+        [ Input('scale-factor', 'options') ],
+        [ State('scale-factor', 'value') ]
+    )
+    def updateScaleFactorValue(options, scale_factor):
+        return updateSingleValue(options, scale_factor)
+
+    # Hide the scale factor dropdown for plots across data sizes
+    @app.callback(
+        Output('scale-factor-div', 'style'),
+        [ Input('plot-type', 'value') ],
+    )
+    def scale_factor_dropdown_style(plot_type):
+        if plot_type in data_size_plots:
             return { 'display': 'none' }
         else:
             return {'display': 'block'}
@@ -447,10 +603,27 @@ def run_dash_server(bench_results):
         df = hdrhistogram_data(latency_results, scenarios)
         return hdrhistogram_figure(df)
 
+    latency_cache = latency_store.LatencyCache(max_bytes=latency_cache_mb * 1024 * 1024)
+
     def get_violin_figure(scenarios):
-        df = violin_plot_data(latency_results, scenarios)
+        df = violin_plot_data(latency_results, scenarios, latency_cache)
         return violin_plot_figure(df)
 
+    # Figures are memoised by plot type and set of scenarios
+    @functools.lru_cache(maxsize=figure_cache_size)
+    def get_figure(plot_type, scenarios_key):
+        scenarios = [json.loads(x) for x in scenarios_key]
+        if plot_type == 'latency histogram':
+            return get_hdrhistogram_figure(scenarios)
+        elif plot_type == 'latency violins':
+            return get_violin_figure(scenarios)
+        elif plot_type == 'max throughput':
+            return get_throughput_figure(scenarios)
+        elif plot_type == 'latency vs data size':
+            return latency_vs_scale_figure(latency_vs_scale_data(latency_results, scenarios))
+        elif plot_type == 'throughput vs data size':
+            return throughput_vs_scale_figure(throughput_vs_scale_data(max_rps_results, scenarios))
+
     def get_throughput_figure(scenarios):
         df = throughput_data(max_rps_results, scenarios)
         return throughput_figure(df)
@@ -461,42 +634,43 @@ def run_dash_server(bench_results):
             Input('plot-type', 'value'),
             Input('query-name', 'value'),
             Input('rps', 'value'),
-            Input('ver', 'value')
+            Input('ver', 'value'),
+            Input('scale-factor', 'value')
         ]
     )
-    def updateGraph(plot_type, query_name, rps_list, vers):
+    def updateGraph(plot_type, query_name, rps_list, vers, scale_factor):
         rps_list = as_list(rps_list)
+        # Plots across data sizes take the results of every scale factor
+        scale_info = {} if plot_type in data_size_plots else {'scale_factor': scale_factor}
         def latency_scenarios():
             return [
                 {
-                    'query_name': query_name,
+                    'query_name': qname,
                     'requests_per_sec': rps,
+                    **scale_info,
                     **json.loads(v)
                 }
                 for v in set(vers)
                 for rps in set(rps_list)
+                for qname in as_list(query_name)
             ]
         def throughput_scenarios():
             return [
                 {
                     'query_name': qname,
+                    **scale_info,
                     **json.loads(v)
                 }
                 for v in set(vers)
                 for qname in as_list(query_name)
             ]
-        if plot_type == 'max throughput':
+        if plot_type in throughput_plots:
             scenarios = throughput_scenarios()
         else:
             scenarios = latency_scenarios()
 
-
-        if plot_type == 'latency histogram':
-            return get_hdrhistogram_figure(scenarios)
-        elif plot_type == 'latency violins':
-            return get_violin_figure(scenarios)
-        elif plot_type == 'max throughput':
-            return get_throughput_figure(scenarios)
+        scenarios_key = tuple(sorted(json.dumps(x, sort_keys=True) for x in scenarios))
+        return get_figure(plot_type, scenarios_key)
 
     app.run_server(host="127.0.0.1", debug=False)
 
@@ -506,11 +680,20 @@ if __name__ == '__main__':
     parser.add_argument(
         '--results', nargs='?', type=argparse.FileType('r'),
         default=sys.stdin)
+    parser.add_argument(
+        '--results-parquet-dir',
+        help='Read the results from the Parquet files of this directory (see results_store.py) instead')
+    parser.add_argument(
+        '--latency-cache-mb', type=int, default=512,
+        help='Memory cap of the latencies cached for plotting (default: 512)')
     args = parser.parse_args()
-    bench_results = json.load(args.results)
+    if args.results_parquet_dir:
+        bench_results = results_store.ParquetResultsStore(args.results_parquet_dir).get_results()
+    else:
+        bench_results = json.load(args.results)
     print(bench_results)
 
     print("=" * 20)
     print("starting dash server for graphs")
 
-    run_dash_server(bench_results)
+    run_dash_server(bench_results, latency_cache_mb=args.latency_cache_mb)
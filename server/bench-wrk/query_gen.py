@@ -0,0 +1,395 @@
+"""
+Benchmark queries generated from the foreign key relationships.
+
+The relationship graph is built from the metadata of graphql-engine (the
+object and array relationships using foreign key constraints, as created by
+HGE.create_obj_fk_relationships and create_arr_fk_relationships) and the
+foreign key constraints of Postgres, which give the tables and columns at
+both ends of every relationship.
+
+Every family of queries varies one structural dimension, all else being
+equal:
+- depth: a chain of relationships, the prefixes of the longest path found
+  (array relationships in the chain have limit 1, so that the number of rows
+  does not grow with the depth)
+- breadth: sibling relationships of the root table
+- fan_out: the limit of an array relationship, from the parents with the
+  most children
+- filters: conditions on columns of related tables, in the where clause of
+  the root field
+- aggregates: aggregates of sibling array relationships
+- order_by: ordering by a column of a table reached through object
+  relationships
+Every query carries tags (a '# tags: {...}' comment above it, in JSON)
+describing its shape, which are stored with the query in hge_bench.gql_query.
+"""
+
+import json
+import random
+import re
+
+families = ['depth', 'breadth', 'fan_out', 'filters', 'aggregates', 'order_by']
+
+default_max_depth = 5
+
+default_max_breadth = 5
+
+default_fan_outs = [1, 10, 100, 1000]
+
+default_root_limit = 10
+
+# Scalar columns selected from every table
+selection_columns = 3
+
+# Bound on the paths explored when looking for the longest chain of relationships
+max_path_expansions = 100000
+
+tags_comment_re = re.compile(r'^#\s*tags:\s*(\{.*\})\s*\n(?:#.*\n)*\s*(?:query|subscription)\s+(\w+)', re.MULTILINE)
+
+
+class QueryGenError(Exception):
+    """Exception type for the query generator"""
+
+
+class Relationship:
+
+    def __init__(self, kind, name, table, target, column, target_column):
+        # 'object' or 'array'
+        self.kind = kind
+        self.name = name
+        self.table = table
+        self.target = target
+        # The column of the foreign key, and the column it references. For
+        # an array relationship, the column of the foreign key is in the target
+        self.column = column
+        self.target_column = target_column
+
+
+class RelationshipGraph:
+
+    def __init__(self, schema, columns, relationships):
+        self.schema = schema
+        # Columns of every table
+        self.columns = columns
+        # Relationships of every table, object relationships first
+        self.relationships = {t: [] for t in columns}
+        for rel in sorted(relationships, key=lambda r: (r.kind != 'object', r.name)):
+            self.relationships.setdefault(rel.table, []).append(rel)
+
+    def tables(self):
+        return sorted(self.relationships)
+
+    def root_field(self, table):
+        return '{}_{}'.format(self.schema, table)
+
+    def fk_columns(self, table):
+        return set(r.column for r in self.relationships.get(table, []) if r.kind == 'object')
+
+    def selection(self, table):
+        """A few scalar columns of the table: id if any, and the first other columns not in foreign keys"""
+        columns = self.columns.get(table) or []
+        fk_columns = self.fk_columns(table)
+        others = sorted(c for c in columns if c != 'id' and c not in fk_columns)
+        if 'id' in columns:
+            return ['id'] + others[:selection_columns - 1]
+        return others[:selection_columns] or sorted(columns)[:1]
+
+
+def metadata_table(entry):
+    """(schema, name) of a table of the metadata, of version 1 or 2"""
+    table = entry['table']
+    if isinstance(table, str):
+        return ('public', table)
+    return (table.get('schema', 'public'), table['name'])
+
+
+def relationship_graph(metadata, fk_constraints, columns, schema):
+    """
+    The graph of the relationships of the tables of schema. fk_constraints
+    are rows of Postgres.get_all_fk_constraints, and columns the columns of
+    every table
+    """
+    fks = {}
+    for (s, _, t, c, fs, ft, fc) in fk_constraints:
+        fks[(s, t, c)] = (fs, ft, fc)
+    relationships = []
+    for entry in metadata.get('tables') or []:
+        (s, t) = metadata_table(entry)
+        if s != schema:
+            continue
+        for rel in entry.get('object_relationships') or []:
+            column = rel['using'].get('foreign_key_constraint_on')
+            fk = fks.get((s, t, column)) if isinstance(column, str) else None
+            if fk and fk[0] == schema:
+                relationships.append(Relationship('object', rel['name'], t, fk[1], column, fk[2]))
+        for rel in entry.get('array_relationships') or []:
+            using = rel['using'].get('foreign_key_constraint_on')
+            if not isinstance(using, dict):
+                continue
+            target = using['table']
+            (ts, tt) = ('public', target) if isinstance(target, str) else (target.get('schema', 'public'), target['name'])
+            fk = fks.get((ts, tt, using['column']))
+            if ts == schema and fk and fk[1] == t:
+                relationships.append(Relationship('array', rel['name'], t, tt, using['column'], fk[2]))
+    if not relationships:
+        raise QueryGenError('No foreign key relationships in schema {}'.format(schema))
+    return RelationshipGraph(schema, columns, relationships)
+
+
+class Enum(str):
+    """An enum value, printed without quotes"""
+
+
+def gql_value(value):
+    if isinstance(value, Enum):
+        return str(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, dict):
+        return '{' + ', '.join('{}: {}'.format(k, gql_value(v)) for (k, v) in value.items()) + '}'
+    if isinstance(value, list):
+        return '[' + ', '.join(gql_value(v) for v in value) + ']'
+    return json.dumps(value)
+
+
+class Field:
+
+    def __init__(self, name, args=None, fields=()):
+        self.name = name
+        self.args = args or {}
+        self.fields = list(fields)
+
+    def render(self, indent=1):
+        pad = '  ' * indent
+        out = pad + self.name
+        if self.args:
+            out += '(' + ', '.join('{}: {}'.format(k, gql_value(v)) for (k, v) in self.args.items()) + ')'
+        if self.fields:
+            out += ' {\n' + '\n'.join(f.render(indent + 1) for f in self.fields) + '\n' + pad + '}'
+        return out
+
+
+def columns_fields(graph, table):
+    return [Field(c) for c in graph.selection(table)]
+
+
+def relationship_field(graph, rel, fields=None, limit=1):
+    """The field of a relationship, with the columns of its target (limit is that of array relationships)"""
+    args = {'limit': limit} if rel.kind == 'array' else {}
+    return Field(rel.name, args, columns_fields(graph, rel.target) + (fields or []))
+
+
+def shape_tags(family, root, **dims):
+    tags = {
+        'family': family,
+        'root_table': root,
+        'depth': 0,
+        'breadth': 0,
+        'fan_out': None,
+        'filters': 0,
+        'aggregates': 0,
+        'order_by_depth': None
+    }
+    tags.update(dims)
+    return tags
+
+
+def mk_query(name, root_field, tags):
+    return (name, 'query {} {{\n{}\n}}'.format(name, root_field.render()), tags)
+
+
+def longest_path(graph, max_depth, kinds=('object', 'array'), rng=None):
+    """The longest chain of relationships (of the given kinds) without cycles, up to max_depth"""
+    best = []
+    expansions = [0]
+
+    def visit(table, path, seen):
+        nonlocal best
+        if len(path) > len(best):
+            best = list(path)
+        if len(best) >= max_depth or expansions[0] >= max_path_expansions:
+            return
+        rels = [r for r in graph.relationships.get(table, []) if r.kind in kinds and r.target not in seen]
+        if rng:
+            rng.shuffle(rels)
+        for rel in rels:
+            expansions[0] += 1
+            visit(rel.target, path + [rel], seen | {rel.target})
+            if len(best) >= max_depth:
+                return
+
+    for table in graph.tables():
+        visit(table, [], {table})
+        if len(best) >= max_depth:
+            break
+    return best
+
+
+def chain_fields(graph, path):
+    """Nested fields of a chain of relationships, innermost last"""
+    field = None
+    for rel in reversed(path):
+        field = relationship_field(graph, rel, [field] if field else [])
+    return field
+
+
+def depth_queries(graph, max_depth, root_limit, rng):
+    path = longest_path(graph, max_depth, rng=rng)
+    if not path:
+        return []
+    root = path[0].table
+    queries = []
+    for d in range(len(path) + 1):
+        fields = columns_fields(graph, root) + ([chain_fields(graph, path[:d])] if d else [])
+        queries.append(mk_query(
+            'gen_depth_{}'.format(d),
+            Field(graph.root_field(root), {'limit': root_limit}, fields),
+            shape_tags('depth', root, depth=d, breadth=1 if d else 0, root_limit=root_limit,
+                       path=[r.name for r in path[:d]])
+        ))
+    return queries
+
+
+def root_with_most(graph, kinds):
+    return max(graph.tables(), key=lambda t: (len([r for r in graph.relationships[t] if r.kind in kinds]), t))
+
+
+def breadth_queries(graph, max_breadth, root_limit):
+    root = root_with_most(graph, ('object', 'array'))
+    rels = graph.relationships[root][:max_breadth]
+    return [
+        mk_query(
+            'gen_breadth_{}'.format(b),
+            Field(graph.root_field(root), {'limit': root_limit},
+                  columns_fields(graph, root) + [relationship_field(graph, rel) for rel in rels[:b]]),
+            shape_tags('breadth', root, depth=1 if b else 0, breadth=b, root_limit=root_limit,
+                       relationships=[r.name for r in rels[:b]])
+        )
+        for b in range(len(rels) + 1)
+    ]
+
+
+def fan_out_queries(graph, pg, fan_outs, root_limit):
+    """The array relationship with the most children per parent, from its parents with the most children"""
+    best = None
+    for table in graph.tables():
+        for rel in graph.relationships[table]:
+            if rel.kind != 'array':
+                continue
+            parents = pg.get_top_groups(graph.schema, rel.target, rel.column, root_limit)
+            if parents and (best is None or parents[0][1] > best[1][0][1]):
+                best = (rel, parents)
+    if not best:
+        return []
+    (rel, parents) = best
+    where = {rel.target_column: {'_in': [p if isinstance(p, (int, str)) else str(p) for (p, _) in parents]}}
+    max_children = parents[0][1]
+    skipped = [f for f in fan_outs if f > max_children]
+    if skipped:
+        # Their queries would return the same rows as that of max_children
+        print("Skipping fan-outs {} of {}.{}, which has at most {} children per parent".format(
+            skipped, rel.table, rel.name, max_children))
+    return [
+        mk_query(
+            'gen_fan_out_{}'.format(f),
+            Field(graph.root_field(rel.table), {'where': where, 'limit': len(parents)},
+                  columns_fields(graph, rel.table) + [relationship_field(graph, rel, limit=f)]),
+            shape_tags('fan_out', rel.table, depth=1, breadth=1, fan_out=f, root_limit=len(parents),
+                       relationships=[rel.name], max_children=max_children)
+        )
+        for f in fan_outs if f <= max_children
+    ]
+
+
+def filter_condition(rel):
+    """The related rows exist: an inner join for an object relationship, EXISTS for an array relationship"""
+    column = rel.target_column if rel.kind == 'object' else rel.column
+    return {rel.name: {column: {'_is_null': False}}}
+
+
+def filters_queries(graph, max_filters, root_limit):
+    root = root_with_most(graph, ('object', 'array'))
+    rels = graph.relationships[root][:max_filters]
+    queries = []
+    for k in range(len(rels) + 1):
+        args = {'limit': root_limit}
+        if k:
+            args['where'] = {'_and': [filter_condition(rel) for rel in rels[:k]]}
+        queries.append(mk_query(
+            'gen_filters_{}'.format(k),
+            Field(graph.root_field(root), args, columns_fields(graph, root)),
+            shape_tags('filters', root, filters=k, root_limit=root_limit, relationships=[r.name for r in rels[:k]])
+        ))
+    return queries
+
+
+def aggregates_queries(graph, max_aggregates, root_limit):
+    root = root_with_most(graph, ('array',))
+    rels = [r for r in graph.relationships[root] if r.kind == 'array'][:max_aggregates]
+    return [
+        mk_query(
+            'gen_aggregates_{}'.format(k),
+            Field(graph.root_field(root), {'limit': root_limit}, columns_fields(graph, root) + [
+                Field(rel.name + '_aggregate', fields=[Field('aggregate', fields=[Field('count')])])
+                for rel in rels[:k]
+            ]),
+            shape_tags('aggregates', root, depth=1 if k else 0, breadth=k, aggregates=k, root_limit=root_limit,
+                       relationships=[r.name for r in rels[:k]])
+        )
+        for k in range(len(rels) + 1)
+    ]
+
+
+def order_by_queries(graph, max_depth, root_limit, rng):
+    path = longest_path(graph, max_depth, kinds=('object',), rng=rng)
+    if not path:
+        return []
+    root = path[0].table
+    queries = []
+    for d in range(len(path) + 1):
+        # The referenced column of the last relationship, or the id of the root table
+        order_by = {(path[d - 1].target_column if d else graph.selection(root)[0]): Enum('asc')}
+        for rel in reversed(path[:d]):
+            order_by = {rel.name: order_by}
+        queries.append(mk_query(
+            'gen_order_by_{}'.format(d),
+            Field(graph.root_field(root), {'limit': root_limit, 'order_by': order_by}, columns_fields(graph, root)),
+            shape_tags('order_by', root, order_by_depth=d, root_limit=root_limit, path=[r.name for r in path[:d]])
+        ))
+    return queries
+
+
+def generate_queries(graph, pg, selected_families=families, max_depth=default_max_depth,
+                     max_breadth=default_max_breadth, fan_outs=default_fan_outs,
+                     root_limit=default_root_limit, seed=0):
+    """Returns (name, query text, tags) of the queries of every selected family"""
+    rng = random.Random(seed)
+    queries = []
+    for family in selected_families:
+        if family == 'depth':
+            queries += depth_queries(graph, max_depth, root_limit, rng)
+        elif family == 'breadth':
+            queries += breadth_queries(graph, max_breadth, root_limit)
+        elif family == 'fan_out':
+            queries += fan_out_queries(graph, pg, fan_outs, root_limit)
+        elif family == 'filters':
+            queries += filters_queries(graph, max_breadth, root_limit)
+        elif family == 'aggregates':
+            queries += aggregates_queries(graph, max_breadth, root_limit)
+        elif family == 'order_by':
+            queries += order_by_queries(graph, max_depth, root_limit, rng)
+        else:
+            raise QueryGenError('Unknown query family: ' + family)
+    return queries
+
+
+def format_queries_file(queries, schema):
+    out = ['# Generated from the foreign key relationships of schema {}'.format(schema)]
+    for (_, text, tags) in queries:
+        out.append('\n# tags: {}\n{}'.format(json.dumps(tags, sort_keys=True), text))
+    return '\n'.join(out) + '\n'
+
+
+def parse_tags(source):
+    """The tags of the queries of a queries file, by query name"""
+    return {m.group(2): json.loads(m.group(1)) for m in tags_comment_re.finditer(source)}
@@ -0,0 +1,190 @@
+"""
+Remote join overhead benchmark.
+
+For foreign keys of the sportsdb tables, the same data is requested through
+the local object relationship, and through the equivalent remote relationship
+to remote_hge (created by HGETestSetup.create_remote_relationships), for
+fan-outs of parent rows. For every pair of queries are measured:
+- latencies of sequential requests, and their difference (the overhead)
+- bytes of the response
+- the number of requests made to remote_hge, and the bytes of its responses,
+  counted from its http-log lines
+"""
+
+import json
+import time
+
+import numpy as np
+import requests
+from psycopg2.sql import SQL, Identifier
+
+default_fan_outs = [1, 10, 100, 1000]
+
+remote_schema = 'remote_hge'
+
+# Schema of the tables of remote_hge, which prefixes its root fields
+remote_tables_schema = 'remote_hge'
+
+
+def find_relationship_pairs(metadata, schema='hge'):
+    """
+    (table, column, ref_table, local relationship, remote relationship) for
+    every foreign key having an object relationship and an equivalent remote
+    relationship to remote_hge
+    """
+    pairs = []
+    for t in metadata.get('tables') or []:
+        table = t['table']
+        if table['schema'] != schema:
+            continue
+        local = {}
+        for rel in t.get('object_relationships') or []:
+            col = rel['using'].get('foreign_key_constraint_on')
+            if isinstance(col, str):
+                local[col] = rel['name']
+        for rel in t.get('remote_relationships') or []:
+            definition = rel['definition']
+            fields = definition.get('hasura_fields') or []
+            remote_field = definition.get('remote_field') or {}
+            if definition.get('remote_schema') != remote_schema or len(fields) != 1 or len(remote_field) != 1:
+                continue
+            (field_name, field) = next(iter(remote_field.items()))
+            # The fk-ish object relationship, i.e. <remote>_<ref_table>_by_pk(id: $<column>)
+            if (field_name.endswith('_by_pk') and 'field' not in field
+                    and field.get('arguments') == {'id': '$' + fields[0]}
+                    and fields[0] in local):
+                ref_table = field_name[len(remote_tables_schema + '_'):-len('_by_pk')]
+                pairs.append((table['name'], fields[0], ref_table, local[fields[0]], rel['name']))
+    return pairs
+
+
+def count_rows(pg, table, column, schema='hge'):
+    with pg.cursor() as cursor:
+        cursor.execute(SQL('SELECT count(*) FROM {}.{} WHERE {} IS NOT NULL;').format(
+            Identifier(schema), Identifier(table), Identifier(column)))
+        return cursor.fetchone()[0]
+
+
+def choose_pairs(pg, pairs, max_pairs, min_rows):
+    """The relationship pairs whose tables have the most rows, from different tables"""
+    counted = sorted(
+        ((count_rows(pg, p[0], p[1]), p) for p in pairs),
+        key=lambda x: x[0], reverse=True
+    )
+    chosen = []
+    tables = set()
+    for (rows, p) in counted:
+        if p[0] in tables or rows < min_rows:
+            continue
+        chosen.append((p, rows))
+        tables.add(p[0])
+        if len(chosen) == max_pairs:
+            break
+    return chosen
+
+
+def mk_queries(pair, ref_columns, fan_out, schema='hge'):
+    """The query through the local relationship, and through the remote one"""
+    (table, column, _, local_rel, remote_rel) = pair
+    selection = ' '.join(ref_columns)
+
+    def query(kind, rel):
+        return '''
+query {kind}_{table}_{column}_{fan_out} {{
+  {schema}_{table}(limit: {fan_out}, where: {{{column}: {{_is_null: false}}}}, order_by: {{id: asc}}) {{
+    id
+    {column}
+    {rel} {{ {selection} }}
+  }}
+}}'''.format(kind=kind, table=table, column=column, fan_out=fan_out, schema=schema, rel=rel, selection=selection)
+
+    return (query('local', local_rel), query('remote', remote_rel))
+
+
+def http_logs(logs):
+    return [l for l in logs if l.get('type') == 'http-log']
+
+
+def count_upstream(hge, remote_hge, query):
+    """Requests made to remote_hge by one query, and the bytes of their responses"""
+    # Docker logs are marked in seconds
+    time.sleep(1)
+    marker = remote_hge.get_log_marker()
+    if marker is None:
+        return (None, None)
+    time.sleep(1)
+    hge.graphql_q(query)
+    # Logs are flushed asynchronously
+    time.sleep(1)
+    upstream = http_logs(remote_hge.get_logs_since(marker))
+    return (
+        len(upstream),
+        sum(l['detail'].get('operation', {}).get('response_size') or 0 for l in upstream)
+    )
+
+
+def time_query(hge, query, requests_count, warmup=5):
+    body = json.dumps({'query': query})
+    headers = {**hge.admin_auth_headers(), 'Content-Type': 'application/json'}
+    latencies = []
+    with requests.Session() as session:
+        for i in range(warmup + requests_count):
+            start = time.perf_counter()
+            resp = session.post(hge.url + '/v1/graphql', data=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            assert resp.status_code == 200 and 'errors' not in resp.json(), resp.text
+            if i >= warmup:
+                latencies.append(elapsed * 1000.0)
+    latencies = np.array(latencies)
+    return {
+        'requests': requests_count,
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'request_bytes': len(body),
+        'response_bytes': len(resp.content)
+    }
+
+
+def measure_pair(hge, remote_hge, local_query, remote_query, requests_count):
+    local = time_query(hge, local_query, requests_count)
+    remote = time_query(hge, remote_query, requests_count)
+    (remote['upstream_requests'], remote['upstream_response_bytes']) = count_upstream(hge, remote_hge, remote_query)
+    return {
+        'local': local,
+        'remote': remote,
+        'overhead': {
+            'mean_ms': remote['mean_ms'] - local['mean_ms'],
+            'p50_ms': remote['p50_ms'] - local['p50_ms'],
+            'p99_ms': remote['p99_ms'] - local['p99_ms'],
+            'ratio_p50': remote['p50_ms'] / local['p50_ms'] if local['p50_ms'] else None
+        }
+    }
+
+
+def run_remote_join_benchmark(hge, remote_hge, pg, fan_outs=default_fan_outs, max_pairs=3, requests_count=100):
+    """Yields the measurements for every relationship pair and fan-out"""
+    pairs = find_relationship_pairs(hge.export_metadata())
+    if not pairs:
+        raise ValueError('No remote relationships to remote_hge found in the metadata')
+    for ((table, column, ref_table, local_rel, remote_rel), rows) in choose_pairs(pg, pairs, max_pairs, min(fan_outs)):
+        ref_columns = pg.get_all_columns_of_a_table(ref_table, 'hge')
+        pair = (table, column, ref_table, local_rel, remote_rel)
+        for fan_out in sorted(set(fan_outs)):
+            if fan_out > rows:
+                print("Skipping fan-out {} of {}.{}, which has only {} rows".format(fan_out, table, column, rows))
+                continue
+            (local_query, remote_query) = mk_queries(pair, ref_columns, fan_out)
+            print("Remote join {}.{} -> {}, fan-out {}".format(table, column, ref_table, fan_out))
+            out = measure_pair(hge, remote_hge, local_query, remote_query, requests_count)
+            out.update({
+                'table_name': table,
+                'column_name': column,
+                'ref_table': ref_table,
+                'local_relationship': local_rel,
+                'remote_relationship': remote_rel,
+                'fan_out': fan_out,
+                'local_query': local_query,
+                'remote_query': remote_query
+            })
+            yield out
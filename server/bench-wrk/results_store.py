@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+
+"""
+Stores of benchmark results.
+
+A result is the insert input of a table of the hge_bench schema (see
+results_schema.yaml), as built by the insert methods of
+hge_wrk_bench.py. Results are appended to a store in batches:
+- HGEResultsStore inserts them into a graphql-engine tracking the hge_bench
+  schema (the results HGE), with GraphQL mutations
+- ParquetResultsStore appends them to local Parquet files, one directory per
+  table and one file per batch. Object relationships (cpu, query) are
+  flattened into columns, and array relationships (latency_histogram,
+  telemetry) into list columns, one per field, so that e.g. the percentiles
+  and latencies of a histogram are columns of their own. jsonb columns are
+  stored as JSON text. Files are read with predicate pushdown, e.g.
+  store.read_table('results', filters=[('version', '=', 'v1.3.0')])
+
+The results of a Parquet store can be synced to the hge_bench schema of a
+results HGE later on:
+
+    python3 hge_wrk_bench.py export-results --results-parquet-dir <dir> --results-hge-url <url>
+
+Only the results more recent than the latest one of every table in the
+results HGE are exported.
+"""
+
+import abc
+import argparse
+import datetime
+import glob
+import importlib
+import json
+import os
+import sys
+import uuid
+
+import pandas as pd
+import ruamel.yaml as yaml
+from colorama import Fore, Style
+
+from run_hge import HGE
+
+fileLoc = os.path.dirname(os.path.abspath(__file__))
+
+# Tables of results, in the order they are exported
+result_tables = [
+    'results', 'query_max_rps', 'subscription_results', 'ab_results', 'startup_results',
+    'metadata_results', 'remote_join_results', 'plan_cache_results', 'mutation_results',
+    'event_results', 'scheduled_results', 'auth_results', 'compression_results',
+    'scaling_results', 'scaling_fits', 'soak_results'
+]
+
+# Object relationships of the insert inputs: the columns their fields are
+# flattened into, and the conflict clause they are inserted with
+object_relationships = {
+    'cpu': {
+        'columns': {'key': 'cpu_key', 'info': 'cpu_info'},
+        'on_conflict': {'constraint': 'cpu_info_pkey', 'update_columns': 'key'}
+    },
+    'query': {
+        'columns': {'name': 'query_name', 'query': 'query_text', 'tags': 'query_tags'},
+        'on_conflict': {'constraint': 'gql_query_query_key', 'update_columns': 'query'}
+    }
+}
+
+# Array relationships of the insert inputs, flattened into list columns named
+# <relationship>__<field>
+array_relationships = ['latency_histogram', 'telemetry']
+
+parquet_metadata_key = b'hge_bench'
+
+
+class ResultsStore(abc.ABC):
+    """Buffers the results of every table, and writes them in batches of batch_size"""
+
+    def __init__(self, batch_size=1):
+        self.batch_size = max(1, int(batch_size))
+        self.pending = {}
+
+    def setup(self):
+        pass
+
+    def insert(self, table, result):
+        rows = self.pending.setdefault(table, [])
+        rows.append(result)
+        if len(rows) >= self.batch_size:
+            self.flush_table(table)
+
+    def flush_table(self, table):
+        rows = self.pending.pop(table, [])
+        if rows:
+            self.write_batch(table, rows)
+
+    def flush(self):
+        for table in list(self.pending):
+            self.flush_table(table)
+
+    @abc.abstractmethod
+    def write_batch(self, table, rows):
+        """Write the results of a table"""
+
+    @abc.abstractmethod
+    def get_results(self, version=None):
+        """
+        Latest latency results and average max throughputs, of the given
+        version (or docker image) if any, in the shape of the results query
+        """
+
+
+results_query = '''
+query results($latency_where: hge_bench_latest_results_bool_exp!, $max_rps_where: hge_bench_avg_query_max_rps_bool_exp!) {
+  latency: hge_bench_latest_results(where: $latency_where) {
+    cpu_key
+    query_name
+    requests_per_sec
+    docker_image
+    version
+    latencies_uri
+    scale_factor
+    latency_histogram {
+      percentile
+      latency
+    }
+  }
+  max_rps: hge_bench_avg_query_max_rps(where: $max_rps_where) {
+    cpu_key
+    query_name
+    docker_image
+    version
+    max_rps
+    scale_factor
+  }
+}
+'''
+
+
+def version_bool_exp(version):
+    if not version:
+        return {}
+    return {'_or': [{'version': {'_eq': version}}, {'docker_image': {'_eq': version}}]}
+
+
+class HGEResultsStore(ResultsStore):
+    """Results stored in the hge_bench schema, through a results HGE"""
+
+    def __init__(self, results_hge, batch_size=1):
+        super().__init__(batch_size)
+        self.results_hge = results_hge
+
+    def setup(self):
+        schema_file = os.path.join(fileLoc, 'results_schema.yaml')
+        with open(schema_file) as f:
+            queries = yaml.safe_load(f)
+        # Run the queries one by one, so that tables and relationships added to
+        # the schema later also get created in an existing results database
+        for q in queries:
+            self.results_hge.v1q_if_not_exists(q)
+
+    def write_batch(self, table, rows):
+        insert_query = """
+mutation insertResults($objects: [hge_bench_{table}_insert_input!]!) {{
+  insert_hge_bench_{table}(objects: $objects){{
+    affected_rows
+  }}
+}}""".format(table=table)
+        self.results_hge.graphql_q(insert_query, {'objects': rows})
+
+    def get_results(self, version=None):
+        where = version_bool_exp(version)
+        output = self.results_hge.graphql_q(results_query, {'latency_where': where, 'max_rps_where': where})
+        return output['data']
+
+    def latest_time(self, table):
+        query = '''
+query latest {{
+  hge_bench_{table}_aggregate {{
+    aggregate {{
+      max {{
+        time
+      }}
+    }}
+  }}
+}}'''.format(table=table)
+        output = self.results_hge.graphql_q(query)
+        return output['data']['hge_bench_{}_aggregate'.format(table)]['aggregate']['max']['time']
+
+
+def flatten_result(result):
+    """A row of a Parquet file, and its columns holding JSON text"""
+    row = {}
+    json_columns = []
+    for (k, v) in result.items():
+        if k in object_relationships:
+            for (field, column) in object_relationships[k]['columns'].items():
+                value = v['data'].get(field)
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value)
+                    json_columns.append(column)
+                row[column] = value
+        elif k in array_relationships and isinstance(v, dict) and 'data' in v:
+            # e.g. latency_histogram is an array relationship of results, but
+            # a jsonb column of subscription_results
+            items = v['data']
+            for field in sorted(set(f for item in items for f in item)):
+                column = k + '__' + field
+                values = [item.get(field) for item in items]
+                if any(isinstance(x, (dict, list)) for x in values):
+                    values = [json.dumps(x) for x in values]
+                    json_columns.append(column)
+                row[column] = values
+        elif isinstance(v, (dict, list)):
+            row[k] = json.dumps(v)
+            json_columns.append(k)
+        else:
+            row[k] = v
+    return (row, json_columns)
+
+
+def unflatten_row(row):
+    """The insert input of a row read from a Parquet file"""
+    result = {}
+    arrays = {}
+    for (k, v) in row.items():
+        if v is None:
+            continue
+        rel = k.split('__', 1)[0] if '__' in k else None
+        if rel in array_relationships:
+            arrays.setdefault(rel, {})[k.split('__', 1)[1]] = list(v)
+        else:
+            result[k] = v
+    for (rel, spec) in object_relationships.items():
+        data = {field: result.pop(column) for (field, column) in spec['columns'].items() if column in result}
+        if data:
+            result[rel] = {'data': data, 'on_conflict': spec['on_conflict']}
+    for (rel, fields) in arrays.items():
+        length = max(len(values) for values in fields.values())
+        result[rel] = {
+            'data': [
+                {field: values[i] for (field, values) in fields.items() if i < len(values)}
+                for i in range(length)
+            ]
+        }
+    return result
+
+
+def native(x):
+    """x with numpy and pandas values converted to Python ones, and nulls to None"""
+    if isinstance(x, dict):
+        return {k: native(v) for (k, v) in x.items()}
+    if isinstance(x, (list, tuple)) or getattr(x, 'ndim', 0) > 0:
+        return [native(i) for i in x]
+    if isinstance(x, pd.Timestamp):
+        return x.isoformat()
+    if x is None or pd.isnull(x):
+        return None
+    return x.item() if hasattr(x, 'item') else x
+
+
+class ParquetResultsStore(ResultsStore):
+    """Results stored as Parquet files under results_dir"""
+
+    def __init__(self, results_dir, batch_size=50):
+        super().__init__(batch_size)
+        self.results_dir = os.path.abspath(results_dir)
+
+    def setup(self):
+        # pyarrow is only needed by this store: fail before running any benchmark
+        importlib.import_module('pyarrow.parquet')
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def table_dir(self, table):
+        return os.path.join(self.results_dir, table)
+
+    def write_batch(self, table, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        now = datetime.datetime.now(datetime.timezone.utc)
+        flattened = []
+        json_columns = set()
+        for result in rows:
+            (row, columns) = flatten_result(result)
+            row.setdefault('time', now)
+            flattened.append(row)
+            json_columns.update(columns)
+        df = pd.DataFrame(flattened)
+        df['time'] = pd.to_datetime(df['time'], utc=True)
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(arrow_table.schema.metadata or {})
+        metadata[parquet_metadata_key] = json.dumps({'json_columns': sorted(json_columns)}).encode('utf8')
+        arrow_table = arrow_table.replace_schema_metadata(metadata)
+        os.makedirs(self.table_dir(table), exist_ok=True)
+        file_name = 'part-{}-{}.parquet'.format(now.strftime('%Y%m%dT%H%M%S%f'), uuid.uuid4().hex[:8])
+        # Write to a hidden file first, so that readers never see a partial file
+        tmp_file = os.path.join(self.table_dir(table), '.' + file_name)
+        pq.write_table(arrow_table, tmp_file)
+        os.rename(tmp_file, os.path.join(self.table_dir(table), file_name))
+
+    def read_table(self, table, filters=None, columns=None, decode_json=True):
+        """
+        The results of a table as a DataFrame. filters are pushed down to the
+        Parquet files, in the DNF of pyarrow.parquet.read_table
+        """
+        import pyarrow.parquet as pq
+        frames = []
+        for f in sorted(glob.glob(os.path.join(self.table_dir(table), 'part-*.parquet'))):
+            schema = pq.read_schema(f)
+            # Columns added later are missing from earlier files
+            filter_columns = set(c for conj in (filters or []) for (c, _, _) in (conj if isinstance(conj, list) else [conj]))
+            if not filter_columns.issubset(schema.names):
+                continue
+            file_columns = [c for c in columns if c in schema.names] if columns else None
+            arrow_table = pq.read_table(f, columns=file_columns, filters=filters, use_legacy_dataset=False)
+            df = arrow_table.to_pandas()
+            if decode_json:
+                info = json.loads((schema.metadata or {}).get(parquet_metadata_key, b'{}'))
+                for column in info.get('json_columns', []):
+                    if column in df.columns:
+                        df[column] = df[column].map(decode_json_value)
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        for column in columns or []:
+            if column not in df.columns:
+                df[column] = None
+        return df
+
+    def read_results(self, table, filters=None):
+        """The insert inputs of the results of a table"""
+        df = self.read_table(table, filters)
+        return [unflatten_row(native(row)) for row in df.to_dict('records')]
+
+    def get_results(self, version=None):
+        latency_columns = ['cpu_key', 'query_name', 'requests_per_sec', 'docker_image', 'version',
+                           'latencies_uri', 'scale_factor', 'time',
+                           'latency_histogram__percentile', 'latency_histogram__latency']
+        max_rps_columns = ['cpu_key', 'query_name', 'docker_image', 'version', 'max_rps', 'scale_factor']
+        latency = self.read_table('results', columns=latency_columns)
+        max_rps = self.read_table('query_max_rps', columns=max_rps_columns)
+        if version:
+            latency = latency[(latency['version'] == version) | (latency['docker_image'] == version)]
+            max_rps = max_rps[(max_rps['version'] == version) | (max_rps['docker_image'] == version)]
+        # As the hge_bench.latest_results view
+        latency = latency.sort_values('time').drop_duplicates(
+            ['cpu_key', 'docker_image', 'version', 'query_name', 'requests_per_sec', 'scale_factor'], keep='last')
+        # As the hge_bench.avg_query_max_rps view. Null keys are grouped
+        # together, as by Postgres, instead of being dropped
+        nullable = ['cpu_key', 'docker_image', 'version']
+        max_rps = (max_rps.fillna({k: '' for k in nullable})
+                   .groupby(['cpu_key', 'query_name', 'docker_image', 'version', 'scale_factor'], as_index=False)['max_rps']
+                   .mean())
+
+        def latency_row(r):
+            r = native(r)
+            out = {k: r[k] for k in latency_columns if not k.startswith('latency_histogram') and k != 'time'}
+            out['latency_histogram'] = [
+                {'percentile': p, 'latency': l}
+                for (p, l) in zip(r['latency_histogram__percentile'] or [], r['latency_histogram__latency'] or [])
+            ]
+            return out
+
+        def max_rps_row(r):
+            return {k: None if k in nullable and v == '' else v for (k, v) in native(r).items()}
+
+        return {
+            'latency': [latency_row(r) for r in latency.to_dict('records')],
+            'max_rps': [max_rps_row(r) for r in max_rps.to_dict('records')]
+        }
+
+
+def decode_json_value(x):
+    if isinstance(x, str):
+        return json.loads(x)
+    # List columns of array relationships
+    if getattr(x, 'ndim', 0) > 0 or isinstance(x, list):
+        return [decode_json_value(i) for i in x]
+    return x
+
+
+def export_to_hge(parquet_store, hge_store, tables=result_tables, batch_size=100):
+    """Insert the results of parquet_store more recent than the latest of every table in hge_store"""
+    hge_store.batch_size = batch_size
+    for table in tables:
+        latest = hge_store.latest_time(table)
+        filters = [('time', '>', pd.Timestamp(latest))] if latest else None
+        rows = parquet_store.read_results(table, filters)
+        print("Exporting {} results of table {}".format(len(rows), table))
+        for row in rows:
+            hge_store.insert(table, row)
+        hge_store.flush()
+
+
+def add_results_store_args(parser):
+    parser.add_argument('--results-hge-url', metavar='HASURA_BENCH_RESULTS_HGE_URL', help='The GraphQL engine in which the results are stored', default=os.getenv('HASURA_BENCH_RESULTS_HGE_URL'))
+    parser.add_argument('--results-hge-admin-secret', metavar='HASURA_BENCH_RESULTS_HGE_ADMIN_SECRET', help='Admin secret of the results GraphQL engine', default=os.getenv('HASURA_BENCH_RESULTS_HGE_ADMIN_SECRET'))
+    parser.add_argument('--results-parquet-dir', metavar='HASURA_BENCH_RESULTS_PARQUET_DIR', help='Directory of Parquet files in which the results are stored, instead of the results GraphQL engine', default=os.getenv('HASURA_BENCH_RESULTS_PARQUET_DIR'))
+
+
+def mk_results_hge(results_hge_url, results_hge_admin_secret):
+    hge_args = ['--admin-secret', results_hge_admin_secret] if results_hge_admin_secret else []
+    return HGE(None, None, args=hge_args, log_file=None, url=results_hge_url)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the results stored in Parquet files to the hge_bench schema of a results GraphQL engine')
+    add_results_store_args(parser)
+    parser.add_argument('--batch-size', help='Number of results inserted by every mutation (default: 100)', type=int, default=100)
+    args = parser.parse_args(argv)
+    if not args.results_parquet_dir or not args.results_hge_url:
+        parser.error('--results-parquet-dir and --results-hge-url are required')
+    parquet_store = ParquetResultsStore(args.results_parquet_dir)
+    hge_store = HGEResultsStore(mk_results_hge(args.results_hge_url, args.results_hge_admin_secret))
+    hge_store.setup()
+    export_to_hge(parquet_store, hge_store, batch_size=args.batch_size)
+    print(Fore.GREEN + "Exported results to " + args.results_hge_url + Style.RESET_ALL)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,11 +3,13 @@ import subprocess
 import argparse
 import json
 import signal
+import socket
 import time
 import contextlib
 import requests
 import inflection
 import docker
+import psutil
 from colorama import Fore, Style
 
 
@@ -17,10 +19,29 @@ def rm_file_if_exists(f):
         os.remove(f)
 
 
+def hdr_name_val_pairs(headers):
+    return [{'name': k, 'value': v} for (k, v) in headers.items()]
+
+
 class HGEError(Exception):
     """Exception type for class HGE"""
 
 
+def container_memory(memory_stats):
+    """
+    Memory usage of a container, less its page cache: 'cache' with cgroup v1,
+    'inactive_file' with cgroup v2
+    """
+    usage = memory_stats.get('usage')
+    if usage is None:
+        return None
+    stats = memory_stats.get('stats') or {}
+    for key in ['cache', 'inactive_file']:
+        if key in stats:
+            return usage - stats[key]
+    return usage
+
+
 class HGE:
 
     default_graphql_env = {
@@ -31,7 +52,7 @@ class HGE:
         'HASURA_GRAPHQL_ENABLE_CONSOLE' : 'true'
     }
 
-    def __init__(self, pg, port_allocator, docker_image=None, log_file='hge.log', url=None, args=[]):
+    def __init__(self, pg, port_allocator, docker_image=None, log_file='hge.log', url=None, args=[], executable=None, cpus=None):
         self.pg = pg
         self.log_file = log_file
         if self.log_file:
@@ -45,6 +66,10 @@ class HGE:
         self.proc = None
         self.container = None
         self.args = args
+        # A graphql-engine binary to be run instead of 'cabal run'
+        self.executable = executable
+        # CPUs graphql-engine should be pinned to
+        self.cpus = cpus
 
 
     def admin_secret(self):
@@ -72,15 +97,16 @@ class HGE:
         }
         return hge_env
 
-    def run(self):
+    def run(self, wait=True):
+        """Run graphql-engine. With wait=False, return as soon as it is launched"""
         if self.url:
             return
         if self.docker_image:
-            self.run_with_docker()
+            self.run_with_docker(wait)
         else:
-            self.run_with_cabal()
+            self.run_with_cabal(wait)
 
-    def run_with_docker(self):
+    def run_with_docker(self, wait=True):
         if self.url:
             return
         self.port = self.port_allocator.allocate_port(8080)
@@ -91,6 +117,7 @@ class HGE:
         print("Running GraphQL Engine docker with image:",
               self.docker_image, '(port:{})'.format(self.port))
         print(process_args)
+        self.launch_time = time.time()
         self.container = self.docker_client.containers.run(
             self.docker_image,
             command=process_args,
@@ -98,23 +125,36 @@ class HGE:
             ports=docker_ports,
             environment=hge_env,
             network_mode='host',
-            volumes={}
+            volumes={},
+            cpuset_cpus=','.join(str(c) for c in self.cpus) if self.cpus else None
         )
         self.url = 'http://127.0.0.1:' + str(self.port)
-        print("Waiting for GraphQL Engine to be running.", end='')
-        self.wait_for_start()
+        if wait:
+            print("Waiting for GraphQL Engine to be running.", end='')
+            self.wait_for_start()
 
 
-    def run_with_cabal(self):
+    def run_with_cabal(self, wait=True):
         if self.url:
             return
         self.port = self.port_allocator.allocate_port(8080)
         rm_file_if_exists(self.tix_file)
         hge_env = self.get_hge_env()
-        process_args = ['cabal', 'new-run', '--', 'exe:graphql-engine', 'serve', *self.args]
-        print("Running GraphQL with 'cabal run': (port:{})".format(self.port))
+        if self.executable:
+            process_args = [self.executable, 'serve', *self.args]
+            print("Running GraphQL engine {}: (port:{})".format(self.executable, self.port))
+        else:
+            process_args = ['cabal', 'new-run', '--', 'exe:graphql-engine', 'serve', *self.args]
+            print("Running GraphQL with 'cabal run': (port:{})".format(self.port))
         print(process_args)
         self.log_fp = open(self.log_file, 'w')
+        cpus = self.cpus
+
+        def pin_cpus():
+            # Inherited by the child processes, and all threads of graphql-engine
+            if cpus:
+                os.sched_setaffinity(0, cpus)
+        self.launch_time = time.time()
         self.proc = subprocess.Popen(
             process_args,
             env=hge_env,
@@ -122,11 +162,21 @@ class HGE:
             bufsize=-1,
             start_new_session=True,
             stdout=self.log_fp,
-            stderr=subprocess.STDOUT
+            stderr=subprocess.STDOUT,
+            preexec_fn=pin_cpus
         )
         self.url = 'http://127.0.0.1:' + str(self.port)
-        print("Waiting for GraphQL Engine to be running.", end='')
-        self.wait_for_start()
+        if wait:
+            print("Waiting for GraphQL Engine to be running.", end='')
+            self.wait_for_start()
+
+    def get_version(self):
+        """Version of the docker image or the executable. None for 'cabal run' and external graphql-engines"""
+        if self.docker_image:
+            return self.docker_image
+        elif self.executable:
+            return subprocess.check_output([self.executable, 'version']).decode().strip()
+        return None
 
     def check_if_process_is_running(self):
         if self.proc.poll() is not None:
@@ -142,27 +192,45 @@ class HGE:
                 self.container.logs(stdout=True, stderr=True).decode('ascii')
             )
 
-    def wait_for_start(self, timeout=120):
-        if timeout <= 0:
-            raise HGEError("Timeout waiting for graphql process to start")
+    def check_if_running(self):
         if self.proc:
             self.check_if_process_is_running()
         elif self.container:
             self.check_if_container_is_running()
+
+    def is_listening(self):
+        try:
+            with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def is_serving(self):
         try:
             q = { 'query': 'query { __typename }' }
             r = requests.post(self.url + '/v1/graphql',json.dumps(q),headers=self.admin_auth_headers())
-            if r.status_code == 200:
-                print()
-                return
+            return r.status_code == 200
         except requests.exceptions.ConnectionError:
-            pass
+            return False
         except ConnectionError:
-            pass
-        print(".", end="", flush=True),
-        sleep_time = 0.5
-        time.sleep(sleep_time)
-        self.wait_for_start(timeout - sleep_time)
+            return False
+
+    def wait_for_start(self, timeout=120, poll_interval=0.5, quiet=False):
+        """
+        Wait till graphql-engine serves queries. Returns the time in seconds
+        from the launch of graphql-engine
+        """
+        deadline = time.time() + timeout
+        while not self.is_serving():
+            if time.time() > deadline:
+                raise HGEError("Timeout waiting for graphql process to start")
+            self.check_if_running()
+            if not quiet:
+                print(".", end="", flush=True)
+            time.sleep(poll_interval)
+        if not quiet:
+            print()
+        return time.time() - self.launch_time if getattr(self, 'launch_time', None) else None
 
     def teardown(self):
         if getattr(self, 'log_fp', None):
@@ -192,6 +260,99 @@ class HGE:
         self.container.remove()
         self.container = None
 
+    def get_hge_process(self):
+        proc = psutil.Process(self.proc.pid)
+        # 'cabal new-run' runs graphql-engine as its child process
+        for p in [proc] + proc.children(recursive=True):
+            if p.name().startswith('graphql-engine'):
+                return p
+        return proc
+
+    def get_process_stats(self):
+        """
+        CPU time (in seconds), resident memory (in bytes; the usage without the
+        page cache for a container) and the number of threads of graphql-engine
+        """
+        if self.container:
+            stats = self.container.stats(stream=False)
+            return {
+                'cpu_seconds': stats['cpu_stats']['cpu_usage']['total_usage'] / 1e9,
+                'rss_bytes': container_memory(stats['memory_stats']),
+                'threads': stats.get('pids_stats', {}).get('current')
+            }
+        elif self.proc:
+            p = self.get_hge_process()
+            with p.oneshot():
+                cpu = p.cpu_times()
+                return {
+                    'cpu_seconds': cpu.user + cpu.system,
+                    'rss_bytes': p.memory_info().rss,
+                    'threads': p.num_threads()
+                }
+        # Not started by us
+        return None
+
+    def get_peak_rss(self):
+        """Peak resident memory of graphql-engine so far, in bytes"""
+        if self.container:
+            # Only available with cgroup v1
+            return self.container.stats(stream=False)['memory_stats'].get('max_usage')
+        elif self.proc:
+            # High water mark of the resident set, from /proc
+            with open('/proc/{}/status'.format(self.get_hge_process().pid)) as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        return None
+
+    def get_log_marker(self):
+        """A marker for the current position in logs, to be used with get_logs_since"""
+        if self.container:
+            return int(time.time())
+        elif self.proc:
+            return os.path.getsize(self.log_file)
+        return None
+
+    def get_logs_since(self, marker):
+        """Get the JSON log lines of graphql-engine written after the marker"""
+        if self.container:
+            lines = self.container.logs(stdout=True, stderr=True, since=marker).decode().splitlines()
+        elif self.proc:
+            with open(self.log_file) as f:
+                f.seek(marker)
+                lines = f.readlines()
+        else:
+            return []
+        logs = []
+        for line in lines:
+            try:
+                logs.append(json.loads(line))
+            except ValueError:
+                # Output of cabal build etc.
+                continue
+        return logs
+
+    def dev_api(self, path):
+        """Get the output of developer API /dev/<path>. Returns None if developer APIs are not enabled"""
+        resp = requests.get(self.url + '/dev/' + path, headers=self.admin_auth_headers())
+        if resp.status_code != 200:
+            return None
+        return resp.json()
+
+    def get_gc_stats(self):
+        """
+        GHC RTS GC statistics from EKG. Returns None if developer APIs are not
+        enabled, or graphql-engine was not run with '+RTS -T'
+        """
+        ekg = self.dev_api('ekg')
+        if not ekg:
+            return None
+        gc = ekg.get('rts', {}).get('gc', {})
+        stats = {k: v['val'] for (k, v) in gc.items() if isinstance(v, dict) and 'val' in v}
+        if not stats.get('num_gcs'):
+            return None
+        return stats
+
     def admin_auth_headers(self):
         headers = {}
         if self.admin_secret():
@@ -203,15 +364,40 @@ class HGE:
         assert resp.status_code == exp_status, (resp.status_code, resp.json())
         return resp.json()
 
-    def graphql_q(self, query, variables={}, exp_status = 200):
+    def v1q_if_not_exists(self, q):
+        """Run the query, ignoring errors due to the objects being already present"""
+        resp = requests.post(self.url + '/v1/query', json.dumps(q), headers=self.admin_auth_headers())
+        if resp.status_code == 400 and resp.json().get('code') in ['already-exists', 'already-tracked']:
+            return resp.json()
+        assert resp.status_code == 200, (resp.status_code, resp.json())
+        return resp.json()
+
+    def graphql_q(self, query, variables={}, exp_status = 200, headers={}):
         q = {'query': query}
         if variables:
             q['variables'] = variables
-        resp = requests.post(self.url + '/v1/graphql', json.dumps(q), headers=self.admin_auth_headers())
+        resp = requests.post(self.url + '/v1/graphql', json.dumps(q), headers={**self.admin_auth_headers(), **headers})
         assert resp.status_code == exp_status, (resp.status_code, resp.json())
         assert 'errors' not in resp.json(), resp.json()
         return resp.json()
 
+    def explain_sql(self, query, variables={}, headers={}):
+        """
+        The SQL generated for the query, using /v1/graphql/explain. Returns a list
+        with the SQL of every root field, which is empty if the query can not be
+        explained (e.g. remote fields)
+        """
+        user = {k.lower(): v for (k, v) in headers.items() if k.lower().startswith('x-hasura-')}
+        q = {'query': {'query': query, 'variables': variables}, 'user': user}
+        resp = requests.post(self.url + '/v1/graphql/explain', json.dumps(q), headers=self.admin_auth_headers())
+        if resp.status_code != 200:
+            return []
+        res = resp.json()
+        # Subscriptions are explained as a single multiplexed query
+        if isinstance(res, dict):
+            return [res['sql']]
+        return [f['sql'] for f in res if f.get('sql')]
+
     def track_all_tables_in_schema(self, schema='public'):
         print("Track all tables in schema ", schema)
         all_tables = self.pg.get_all_tables_in_a_schema(schema)
@@ -273,11 +459,6 @@ class HGE:
         }
 
     def add_remote_schema(self, name, remote_url, headers={}, client_hdrs=False):
-        def hdr_name_val_pair(headers):
-            nvp = []
-            for (k,v) in headers.items():
-                nvp.append({'name': k, 'value': v})
-            return nvp
         if len(headers) > 0:
             client_hdrs = True
         q = {
@@ -287,7 +468,7 @@ class HGE:
                 'comment': name,
                 'definition': {
                     'url': remote_url,
-                    'headers':  hdr_name_val_pair(headers),
+                    'headers':  hdr_name_val_pairs(headers),
                     'forward_client_headers': client_hdrs
                 }
             }
@@ -462,3 +643,20 @@ class HGE:
                 }
             }
         return self.v1q(mk_run_sql_q(sql))
+
+    def export_metadata(self):
+        return self.v1q({'type': 'export_metadata', 'args': {}})
+
+    def replace_metadata(self, metadata):
+        return self.v1q({'type': 'replace_metadata', 'args': metadata})
+
+    def set_remote_schema_definition(self, metadata, name, remote_url, headers={}):
+        """
+        Point remote schema `name` of the (exported) metadata to remote_url,
+        e.g. when the remote graphql-engine is running on another port
+        """
+        for remote in metadata.get('remote_schemas') or []:
+            if remote['name'] == name:
+                remote['definition']['url'] = remote_url
+                remote['definition']['headers'] = hdr_name_val_pairs(headers)
+        return metadata
@@ -2,9 +2,12 @@ import docker
 import time
 from contextlib import contextmanager
 import psycopg2
+import psycopg2.errors
 from psycopg2.sql import SQL, Identifier
 from colorama import Fore, Style
 import os
+import subprocess
+from urllib.parse import urlparse, urlunparse
 
 
 class PostgresError(Exception):
@@ -52,7 +55,9 @@ class Postgres:
             detach=True,
             ports=docker_ports,
             environment=env,
-            volumes = docker_vols
+            volumes = docker_vols,
+            # For per statement costs of the SQL generated by graphql-engine
+            command = ['postgres', '-c', 'shared_preload_libraries=pg_stat_statements']
         )
         self.pg_container = cntnr
         self.url = 'postgresql://' + self.user + ':' + self.password + '@localhost:' + str(self.port) + '/' + self.database
@@ -157,6 +162,18 @@ class Postgres:
     def set_id_as_primary_key_for_table(self, cursor, table, schema='public'):
             cursor.execute(SQL('''ALTER TABLE {}.{} ADD PRIMARY KEY (id);''').format( Identifier(schema), Identifier(table) ))
 
+    def get_top_groups(self, schema, table, column, limit):
+        """The (non null) values of the column with the most rows, and their row counts"""
+        with self.cursor() as cursor:
+            cursor.execute(SQL('''
+            SELECT {column}, count(*) FROM {schema}.{table}
+            WHERE {column} IS NOT NULL
+            GROUP BY {column}
+            ORDER BY count(*) DESC, {column}
+            LIMIT %s;
+            ''').format(column=Identifier(column), schema=Identifier(schema), table=Identifier(table)), (limit,))
+            return cursor.fetchall()
+
     def get_all_tables_in_a_schema(self, schema='public'):
         tables = []
         with self.cursor() as cursor:
@@ -169,6 +186,260 @@ class Postgres:
                 tables.append(row[0])
         return tables
 
+    def copy_schema_structure(self, source_schema, target_schema):
+        """
+        Create empty copies of the tables of source_schema in target_schema,
+        along with their foreign keys among each other
+        """
+        print("Copying the tables of schema {} to schema {}".format(source_schema, target_schema))
+        fk_constraints = self.get_all_fk_constraints(source_schema)
+        with self.cursor() as cursor:
+            cursor.execute('''
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema = %s AND table_type = 'BASE TABLE';
+            ''', (source_schema,))
+            tables = [row[0] for row in cursor.fetchall()]
+            cursor.execute(SQL('CREATE SCHEMA IF NOT EXISTS {};').format(Identifier(target_schema)))
+            for table in tables:
+                cursor.execute(SQL('CREATE TABLE {}.{} (LIKE {}.{} INCLUDING ALL);').format(
+                    Identifier(target_schema), Identifier(table), Identifier(source_schema), Identifier(table)
+                ))
+            for (_, _, table, column, _, ref_table, ref_column) in fk_constraints:
+                cursor.execute(SQL('ALTER TABLE {}.{} ADD FOREIGN KEY ({}) REFERENCES {}.{} ({});').format(
+                    Identifier(target_schema), Identifier(table), Identifier(column),
+                    Identifier(target_schema), Identifier(ref_table), Identifier(ref_column)
+                ))
+
+    def drop_schema(self, schema):
+        with self.cursor() as cursor:
+            cursor.execute(SQL('DROP SCHEMA IF EXISTS {} CASCADE;').format(Identifier(schema)))
+
+    def truncate_tables(self, tables, schema='public'):
+        """Empty the tables, and restart their sequences"""
+        with self.cursor() as cursor:
+            cursor.execute(SQL('TRUNCATE {} RESTART IDENTITY CASCADE;').format(
+                SQL(', ').join(SQL('{}.{}').format(Identifier(schema), Identifier(t)) for t in tables)
+            ))
+
+    def delete_trigger_events(self, trigger_name):
+        """
+        Delete the events of an event trigger from the event log of
+        graphql-engine, with their invocation logs, which reference them. The
+        events are locked first, so that graphql-engine can not log new
+        invocations of them in the meantime
+        """
+        with self.cursor() as cursor:
+            cursor.execute(
+                'SELECT id FROM hdb_catalog.event_log WHERE trigger_name = %s FOR UPDATE;', (trigger_name,))
+            cursor.execute('''
+            DELETE FROM hdb_catalog.event_invocation_logs
+            WHERE event_id IN (SELECT id FROM hdb_catalog.event_log WHERE trigger_name = %s);
+            ''', (trigger_name,))
+            cursor.execute('DELETE FROM hdb_catalog.event_log WHERE trigger_name = %s;', (trigger_name,))
+
+    def get_wal_lsn(self):
+        with self.cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn();')
+            return cursor.fetchone()[0]
+
+    def get_wal_bytes_since(self, lsn):
+        """Bytes of WAL written since the location lsn"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s);', (lsn,))
+            return int(cursor.fetchone()[0])
+
+    def get_lock_waits(self):
+        """Number of backends of the current database waiting for a lock"""
+        with self.cursor() as cursor:
+            cursor.execute('''
+            SELECT count(*)
+            FROM pg_stat_activity
+            WHERE datname = current_database() AND wait_event_type = 'Lock';
+            ''')
+            return cursor.fetchone()[0]
+
+    def get_column_values(self, table, column, schema='public'):
+        with self.cursor() as cursor:
+            cursor.execute(SQL('''SELECT DISTINCT {} FROM {}.{} WHERE {} IS NOT NULL;''').format(
+                Identifier(column), Identifier(schema), Identifier(table), Identifier(column)
+            ))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_activity_stats(self):
+        """Backend counts by state, and the counters of pg_stat_database, for the current database"""
+        with self.cursor() as cursor:
+            cursor.execute('''
+            SELECT coalesce(state, 'unknown'), count(*)
+            FROM pg_stat_activity
+            WHERE datname = current_database()
+            GROUP BY 1;
+            ''')
+            backends = dict(cursor.fetchall())
+            cursor.execute('''
+            SELECT numbackends, xact_commit, xact_rollback, blks_read, blks_hit,
+                tup_returned, tup_fetched, tup_inserted, tup_updated, tup_deleted,
+                conflicts, temp_files, temp_bytes, deadlocks, blk_read_time, blk_write_time
+            FROM pg_stat_database
+            WHERE datname = current_database();
+            ''')
+            columns = [c[0] for c in cursor.description]
+            database = dict(zip(columns, cursor.fetchone()))
+        return {'backends': backends, 'database': database}
+
+    def enable_pg_stat_statements(self):
+        """
+        Create extension pg_stat_statements. Returns False if it is not available,
+        i.e. it is not in shared_preload_libraries of the server
+        """
+        try:
+            with self.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_stat_statements;')
+                cursor.execute('SELECT pg_stat_statements_reset();')
+            return True
+        except psycopg2.Error as e:
+            print(Fore.YELLOW + "pg_stat_statements is not available: " + str(e).strip() + Style.RESET_ALL)
+            return False
+
+    def reset_pg_stat_statements(self):
+        with self.cursor() as cursor:
+            cursor.execute('SELECT pg_stat_statements_reset();')
+
+    def get_pg_stat_statements(self):
+        """Statistics of the statements run on the current database, since the last reset"""
+        with self.cursor() as cursor:
+            cursor.execute('SHOW server_version_num;')
+            # Renamed in Postgres 13
+            time_column = 'total_exec_time' if int(cursor.fetchone()[0]) >= 130000 else 'total_time'
+            cursor.execute(SQL('''
+            SELECT queryid, query, calls, {} AS total_time, rows, shared_blks_hit, shared_blks_read
+            FROM pg_stat_statements
+            WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database());
+            ''').format(Identifier(time_column)))
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def clone_database(self, name, attempts=20):
+        """
+        (Re)create database `name` using the current database as the template,
+        and return a Postgres for it. Other connections to the current database
+        are terminated, as required by CREATE DATABASE ... TEMPLATE. A running
+        graphql-engine reconnects at once, so this is retried until the
+        template is free long enough
+        """
+        p = urlparse(self.url)
+        source = p.path.lstrip('/')
+        print("Cloning database {} to {}".format(source, name))
+        # Connect to the maintenance database, as the template must not have any connections
+        conn = psycopg2.connect(urlunparse(p._replace(path='/postgres')))
+        # CREATE DATABASE can not be run inside a transaction
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(SQL('DROP DATABASE IF EXISTS {};').format(Identifier(name)))
+                for attempt in range(attempts):
+                    cursor.execute('''
+                    SELECT pg_terminate_backend(pid)
+                    FROM pg_stat_activity
+                    WHERE datname = %s AND pid <> pg_backend_pid();
+                    ''', (source,))
+                    try:
+                        cursor.execute(SQL('CREATE DATABASE {} TEMPLATE {};').format(Identifier(name), Identifier(source)))
+                        break
+                    except psycopg2.errors.ObjectInUse:
+                        # "source database is being accessed by other users"
+                        if attempt == attempts - 1:
+                            raise
+                        time.sleep(0.1)
+        finally:
+            conn.close()
+        return Postgres(
+            docker_image=None, db_data_dir=self.db_data_dir, port_allocator=self.port_allocator,
+            url=urlunparse(p._replace(path='/' + name))
+        )
+
+    def create_database(self, name):
+        """(Re)create an empty database `name`, and return a Postgres for it"""
+        print("Creating database", name)
+        self.drop_database(name)
+        p = urlparse(self.url)
+        conn = psycopg2.connect(urlunparse(p._replace(path='/postgres')))
+        # CREATE DATABASE can not be run inside a transaction
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(SQL('CREATE DATABASE {};').format(Identifier(name)))
+        finally:
+            conn.close()
+        return Postgres(
+            docker_image=None, db_data_dir=self.db_data_dir, port_allocator=self.port_allocator,
+            url=urlunparse(p._replace(path='/' + name))
+        )
+
+    def drop_database(self, name):
+        """Drop database `name`, terminating the connections to it"""
+        p = urlparse(self.url)
+        conn = psycopg2.connect(urlunparse(p._replace(path='/postgres')))
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                SELECT pg_terminate_backend(pid)
+                FROM pg_stat_activity
+                WHERE datname = %s AND pid <> pg_backend_pid();
+                ''', (name,))
+                cursor.execute(SQL('DROP DATABASE IF EXISTS {};').format(Identifier(name)))
+        finally:
+            conn.close()
+
+    def get_catalog_version(self):
+        """Version of the graphql-engine catalog (hdb_catalog) in the database, if any"""
+        with self.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('hdb_catalog.hdb_version') IS NOT NULL;")
+            if not cursor.fetchone()[0]:
+                return None
+            cursor.execute('SELECT version FROM hdb_catalog.hdb_version;')
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def run_client_tool(self, args, work_dir):
+        """
+        Run a Postgres client tool (pg_dump, pg_restore) reading/writing files in
+        work_dir. With a Postgres docker image, the tool of the image is used, so
+        that its version matches the server
+        """
+        if not self.docker_image:
+            subprocess.check_call(args)
+            return
+        work_dir = os.path.abspath(work_dir)
+        docker.from_env().containers.run(
+            self.docker_image,
+            command=args,
+            network_mode='host',
+            volumes={work_dir: {'bind': work_dir, 'mode': 'rw'}},
+            user='{}:{}'.format(os.getuid(), os.getgid()),
+            remove=True
+        )
+
+    def dump(self, dump_file, schemas):
+        """Dump the given schemas to dump_file, in the custom format of pg_dump"""
+        dump_file = os.path.abspath(dump_file)
+        print("Dumping schemas {} to {}".format(', '.join(schemas), dump_file))
+        args = ['pg_dump', '-Fc', '-f', dump_file]
+        for schema in schemas:
+            args += ['-n', schema]
+        self.run_client_tool(args + [self.url], os.path.dirname(dump_file))
+
+    def restore(self, dump_file, jobs=None):
+        """Restore a dump of pg_dump -Fc, with parallel jobs"""
+        dump_file = os.path.abspath(dump_file)
+        jobs = jobs or min(os.cpu_count() or 1, 8)
+        print("Restoring {} ({} jobs)".format(dump_file, jobs))
+        self.run_client_tool(
+            ['pg_restore', '--no-owner', '--exit-on-error', '-j', str(jobs), '-d', self.url, dump_file],
+            os.path.dirname(dump_file)
+        )
+
     def run_sql(self, sql):
         with self.cursor() as cursor:
             cursor.execute(sql)
@@ -0,0 +1,110 @@
+"""
+Search for the saturation point ("knee") of a query: the highest request rate
+at which the latency and error rate SLOs are still met.
+
+The offered load is ramped up geometrically till the SLO is violated, and the
+knee is then bisected between the last passing and the first failing rates.
+"""
+
+import math
+
+
+class SLO:
+
+    def __init__(self, p99_ms, error_rate, min_throughput_ratio=0.95):
+        self.p99_ms = p99_ms
+        self.error_rate = error_rate
+        # The load generator should be able to push the offered load through
+        self.min_throughput_ratio = min_throughput_ratio
+
+    def violations(self, trial):
+        out = []
+        if trial['p99_ms'] > self.p99_ms:
+            out.append('p99')
+        if trial['error_rate'] > self.error_rate:
+            out.append('error_rate')
+        if trial['throughput'] < self.min_throughput_ratio * trial['rps']:
+            out.append('throughput')
+        return out
+
+    def to_json(self):
+        return {
+            'p99_ms': self.p99_ms,
+            'error_rate': self.error_rate,
+            'min_throughput_ratio': self.min_throughput_ratio
+        }
+
+
+class SaturationSearch:
+    """
+    trial is a function which runs load at the given requests/sec, and returns
+    a dict with keys 'p99_ms', 'error_rate' and 'throughput'
+    """
+
+    def __init__(self, trial, slo, start_rps=10, ramp_factor=2, max_rps=100000, tolerance=0.05, max_trials=20):
+        self.trial = trial
+        self.slo = slo
+        self.start_rps = start_rps
+        self.ramp_factor = ramp_factor
+        self.max_rps = max_rps
+        self.tolerance = tolerance
+        self.max_trials = max_trials
+        self.trials = []
+
+    def passes(self, rps):
+        result = dict(self.trial(rps))
+        result['rps'] = rps
+        result['violations'] = self.slo.violations(result)
+        self.trials.append(result)
+        print("Trial at {} req/s: p99 {:.2f} ms, error rate {:.4f}, throughput {:.1f} req/s{}".format(
+            rps, result['p99_ms'], result['error_rate'], result['throughput'],
+            ', violates ' + ', '.join(result['violations']) if result['violations'] else ''
+        ))
+        return not result['violations']
+
+    def run(self):
+        """Returns the knee, 0 if the SLO is violated even at the lowest rate"""
+        lo, hi = 0, None
+        rps = self.start_rps
+        # Ramp up
+        while rps <= self.max_rps and len(self.trials) < self.max_trials:
+            if self.passes(rps):
+                lo = rps
+                rps = int(math.ceil(rps * self.ramp_factor))
+            else:
+                hi = rps
+                break
+        if hi is None:
+            return lo
+        # Bisect between the last passing and the first failing rate
+        while len(self.trials) < self.max_trials and hi - lo > max(1, self.tolerance * lo):
+            mid = int(round(math.sqrt(lo * hi))) if lo > 0 else hi // 2
+            if mid <= lo or mid >= hi:
+                break
+            if self.passes(mid):
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def to_json(self):
+        return {
+            'slo': self.slo.to_json(),
+            'ramp_factor': self.ramp_factor,
+            'tolerance': self.tolerance,
+            'trials': self.trials
+        }
+
+
+def latency_probes(knee, count, min_rps=10):
+    """
+    count request rates, spaced logarithmically from min_rps (or half the
+    knee, if lower) strictly below the knee, where the SLO is about to break
+    """
+    if knee <= 1 or count <= 0:
+        return []
+    low = min(float(min_rps), knee / 2.0)
+    # count steps up to the knee, which is left out
+    ratio = (knee / low) ** (1.0 / count)
+    probes = [int(round(low * ratio ** i)) for i in range(count)]
+    return sorted(set(p for p in probes if 0 < p < knee))
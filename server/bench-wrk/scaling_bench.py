@@ -0,0 +1,210 @@
+"""
+Concurrency sweep, with a Universal Scalability Law fit.
+
+A graphql-engine is launched for every number of capabilities (+RTS -N),
+pinned to as many CPUs, and every Postgres pool size (--connections). The
+throughput of every query is measured at saturation for every number of
+client connections, by the python load generator pinned to the other CPUs.
+
+The Universal Scalability Law models the throughput at concurrency N as
+
+    X(N) = lambda * N / (1 + sigma * (N - 1) + kappa * N * (N - 1))
+
+where sigma is the contention (serialisation) and kappa the coherency
+(crosstalk) coefficient. It is fitted to the throughputs of every query:
+- against client connections, for every number of capabilities and pool size
+- against capabilities, with the best throughput over client connections, for
+  every pool size
+The concurrency of the peak throughput, sqrt((1 - sigma) / kappa), of the fit
+against capabilities is the number of cores beyond which graphql-engine does
+not scale.
+"""
+
+import math
+import os
+
+import matplotlib
+matplotlib.use('agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from scipy.optimize import curve_fit
+
+import load_generator
+
+default_capabilities = [1, 2, 4, 8]
+
+
+def usl(n, lam, sigma, kappa):
+    return lam * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+def fit_usl(points):
+    """
+    Fit the USL to (concurrency, throughput) points. Returns None with less
+    than 3 points, or if the fit fails
+    """
+    points = sorted(p for p in points if p[1] > 0)
+    if len(points) < 3:
+        return None
+    n = np.array([p[0] for p in points], dtype=float)
+    x = np.array([p[1] for p in points], dtype=float)
+    try:
+        ((lam, sigma, kappa), _) = curve_fit(
+            usl, n, x, p0=(x[0] / n[0], 0.05, 0.001),
+            bounds=([0, 0, 0], [np.inf, 1, 1])
+        )
+    except (RuntimeError, ValueError):
+        return None
+    residuals = x - usl(n, lam, sigma, kappa)
+    total = ((x - x.mean()) ** 2).sum()
+    peak = math.sqrt((1 - sigma) / kappa) if kappa > 0 else None
+    return {
+        'lambda': float(lam),
+        'sigma': float(sigma),
+        'kappa': float(kappa),
+        'r_squared': float(1 - (residuals ** 2).sum() / total) if total else None,
+        'peak_concurrency': peak,
+        'peak_throughput': float(usl(peak, lam, sigma, kappa)) if peak else None,
+        'points': [[float(c), float(t)] for (c, t) in points]
+    }
+
+
+def split_cpus(capabilities):
+    """CPUs graphql-engine and the load generator are pinned to (None if not pinned)"""
+    cpus = sorted(os.sched_getaffinity(0))
+    if capabilities >= len(cpus):
+        print("Not enough CPUs to pin graphql-engine to {} of them".format(capabilities))
+        return (None, None)
+    return (cpus[:capabilities], cpus[capabilities:])
+
+
+def hge_scaling_args(capabilities, pg_connections):
+    args = ['+RTS', '-N{}'.format(capabilities), '-RTS']
+    if pg_connections:
+        args = ['--connections', str(pg_connections)] + args
+    return args
+
+
+def measure_point(hge, query_str, connections, duration, cpus):
+    threads = len(cpus) if cpus else os.cpu_count()
+    (_, _, summary) = load_generator.run_load(
+        hge.url + '/v1/graphql', load_generator.graphql_request_body(query_str), hge.admin_auth_headers(),
+        threads, connections, duration, cpus=cpus
+    )
+    requests_count = summary['summary']['requests']
+    latency = summary['latency']
+    return {
+        'requests': requests_count,
+        'requests_per_sec': requests_count / float(duration),
+        'errors': sum(summary['summary']['errors'].values()),
+        'latency': {
+            'mean_ms': latency['mean'] / 1000.0,
+            'p99_ms': latency['dist']['99'] / 1000.0,
+            'max_ms': latency['max'] / 1000.0
+        }
+    }
+
+
+def run_scaling_benchmark(mk_hge, queries, capabilities, pg_pools, client_connections, duration):
+    """
+    Yields the throughput of every query (a list of (name, query text)) for
+    every number of capabilities, pool size and number of client connections.
+    mk_hge(extra_args, cpus) makes the graphql-engines
+    """
+    for n in sorted(set(capabilities)):
+        for pool in pg_pools:
+            (hge_cpus, load_cpus) = split_cpus(n)
+            hge = mk_hge(hge_scaling_args(n, pool), hge_cpus)
+            try:
+                hge.run()
+                for (name, query_str) in queries:
+                    hge.graphql_q(query_str)
+                    for c in sorted(set(client_connections)):
+                        print("Scaling benchmark: query {}, -N{}, pool size {}, {} client connections".format(
+                            name, n, pool or 'default', c))
+                        point = measure_point(hge, query_str, c, duration, load_cpus)
+                        point.update({
+                            'query_name': name,
+                            'hge_capabilities': n,
+                            'pg_connections': pool,
+                            'client_connections': c
+                        })
+                        yield point
+            finally:
+                hge.teardown()
+
+
+def fit_scaling(points):
+    """USL fits of every query against client connections, and against capabilities"""
+    fits = []
+    keys = sorted(set((p['query_name'], p['pg_connections'] or 0) for p in points))
+    for (name, pool) in keys:
+        query_points = [p for p in points if p['query_name'] == name and (p['pg_connections'] or 0) == pool]
+        best = {}
+        for n in sorted(set(p['hge_capabilities'] for p in query_points)):
+            n_points = [(p['client_connections'], p['requests_per_sec']) for p in query_points if p['hge_capabilities'] == n]
+            fit = fit_usl(n_points)
+            if fit:
+                fits.append({'query_name': name, 'dimension': 'client_connections', 'hge_capabilities': n,
+                             'pg_connections': pool or None, **fit})
+            best[n] = max(t for (_, t) in n_points)
+        fit = fit_usl(list(best.items()))
+        if fit:
+            fits.append({'query_name': name, 'dimension': 'hge_capabilities', 'hge_capabilities': None,
+                         'pg_connections': pool or None, **fit})
+    return fits
+
+
+def scaling_report(fits):
+    lines = ['{:<32} {:<20} {:>4} {:>6} {:>10} {:>8} {:>10} {:>8} {:>12} {:>6}'.format(
+        'query', 'against', '-N', 'pool', 'lambda', 'sigma', 'kappa', 'peak N', 'peak req/s', 'R^2')]
+    for f in fits:
+        lines.append('{:<32} {:<20} {:>4} {:>6} {:>10.1f} {:>8.4f} {:>10.6f} {:>8} {:>12} {:>6}'.format(
+            f['query_name'], f['dimension'], f['hge_capabilities'] or '-', f['pg_connections'] or '-',
+            f['lambda'], f['sigma'], f['kappa'],
+            '{:.1f}'.format(f['peak_concurrency']) if f['peak_concurrency'] else 'inf',
+            '{:.0f}'.format(f['peak_throughput']) if f['peak_throughput'] else '-',
+            '{:.3f}'.format(f['r_squared']) if f['r_squared'] is not None else '-'
+        ))
+    for f in fits:
+        if f['dimension'] == 'hge_capabilities':
+            if f['peak_concurrency']:
+                advice = 'throughput peaks at {:.1f} cores'.format(f['peak_concurrency'])
+            else:
+                advice = 'no coherency penalty measured, throughput keeps growing with cores'
+            lines.append('{} (pool size {}): {}, contention {:.1%}'.format(
+                f['query_name'], f['pg_connections'] or 'default', advice, f['sigma']))
+    return '\n'.join(lines)
+
+
+def plot_scaling(points, fits, out_dir):
+    """One plot per query and pool size: throughput against clients and against capabilities, with the fits"""
+    files = []
+    for fit_n in [f for f in fits if f['dimension'] == 'hge_capabilities']:
+        (name, pool) = (fit_n['query_name'], fit_n['pg_connections'])
+        fig, axes = plt.subplots(1, 2, figsize=(14, 5))
+        for f in fits:
+            if f['query_name'] != name or f['pg_connections'] != pool or f['dimension'] != 'client_connections':
+                continue
+            pts = np.array(f['points'])
+            line = axes[0].plot(pts[:, 0], pts[:, 1], 'o', label='-N{}'.format(f['hge_capabilities']))[0]
+            xs = np.linspace(1, pts[:, 0].max(), 200)
+            axes[0].plot(xs, usl(xs, f['lambda'], f['sigma'], f['kappa']), '--', color=line.get_color())
+        pts = np.array(fit_n['points'])
+        axes[1].plot(pts[:, 0], pts[:, 1], 'o', label='best over client connections')
+        xs = np.linspace(1, max(pts[:, 0].max(), fit_n['peak_concurrency'] or 0) * 1.2, 200)
+        axes[1].plot(xs, usl(xs, fit_n['lambda'], fit_n['sigma'], fit_n['kappa']), '--',
+                     label='USL: sigma={:.3f}, kappa={:.5f}'.format(fit_n['sigma'], fit_n['kappa']))
+        if fit_n['peak_concurrency']:
+            axes[1].axvline(fit_n['peak_concurrency'], color='grey', linewidth=0.5)
+        axes[0].set(xlabel='Client connections', ylabel='Requests/sec', xscale='log')
+        axes[1].set(xlabel='graphql-engine capabilities (-N)', ylabel='Requests/sec')
+        for ax in axes:
+            ax.grid(True)
+            ax.legend(fontsize='small')
+        fig.suptitle('{} (pool size {})'.format(name, pool or 'default'))
+        out_file = os.path.join(out_dir, 'scaling_{}_pool_{}.png'.format(name, pool or 'default'))
+        fig.savefig(out_file, bbox_inches='tight', dpi=100)
+        plt.close(fig)
+        files.append(out_file)
+    return files
@@ -0,0 +1,207 @@
+"""
+Scheduled trigger benchmark.
+
+Every trial creates N one-off scheduled events (create_scheduled_event), all
+due at the same time, and K cron triggers firing every minute, with a
+WebhookSink as webhook. The due time is the start of a minute, at least
+lead_time seconds ahead, so that the events can be created before. This is
+the spike of, say, reminders scheduled at the top of the hour. The events of
+cron triggers are generated once a minute, so the lead time must be more
+than a minute for the cron triggers to fire at the due time too.
+
+graphql-engine fetches the due scheduled events once a minute, and delivers
+them one after the other. Events older than the tolerance of their retry
+configuration when they are processed are not delivered but marked dead. For
+one-off and cron events, a trial measures:
+- the percentiles of the lateness: the arrival time minus scheduled_time
+- how long the backlog takes to drain: the last arrival minus the due time
+- the rate of deliveries
+- the dead and failed events
+"""
+
+import datetime
+import math
+import time
+
+import event_bench
+from webhook_sink import WebhookSink
+
+# Prefix of the cron triggers, and comment of the one-off events of the benchmark
+name_prefix = 'hge_scheduled_bench'
+
+# Every minute
+cron_schedule = '* * * * *'
+
+# Events created per bulk query
+create_batch_size = 500
+
+final_statuses = ['delivered', 'error', 'dead']
+
+# Time allowed for the events to be delivered, after the due time of the last cron events
+drain_timeout = 300
+
+
+def due_time(lead_time):
+    """The start of the first minute at least lead_time seconds ahead"""
+    return math.ceil((time.time() + lead_time) / 60.0) * 60
+
+
+def iso_time(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def retry_conf(tolerance_seconds):
+    conf = {'num_retries': 0}
+    if tolerance_seconds is not None:
+        conf['tolerance_seconds'] = tolerance_seconds
+    return conf
+
+
+def create_one_off_events(hge, webhook, n, schedule_at, tolerance_seconds):
+    for start in range(0, n, create_batch_size):
+        hge.run_bulk([
+            {
+                'type': 'create_scheduled_event',
+                'args': {
+                    'webhook': webhook,
+                    'schedule_at': iso_time(schedule_at),
+                    'payload': {'n': i},
+                    'retry_conf': retry_conf(tolerance_seconds),
+                    'comment': name_prefix
+                }
+            }
+            for i in range(start, min(n, start + create_batch_size))
+        ])
+
+
+def cron_trigger_name(i):
+    return '{}_{}'.format(name_prefix, i)
+
+
+def create_cron_triggers(hge, webhook, k, tolerance_seconds):
+    for start in range(0, k, create_batch_size):
+        hge.run_bulk([
+            {
+                'type': 'create_cron_trigger',
+                'args': {
+                    'name': cron_trigger_name(i),
+                    'webhook': webhook,
+                    'schedule': cron_schedule,
+                    'payload': {'n': i},
+                    'retry_conf': retry_conf(tolerance_seconds),
+                    'include_in_metadata': False,
+                    'replace': True
+                }
+            }
+            for i in range(start, min(k, start + create_batch_size))
+        ])
+
+
+def delete_cron_triggers(hge, k):
+    for start in range(0, k, create_batch_size):
+        hge.run_bulk([
+            {'type': 'delete_cron_trigger', 'args': {'name': cron_trigger_name(i)}}
+            for i in range(start, min(k, start + create_batch_size))
+        ])
+
+
+def delete_one_off_events(pg):
+    with pg.cursor() as cursor:
+        cursor.execute('DELETE FROM hdb_catalog.hdb_scheduled_events WHERE comment = %s;', (name_prefix,))
+
+
+def get_statuses(pg, cron_triggers, schedule_at, cron_end):
+    """Counts of the one-off and the cron events of a trial by status"""
+    with pg.cursor() as cursor:
+        cursor.execute('''
+        SELECT 'one_off', status, count(*)
+        FROM hdb_catalog.hdb_scheduled_events
+        WHERE comment = %s
+        GROUP BY status
+        UNION ALL
+        SELECT 'cron', status, count(*)
+        FROM hdb_catalog.hdb_cron_events
+        WHERE trigger_name = ANY(%s) AND scheduled_time >= to_timestamp(%s) AND scheduled_time < to_timestamp(%s)
+        GROUP BY status;
+        ''', (name_prefix, [cron_trigger_name(i) for i in range(cron_triggers)], schedule_at, cron_end))
+        statuses = {'one_off': {}, 'cron': {}}
+        for (kind, status, count) in cursor.fetchall():
+            statuses[kind][status] = count
+        return statuses
+
+
+def is_done(statuses):
+    return all(s in final_statuses for kind in statuses.values() for s in kind)
+
+
+def summarise(records, schedule_at, statuses):
+    """Summary of the deliveries (arrival, scheduled time) of one kind of events"""
+    arrivals = [a for (a, _) in records]
+    lateness = [a - s for (a, s) in records]
+    delivery_seconds = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else None
+    return {
+        'events': sum(statuses.values()),
+        'delivered': len(records),
+        'dead': statuses.get('dead', 0),
+        'errors': statuses.get('error', 0),
+        'pending': sum(c for (s, c) in statuses.items() if s not in final_statuses),
+        'lateness': event_bench.lag_summary(lateness),
+        'first_delivery_seconds': arrivals[0] - schedule_at if arrivals else None,
+        'drain_seconds': arrivals[-1] - schedule_at if arrivals else None,
+        'events_per_sec': len(records) / delivery_seconds if delivery_seconds else None
+    }
+
+
+def measure_spike(hge, pg, sink_port, one_off_events, cron_triggers, webhook_latency_ms,
+                  tolerance_seconds, lead_time, cron_minutes, drain_timeout, sink_workers=None):
+    webhook = 'http://127.0.0.1:{}/'.format(sink_port)
+    delete_one_off_events(pg)
+    with WebhookSink(sink_port, fields=('name', 'scheduled_time'), delay_ms=webhook_latency_ms, workers=sink_workers) as sink:
+        schedule_at = due_time(lead_time)
+        cron_end = schedule_at + 60 * cron_minutes
+        create_start = time.time()
+        try:
+            create_cron_triggers(hge, webhook, cron_triggers, tolerance_seconds)
+            create_one_off_events(hge, webhook, one_off_events, schedule_at, tolerance_seconds)
+            create_seconds = time.time() - create_start
+            if time.time() > schedule_at:
+                print("Warning: the events were created after their due time, increase the lead time")
+            print("Waiting for the events due at", iso_time(schedule_at))
+            deadline = cron_end + drain_timeout
+            while time.time() < deadline:
+                time.sleep(1)
+                if time.time() >= cron_end and is_done(get_statuses(pg, cron_triggers, schedule_at, cron_end)):
+                    break
+            statuses = get_statuses(pg, cron_triggers, schedule_at, cron_end)
+        finally:
+            delete_cron_triggers(hge, cron_triggers)
+        records = sink.stop()
+    delete_one_off_events(pg)
+    one_off = []
+    cron = []
+    for (arrival, (name, scheduled_time)) in (r for r in records if r[1]):
+        st = event_bench.parse_utc_time(scheduled_time)
+        if name is None:
+            one_off.append((arrival, st))
+        elif name.startswith(name_prefix) and schedule_at <= st < cron_end:
+            cron.append((arrival, st))
+    return {
+        'one_off_events': one_off_events,
+        'cron_triggers': cron_triggers,
+        'cron_minutes': cron_minutes,
+        'webhook_latency_ms': webhook_latency_ms,
+        'tolerance_seconds': tolerance_seconds,
+        'create_seconds': create_seconds,
+        'one_off': summarise(one_off, schedule_at, statuses['one_off']),
+        'cron': summarise(cron, schedule_at, statuses['cron'])
+    }
+
+
+def run_scheduled_benchmark(hge, pg, sink_port, one_off_counts, cron_trigger_counts, webhook_latency_ms,
+                            tolerance_seconds, lead_time, cron_minutes, drain_timeout, sink_workers=None):
+    """Yields the measurements of every number of one-off events and cron triggers"""
+    for n in one_off_counts:
+        for k in cron_trigger_counts:
+            print("Scheduled trigger benchmark: {} one-off events, {} cron triggers".format(n, k))
+            yield measure_spike(hge, pg, sink_port, n, k, webhook_latency_ms, tolerance_seconds,
+                                lead_time, cron_minutes, drain_timeout, sink_workers)
@@ -0,0 +1,84 @@
+"""
+Snapshots of the finished sportsdb setup, to bring up later environments fast.
+
+A snapshot has, for the graphql-engine under test and the remote one, a dump
+(pg_dump -Fc) of its sportsdb schema, and its exported metadata. It is keyed by
+the checksum of the sportsdb zip, the catalog version of graphql-engine and
+the Postgres version, so that it is not restored into an incompatible setup.
+Restoring is a parallel pg_restore, and a replace_metadata.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from colorama import Fore, Style
+
+default_snapshot_dir = os.path.join(os.path.expanduser('~'), '.cache', 'hge-bench', 'snapshots')
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def snapshot_key(sportsdb_checksum, catalog_version, pg_version, with_remote):
+    key = 'sportsdb-{}-catalog-{}-{}'.format(
+        sportsdb_checksum[:16], catalog_version, pg_version.replace(' ', '-')
+    )
+    return key + ('-remote' if with_remote else '')
+
+
+class SetupSnapshot:
+
+    info_file = 'snapshot.json'
+
+    def __init__(self, snapshot_dir, key):
+        self.snapshot_dir = snapshot_dir
+        self.key = key
+        self.dir = os.path.join(snapshot_dir, key)
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.dir, self.info_file))
+
+    def dump_file(self, name, snapshot_dir=None):
+        return os.path.join(snapshot_dir or self.dir, name + '.dump')
+
+    def metadata_file(self, name, snapshot_dir=None):
+        return os.path.join(snapshot_dir or self.dir, name + '.metadata.json')
+
+    def save(self, parts):
+        """
+        parts is a list of (name, pg, hge, schema). The snapshot is written to a
+        temporary directory first, so that a partial snapshot is never used
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.snapshot_dir, prefix='.tmp-')
+        try:
+            for (name, pg, hge, schema) in parts:
+                pg.dump(self.dump_file(name, tmp_dir), [schema])
+                with open(self.metadata_file(name, tmp_dir), 'w') as f:
+                    json.dump(hge.export_metadata(), f)
+            with open(os.path.join(tmp_dir, self.info_file), 'w') as f:
+                json.dump({'key': self.key, 'parts': [p[0] for p in parts]}, f)
+            if self.exists():
+                # Saved meanwhile by another run
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            os.rename(tmp_dir, self.dir)
+            print(Fore.GREEN + "Saved setup snapshot " + self.dir + Style.RESET_ALL)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def restore_data(self, name, pg):
+        pg.restore(self.dump_file(name))
+
+    def load_metadata(self, name):
+        with open(self.metadata_file(name)) as f:
+            return json.load(f)
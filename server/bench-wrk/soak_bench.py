@@ -0,0 +1,252 @@
+"""
+Soak benchmark: a mixed workload for hours, to detect memory leaks and
+latency drift.
+
+The workload is run at a fixed rate, so that the latencies of the start and
+of the end of the run are comparable, in intervals of a few minutes. For
+every interval are recorded:
+- the latency histogram of the requests
+- the median resident memory of graphql-engine, and its median GC live bytes
+  (current_bytes_used of EKG, with the developer APIs and '+RTS -T'), from
+  the telemetry samples
+Every dump interval, the state of /dev/subscriptions and /dev/plan_cache is
+written to the work directory, when the developer APIs are enabled.
+
+Sliding windows of several intervals smooth the series for the charts: their
+p99 is that of the merged histograms of their intervals. Trends are fitted
+by least squares to the values of the (non-overlapping) intervals after the
+warm-up, during which caches fill. A trend is flagged if its slope is
+positive with a one-sided p-value below significance, and the growth per hour
+is more than min_growth_per_hour of the mean. The intervals are not
+independent samples, so a flagged trend is a reason to look at the charts
+and the dumps, not a proof of a leak.
+"""
+
+import json
+import os
+import time
+
+import matplotlib
+matplotlib.use('agg')
+import matplotlib.pyplot as plt
+from scipy import stats
+
+import latency_store
+import load_generator
+import telemetry
+import workload
+
+default_interval = 60
+
+default_window = 600
+
+default_warmup = 600
+
+default_dump_interval = 600
+
+# Share of the throughput at saturation at which the workload is run, if no rate is given
+default_rate_share = 0.5
+
+# Duration of the saturation run measuring the throughput
+saturation_duration = 30
+
+significance = 0.01
+
+min_growth_per_hour = 0.01
+
+# Metrics of the intervals whose trends are fitted
+trend_metrics = ['rss_bytes', 'gc_live_bytes', 'p99_ms']
+
+
+def soak_workload(queries):
+    """A workload of the queries (a list of (name, query text)), with equal weights"""
+    return workload.Workload('soak', [workload.Operation(name, query_str) for (name, query_str) in queries])
+
+
+def median(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2.0
+
+
+def latency_ms(histogram):
+    if not histogram.get_total_count():
+        return {}
+    return {
+        'mean_ms': histogram.get_mean_value() / 1000.0,
+        'p50_ms': histogram.get_value_at_percentile(50) / 1000.0,
+        'p99_ms': histogram.get_value_at_percentile(99) / 1000.0,
+        'max_ms': histogram.get_max_value() / 1000.0
+    }
+
+
+def interval_metrics(elapsed, duration, histogram, summary, samples):
+    process = [s['process'] for s in samples if 'process' in s]
+    gc = [s['gc'] for s in samples if 'gc' in s]
+    requests_count = summary['summary']['requests']
+    return {
+        'elapsed': elapsed,
+        'requests': requests_count,
+        'requests_per_sec': requests_count / float(duration),
+        'errors': sum(summary['summary']['errors'].values()),
+        'rss_bytes': median(p['rss_bytes'] for p in process),
+        'gc_live_bytes': median(g.get('current_bytes_used') for g in gc),
+        'threads': median(p['threads'] for p in process),
+        **latency_ms(histogram)
+    }
+
+
+def window_metrics(intervals, histograms):
+    """A sliding window over the last intervals, with the p99 of their merged histograms"""
+    histogram = latency_store.new_histogram()
+    for h in histograms:
+        histogram.add(h)
+    return {
+        'elapsed': intervals[-1]['elapsed'],
+        'intervals': len(intervals),
+        'rss_bytes': median(i['rss_bytes'] for i in intervals),
+        'gc_live_bytes': median(i['gc_live_bytes'] for i in intervals),
+        **latency_ms(histogram)
+    }
+
+
+def fit_trend(points):
+    """Least squares trend of (elapsed seconds, value) points"""
+    points = [(t, v) for (t, v) in points if v is not None]
+    if len(points) < 3 or len(set(t for (t, _) in points)) < 2:
+        return None
+    fit = stats.linregress([t for (t, _) in points], [v for (_, v) in points])
+    mean = sum(v for (_, v) in points) / float(len(points))
+    # One-sided test of a positive slope
+    p_value = fit.pvalue / 2 if fit.slope > 0 else 1 - fit.pvalue / 2
+    growth = fit.slope * 3600 / mean if mean else None
+    return {
+        'slope_per_hour': fit.slope * 3600,
+        'growth_per_hour': growth,
+        'intercept': fit.intercept,
+        'r_squared': fit.rvalue ** 2,
+        'p_value': p_value,
+        'points': len(points),
+        'flagged': p_value < significance and growth is not None and growth > min_growth_per_hour
+    }
+
+
+def fit_trends(intervals, warmup):
+    return {
+        m: fit_trend([(i['elapsed'], i.get(m)) for i in intervals if i['elapsed'] > warmup])
+        for m in trend_metrics
+    }
+
+
+def dump_dev_state(hge, out_dir, elapsed):
+    """Write /dev/subscriptions and /dev/plan_cache, and return their sizes (None if not available)"""
+    counts = {'elapsed': elapsed}
+    for (path, key, count) in [
+            ('subscriptions', 'subscription_pollers', lambda d: len(d.get('live_queries_map') or [])),
+            ('plan_cache', 'cached_plans', len)]:
+        dump = hge.dev_api(path)
+        counts[key] = count(dump) if isinstance(dump, (dict, list)) else None
+        if dump is not None:
+            with open(os.path.join(out_dir, '{}_{}.json'.format(path, int(elapsed))), 'w') as f:
+                f.write(json.dumps(dump, indent=2))
+    return counts
+
+
+def run_interval(hge, soak_load, params, rps, duration, cpus):
+    (histogram, _, summary) = load_generator.run_load(
+        hge.url + '/v1/graphql', None, hge.admin_auth_headers(), params['threads'], params['connections'],
+        duration, rps=rps, workload=soak_load, cpus=cpus
+    )
+    return (histogram, summary)
+
+
+def take_samples(sampler):
+    """The telemetry samples so far, removed from the sampler so that they do not pile up"""
+    n = len(sampler.samples)
+    samples = sampler.samples[:n]
+    del sampler.samples[:n]
+    return samples
+
+
+def run_soak_benchmark(hge, pg, soak_load, params, duration, out_dir, rps=None, interval=default_interval,
+                       window=default_window, warmup=default_warmup, dump_interval=default_dump_interval,
+                       telemetry_interval=1.0, cpus=None):
+    """
+    Run the workload for duration seconds, and return the metrics of the
+    intervals and of the sliding windows, the trends, and the sizes of the
+    dumps. The telemetry samples and dumps are written to out_dir
+    """
+    if not rps:
+        print("Soak benchmark: measuring the throughput for {}s".format(saturation_duration))
+        (_, summary) = run_interval(hge, soak_load, params, None, saturation_duration, cpus)
+        rps = max(1, int(default_rate_share * summary['summary']['requests'] / float(saturation_duration)))
+    window_intervals = max(1, int(round(window / float(interval))))
+    intervals = []
+    windows = []
+    recent = []
+    dumps = []
+    start = time.time()
+    next_dump = 0
+    with open(os.path.join(out_dir, 'telemetry.jsonl'), 'w') as telemetry_file, \
+            telemetry.TelemetrySampler(hge, pg, telemetry_interval) as sampler:
+        while time.time() - start < duration:
+            elapsed = time.time() - start
+            if elapsed >= next_dump:
+                dumps.append(dump_dev_state(hge, out_dir, elapsed))
+                next_dump += dump_interval
+            run_duration = int(min(interval, max(1, duration - elapsed)))
+            (histogram, summary) = run_interval(hge, soak_load, params, rps, run_duration, cpus)
+            samples = take_samples(sampler)
+            for s in samples:
+                telemetry_file.write(json.dumps(s) + '\n')
+            metrics = interval_metrics(time.time() - start, run_duration, histogram, summary, samples)
+            intervals.append(metrics)
+            recent = (recent + [(metrics, histogram)])[-window_intervals:]
+            windows.append(window_metrics([m for (m, _) in recent], [h for (_, h) in recent]))
+            print("Soak benchmark: {:.0f}s, {:.0f} req/s, p99 {} ms, RSS {} MB, GC live {} MB".format(
+                metrics['elapsed'], metrics['requests_per_sec'], format_value(metrics.get('p99_ms')),
+                format_value(metrics['rss_bytes'], 2 ** 20), format_value(metrics['gc_live_bytes'], 2 ** 20)))
+    dumps.append(dump_dev_state(hge, out_dir, time.time() - start))
+    return {
+        'duration': duration,
+        'rps': rps,
+        'interval': interval,
+        'window': window,
+        'warmup': warmup,
+        'requests': sum(i['requests'] for i in intervals),
+        'errors': sum(i['errors'] for i in intervals),
+        'intervals': intervals,
+        'windows': windows,
+        'trends': fit_trends(intervals, warmup),
+        'dev_state': dumps
+    }
+
+
+def format_value(value, unit=1):
+    return '{:.2f}'.format(value / float(unit)) if value is not None else '-'
+
+
+def plot_soak(result, out_file):
+    """RSS, GC live bytes and p99 of the sliding windows over time, with the fitted trends"""
+    fig, axes = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+    for (ax, metric, unit, label) in zip(axes, trend_metrics, [2 ** 20, 2 ** 20, 1],
+                                         ['RSS (MB)', 'GC live bytes (MB)', 'p99 (ms)']):
+        ws = [w for w in result['windows'] if w.get(metric) is not None]
+        ax.plot([w['elapsed'] / 3600.0 for w in ws], [w[metric] / unit for w in ws], label='sliding window')
+        trend = result['trends'].get(metric)
+        if trend:
+            xs = [result['warmup'], result['intervals'][-1]['elapsed']]
+            ax.plot([x / 3600.0 for x in xs],
+                    [(trend['intercept'] + trend['slope_per_hour'] * x / 3600) / unit for x in xs], '--',
+                    color='red' if trend['flagged'] else 'grey',
+                    label='trend: {:+.2%}/hour, p={:.3g}'.format(trend['growth_per_hour'] or 0, trend['p_value']))
+        ax.axvline(result['warmup'] / 3600.0, color='grey', linewidth=0.5)
+        ax.set_ylabel(label)
+        ax.grid(True)
+        ax.legend(fontsize='small')
+    axes[-1].set_xlabel('Hours')
+    fig.suptitle('Soak at {} req/s'.format(result['rps']))
+    fig.savefig(out_file, bbox_inches='tight', dpi=100)
+    plt.close(fig)
@@ -0,0 +1,267 @@
+"""
+Scale up the sportsdb dataset by cloning its rows.
+
+Copy k (k = 1 .. scale_factor - 1) of a table has its id, and its foreign key
+columns, shifted by k times the stride of the table they refer to, so that
+the foreign key graph of every copy is intact and disjoint from the others.
+The stride of a table is one more than its largest id in the original
+dataset, so the copy a row belongs to is its id, or its first non NULL
+foreign key, divided by the stride. Text columns with unique constraints get
+a '-k' suffix, truncated to fit their length. The id sequences are moved past
+the ids of the last copy.
+
+Rows whose foreign keys are all NULL belong to no copy. They are the same in
+every copy, so each distinct row is repeated as many times as there are
+copies. Those of tables with unique text columns, whose copies differ, are
+not scaled.
+
+The copies are streamed out of the original rows with COPY ... TO STDOUT and
+loaded with COPY ... FROM STDIN. The current scale factor, and the strides,
+are kept in table hge_bench_scale of the public schema.
+"""
+
+import io
+
+from psycopg2.sql import SQL, Identifier, Literal
+from psycopg2.extras import Json
+from colorama import Fore, Style
+
+
+class ScaleError(Exception):
+    pass
+
+
+text_types = ['text', 'character varying', 'character']
+
+
+def get_tables(cursor, schema):
+    cursor.execute('''
+    SELECT table_name
+    FROM information_schema.tables
+    WHERE table_schema = %s AND table_type = 'BASE TABLE';
+    ''', (schema,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_columns(cursor, schema, table):
+    cursor.execute('''
+    SELECT column_name, data_type, character_maximum_length
+    FROM information_schema.columns
+    WHERE table_schema = %s AND table_name = %s
+    ORDER BY ordinal_position;
+    ''', (schema, table))
+    return cursor.fetchall()
+
+
+def get_unique_columns(cursor, schema, table):
+    cursor.execute('''
+    SELECT kcu.column_name
+    FROM information_schema.table_constraints AS tc
+        JOIN information_schema.key_column_usage AS kcu
+            ON tc.constraint_name = kcu.constraint_name
+            AND tc.table_schema = kcu.table_schema
+    WHERE tc.constraint_type = 'UNIQUE' AND tc.table_schema = %s AND tc.table_name = %s;
+    ''', (schema, table))
+    return set(row[0] for row in cursor.fetchall())
+
+
+def get_foreign_keys(pg, schema):
+    """For every table, its columns referring to the id of another table"""
+    fks = {}
+    for (_, _, table, column, _, ref_table, ref_column) in pg.get_all_fk_constraints(schema):
+        if ref_column == 'id':
+            fks.setdefault(table, {})[column] = ref_table
+    return fks
+
+
+class SportsdbScaler:
+
+    state_table = 'hge_bench_scale'
+
+    def __init__(self, pg, schema='hge'):
+        self.pg = pg
+        self.schema = schema
+
+    def get_state(self):
+        with self.pg.cursor() as cursor:
+            cursor.execute(SQL('''
+            CREATE TABLE IF NOT EXISTS public.{} (
+                schema_name text primary key,
+                scale_factor integer not null,
+                strides jsonb not null
+            );''').format(Identifier(self.state_table)))
+            cursor.execute(SQL('SELECT scale_factor, strides FROM public.{} WHERE schema_name = %s;').format(
+                Identifier(self.state_table)), (self.schema,))
+            row = cursor.fetchone()
+        if row:
+            return row
+        return (1, self.compute_strides())
+
+    def set_state(self, cursor, scale_factor, strides):
+        cursor.execute(SQL('''
+        INSERT INTO public.{} (schema_name, scale_factor, strides) VALUES (%s, %s, %s)
+        ON CONFLICT (schema_name) DO UPDATE SET scale_factor = EXCLUDED.scale_factor, strides = EXCLUDED.strides;
+        ''').format(Identifier(self.state_table)), (self.schema, scale_factor, Json(strides)))
+
+    def compute_strides(self):
+        strides = {}
+        with self.pg.cursor() as cursor:
+            for table in get_tables(cursor, self.schema):
+                if 'id' in [c for (c, _, _) in get_columns(cursor, self.schema, table)]:
+                    cursor.execute(SQL('SELECT coalesce(max(id), 0) + 1 FROM {}.{};').format(
+                        Identifier(self.schema), Identifier(table)))
+                    strides[table] = cursor.fetchone()[0]
+        return strides
+
+    def copy_plan(self, cursor, strides, fks):
+        """
+        For every table which can be copied, its columns and the columns (with
+        the tables they refer to) which identify the copy a row belongs to
+        """
+        plan = {}
+        for table in get_tables(cursor, self.schema):
+            columns = get_columns(cursor, self.schema, table)
+            table_fks = {c: t for (c, t) in fks.get(table, {}).items() if t in strides}
+            if table in strides:
+                markers = [('id', table)]
+            elif table_fks:
+                markers = sorted(table_fks.items())
+            else:
+                print(Fore.YELLOW + "Not scaling table {}.{}, which has neither id nor foreign keys".format(self.schema, table) + Style.RESET_ALL)
+                continue
+            unique = get_unique_columns(cursor, self.schema, table)
+            info = {
+                'columns': columns,
+                'fks': table_fks,
+                'unique': unique,
+                'markers': markers,
+                'copy_null_rows': not any(c in unique and t in text_types for (c, t, _) in columns)
+            }
+            if not info['copy_null_rows']:
+                cursor.execute(SQL('SELECT count(*) FROM {}.{} WHERE {} IS NULL;').format(
+                    Identifier(self.schema), Identifier(table), self.copy_index(info, strides)))
+                null_rows = cursor.fetchone()[0]
+                if null_rows:
+                    print(Fore.YELLOW + "Not scaling the {} rows of table {}.{} whose foreign keys are all NULL".format(
+                        null_rows, self.schema, table) + Style.RESET_ALL)
+            plan[table] = info
+        return plan
+
+    def copy_index(self, info, strides):
+        """The copy a row belongs to, NULL if all of its foreign keys are NULL"""
+        return SQL('coalesce({})').format(SQL(', ').join(
+            SQL('{} / {}').format(Identifier(column), Literal(strides[ref_table]))
+            for (column, ref_table) in info['markers']
+        ))
+
+    def copy_select(self, table, info, strides, k):
+        exprs = []
+        for (column, data_type, max_length) in info['columns']:
+            col = Identifier(column)
+            if column == 'id' and table in strides:
+                exprs.append(SQL('{} + {}').format(col, Literal(k * strides[table])))
+            elif column in info['fks']:
+                exprs.append(SQL('{} + {}').format(col, Literal(k * strides[info['fks'][column]])))
+            elif column in info['unique'] and data_type in text_types:
+                suffix = '-{}'.format(k)
+                if max_length:
+                    exprs.append(SQL('left({}::text, {}) || {}').format(
+                        col, Literal(max_length - len(suffix)), Literal(suffix)))
+                else:
+                    exprs.append(SQL('{} || {}').format(col, Literal(suffix)))
+            else:
+                exprs.append(col)
+        index = self.copy_index(info, strides)
+        select = SQL('SELECT {} FROM {}.{} WHERE {} = 0').format(
+            SQL(', ').join(exprs), Identifier(self.schema), Identifier(table), index
+        )
+        if not info['copy_null_rows']:
+            return select
+        # Each distinct row with NULL foreign keys is now repeated k times
+        columns = SQL(', ').join(Identifier(c) for (c, _, _) in info['columns'])
+        return SQL('''{} UNION ALL
+        SELECT {} FROM (
+            SELECT {}, count(*) AS hge_bench_count FROM {}.{} WHERE {} IS NULL GROUP BY {}
+        ) AS null_rows, generate_series(1, hge_bench_count / {})''').format(
+            select, SQL(', ').join(exprs), columns, Identifier(self.schema), Identifier(table), index, columns,
+            Literal(k)
+        )
+
+    def set_sequences(self, cursor, strides, scale_factor):
+        """Move the id sequences past the ids of the last copy"""
+        for (table, stride) in strides.items():
+            cursor.execute('''
+            SELECT setval(seq::regclass, %s)
+            FROM pg_get_serial_sequence(%s, 'id') AS seq
+            WHERE seq IS NOT NULL;
+            ''', (scale_factor * stride, SQL('{}.{}').format(Identifier(self.schema), Identifier(table)).as_string(cursor)))
+
+    def add_copy(self, cursor, plan, strides, k):
+        # Skip foreign key checks; the copies are consistent by construction
+        cursor.execute("SET session_replication_role = 'replica';")
+        for (table, info) in plan.items():
+            buf = io.StringIO()
+            cursor.copy_expert(
+                SQL('COPY ({}) TO STDOUT').format(self.copy_select(table, info, strides, k)).as_string(cursor),
+                buf
+            )
+            buf.seek(0)
+            cursor.copy_expert(
+                SQL('COPY {}.{} ({}) FROM STDIN').format(
+                    Identifier(self.schema), Identifier(table),
+                    SQL(', ').join(Identifier(c) for (c, _, _) in info['columns'])
+                ).as_string(cursor),
+                buf
+            )
+        cursor.execute("SET session_replication_role = 'origin';")
+
+    def remove_copies(self, cursor, plan, strides, current, scale_factor):
+        cursor.execute("SET session_replication_role = 'replica';")
+        for (table, info) in plan.items():
+            index = self.copy_index(info, strides)
+            cursor.execute(SQL('DELETE FROM {}.{} WHERE {} >= {};').format(
+                Identifier(self.schema), Identifier(table), index, Literal(scale_factor)
+            ))
+            if info['copy_null_rows']:
+                # Keep scale_factor of every current repetition of a row with NULL foreign keys
+                columns = SQL(', ').join(Identifier(c) for (c, _, _) in info['columns'])
+                cursor.execute(SQL('''
+                DELETE FROM {0}.{1} WHERE ctid IN (
+                    SELECT ctid FROM (
+                        SELECT ctid, row_number() OVER (PARTITION BY {2}) AS r, count(*) OVER (PARTITION BY {2}) AS n
+                        FROM {0}.{1} WHERE {3} IS NULL
+                    ) AS null_rows
+                    WHERE r > n / {4} * {5}
+                );''').format(
+                    Identifier(self.schema), Identifier(table), columns, index, Literal(current), Literal(scale_factor)
+                ))
+        cursor.execute("SET session_replication_role = 'origin';")
+
+    def scale(self, scale_factor):
+        """Make the dataset scale_factor times the original"""
+        scale_factor = int(scale_factor)
+        if scale_factor < 1:
+            raise ScaleError('Scale factor should be at least 1')
+        (current, strides) = self.get_state()
+        if current == scale_factor:
+            return
+        print("Scaling sportsdb from {}x to {}x".format(current, scale_factor))
+        fks = get_foreign_keys(self.pg, self.schema)
+        with self.pg.cursor() as cursor:
+            plan = self.copy_plan(cursor, strides, fks)
+        if scale_factor < current:
+            with self.pg.cursor() as cursor:
+                self.remove_copies(cursor, plan, strides, current, scale_factor)
+                self.set_sequences(cursor, strides, scale_factor)
+                self.set_state(cursor, scale_factor, strides)
+        for k in range(current, scale_factor):
+            print("Adding copy {} of {}".format(k, scale_factor - 1))
+            # A transaction for every copy
+            with self.pg.cursor() as cursor:
+                self.add_copy(cursor, plan, strides, k)
+                self.set_sequences(cursor, strides, k + 1)
+                self.set_state(cursor, k + 1, strides)
+        with self.pg.cursor() as cursor:
+            cursor.execute(SQL('ANALYZE {};').format(
+                SQL(', ').join(SQL('{}.{}').format(Identifier(self.schema), Identifier(t)) for t in plan)
+            ))
@@ -10,6 +10,8 @@ from colorama import Fore, Style
 from port_allocator import PortAllocator
 from run_postgres import Postgres
 from run_hge import HGE
+from sportsdb_scale import SportsdbScaler
+import setup_snapshot
 
 
 def _first_true(iterable, default=False, pred=None):
@@ -24,7 +26,9 @@ class HGETestSetup:
 
     previous_work_dir_file = '.previous_work_dir'
 
-    def __init__(self, pg_url, remote_pg_url, pg_docker_image, hge_url, remote_hge_url, hge_docker_image=None, hge_args=[], skip_remote_graphql_setup=False, skip_stack_build=False):
+    ab_database = 'hge_bench_ab'
+
+    def __init__(self, pg_url, remote_pg_url, pg_docker_image, hge_url, remote_hge_url, hge_docker_image=None, hge_args=[], skip_remote_graphql_setup=False, skip_stack_build=False, ab_hge_docker_image=None, ab_hge_executable=None, scale_factor=1, snapshot_dir=None):
         self.pg_url = pg_url
         self.remote_pg_url = remote_pg_url
         self.pg_docker_image = pg_docker_image
@@ -34,6 +38,14 @@ class HGETestSetup:
         self.hge_args = hge_args
         self.skip_remote_graphql_setup = skip_remote_graphql_setup
         self.skip_stack_build = skip_stack_build
+        # A/B mode: a second graphql-engine (B) is run against a clone of the database
+        self.ab_hge_docker_image = ab_hge_docker_image
+        self.ab_hge_executable = ab_hge_executable
+        self.ab_mode = bool(ab_hge_docker_image or ab_hge_executable)
+        # The sportsdb dataset is scaled up to scale_factor times its size
+        self.scale_factor = int(scale_factor)
+        # Directory of the setup snapshots. None disables snapshots
+        self.snapshot_dir = snapshot_dir
         self.port_allocator = PortAllocator()
         self.init_work_dir()
         self.init_pgs()
@@ -89,18 +101,40 @@ class HGETestSetup:
         if not self.skip_remote_graphql_setup:
             self.remote_pg = _init_pg('remote_sportsdb_data', self.remote_pg_url)
 
+    def split_cpus(self):
+        """
+        Disjoint CPU sets for graphql-engine A, graphql-engine B and the load
+        generator, in A/B mode. None if there are not enough CPUs to split
+        """
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < 3:
+            print(Fore.YELLOW + "Not enough CPUs to pin graphql-engines and the load generator" + Style.RESET_ALL)
+            return (None, None, None)
+        n = len(cpus) // 3
+        return (cpus[:n], cpus[n:2*n], cpus[2*n:])
+
+    def mk_hge(self, pg, hge_url, log_file, docker_image=None, executable=None, cpus=None, extra_args=[]):
+        return HGE(
+            pg=pg, url=hge_url, port_allocator=self.port_allocator,
+            args=self.hge_args + extra_args, log_file= self.work_dir + '/' + log_file,
+            docker_image=docker_image, executable=executable, cpus=cpus
+        )
+
     def init_hges(self):
-        def _init_hge(pg, hge_url, log_file):
-            return HGE(
-                pg=pg, url=hge_url, port_allocator=self.port_allocator,
-                args=self.hge_args, log_file= self.work_dir + '/' + log_file,
-                docker_image=self.hge_docker_image
-            )
+        _init_hge = self.mk_hge
+
+        (hge_cpus, ab_hge_cpus, self.load_cpus) = self.split_cpus() if self.ab_mode else (None, None, None)
+        self.hge = _init_hge(self.pg, self.hge_url, 'hge.log', docker_image=self.hge_docker_image, cpus=hge_cpus)
 
-        self.hge = _init_hge(self.pg, self.hge_url, 'hge.log')
+        if self.ab_mode:
+            # Postgres is set once the database is cloned
+            self.ab_hge = _init_hge(
+                None, None, 'ab_hge.log', docker_image=self.ab_hge_docker_image,
+                executable=self.ab_hge_executable, cpus=ab_hge_cpus
+            )
 
         if not self.skip_remote_graphql_setup:
-            self.remote_hge = _init_hge(self.remote_pg, self.remote_hge_url, 'remote_hge.log')
+            self.remote_hge = _init_hge(self.remote_pg, self.remote_hge_url, 'remote_hge.log', docker_image=self.hge_docker_image)
 
     @contextmanager
     def graphql_engines_setup(self):
@@ -111,6 +145,19 @@ class HGETestSetup:
             self.teardown()
 
     def _setup_graphql_engines(self):
+        self._setup_sportsdb()
+        SportsdbScaler(self.pg, 'hge').scale(self.scale_factor)
+        if self.ab_mode:
+            self.setup_ab_hge()
+
+    def setup_ab_hge(self):
+        """Run graphql-engine B against a clone of the database (including the metadata) of A"""
+        self.ab_pg = self.pg.clone_database(self.ab_database)
+        self.ab_hge.pg = self.ab_pg
+        self.ab_hge.run()
+        print("GraphQL engine B url:", self.ab_hge.url)
+
+    def _setup_sportsdb(self):
 
         if not self.hge_docker_image and not self.skip_stack_build:
             HGE.do_stack_build()
@@ -161,36 +208,90 @@ class HGETestSetup:
 
         # Download sportsdb
         zip_file = self.download_sportsdb_zip(self.work_dir+ '/sportsdb.zip')
+
+        snapshot = self.get_snapshot(zip_file)
+        if snapshot and snapshot.exists():
+            self.restore_snapshot(snapshot, run_concurrently_fns)
+            return
+
         sql_file = self.unzip_sql_file(zip_file)
 
         def set_remote_hge():
             if not self.skip_remote_graphql_setup:
                 set_hge(self.remote_hge, 'remote_hge', 'Remote')
 
-        # Create the required tables and move them to required schemas
-        hge_thread = threading.Thread(
-            target=set_hge, args=(self.hge, 'hge', 'Main'))
-        remote_hge_thread = threading.Thread(
-            target=set_remote_hge)
-        run_concurrently([hge_thread, remote_hge_thread])
+        def build_sportsdb():
+            # Create the required tables and move them to required schemas
+            hge_thread = threading.Thread(
+                target=set_hge, args=(self.hge, 'hge', 'Main'))
+            remote_hge_thread = threading.Thread(
+                target=set_remote_hge)
+            run_concurrently([hge_thread, remote_hge_thread])
 
-        if not self.skip_remote_graphql_setup:
-            # Add remote_hge as remote schema
-            self.hge.add_remote_schema(
-                'remote_hge', self.remote_hge.url + '/v1/graphql',
-                self.remote_hge.admin_auth_headers()
-            )
+            if not self.skip_remote_graphql_setup:
+                # Add remote_hge as remote schema
+                self.hge.add_remote_schema(
+                    'remote_hge', self.remote_hge.url + '/v1/graphql',
+                    self.remote_hge.admin_auth_headers()
+                )
 
-        # TODO update the remote schema url if needed
-        tables = self.pg.get_all_tables_in_a_schema('hdb_catalog')
+            # TODO update the remote schema url if needed
+            tables = self.pg.get_all_tables_in_a_schema('hdb_catalog')
 
-	    # Create remote relationships only if it is supported
-        if 'hdb_remote_relationship' not in tables:
-            return
+            # Create remote relationships only if it is supported
+            if 'hdb_remote_relationship' not in tables:
+                return
+
+            # Create remote relationships
+            if not self.skip_remote_graphql_setup:
+                self.create_remote_relationships()
 
-        # Create remote relationships
+        build_sportsdb()
+        if snapshot:
+            self.save_snapshot(snapshot)
+
+    def get_snapshot(self, zip_file):
+        """The snapshot of the setup for this sportsdb, graphql-engine catalog and Postgres"""
+        if not self.snapshot_dir:
+            return None
+        catalog_version = self.pg.get_catalog_version()
+        if not catalog_version:
+            return None
+        key = setup_snapshot.snapshot_key(
+            setup_snapshot.file_sha256(zip_file), catalog_version,
+            self.pg.get_server_version(), not self.skip_remote_graphql_setup
+        )
+        return setup_snapshot.SetupSnapshot(self.snapshot_dir, key)
+
+    def snapshot_parts(self):
+        parts = [('hge', self.pg, self.hge, 'hge')]
         if not self.skip_remote_graphql_setup:
-            self.create_remote_relationships()
+            parts.append(('remote_hge', self.remote_pg, self.remote_hge, 'remote_hge'))
+        return parts
+
+    def save_snapshot(self, snapshot):
+        try:
+            snapshot.save(self.snapshot_parts())
+        except Exception as e:
+            # The setup is done, just not cached
+            print(Fore.YELLOW + "Could not save setup snapshot: " + repr(e) + Style.RESET_ALL)
+
+    def restore_snapshot(self, snapshot, run_concurrently_fns):
+        print("Restoring setup snapshot", snapshot.dir)
+        run_concurrently_fns(*[
+            (lambda name=name, pg=pg: snapshot.restore_data(name, pg))
+            for (name, pg, _, _) in self.snapshot_parts()
+        ])
+        # The remote schema has to be up before the metadata referring to it is replaced
+        if not self.skip_remote_graphql_setup:
+            self.remote_hge.replace_metadata(snapshot.load_metadata('remote_hge'))
+        metadata = snapshot.load_metadata('hge')
+        if not self.skip_remote_graphql_setup:
+            metadata = self.hge.set_remote_schema_definition(
+                metadata, 'remote_hge', self.remote_hge.url + '/v1/graphql',
+                self.remote_hge.admin_auth_headers()
+            )
+        self.hge.replace_metadata(metadata)
 
     def create_remote_relationships(self):
         self.hge.create_remote_obj_rel_to_itself('hge', 'remote_hge', 'remote_hge')
@@ -198,6 +299,8 @@ class HGETestSetup:
         self.hge.create_remote_obj_fk_ish_relationships('hge', 'remote_hge', 'remote_hge')
 
     def teardown(self):
+        if self.ab_mode:
+            self.ab_hge.teardown()
         for res in [self.hge, self.pg]:
             res.teardown()
         if not self.skip_remote_graphql_setup:
@@ -238,11 +341,13 @@ class HGETestSetupArgs:
         self.arg_parser = argparse.ArgumentParser()
         self.set_pg_options()
         self.set_hge_options()
+        self.set_dataset_options()
 
     def parse_args(self):
         self.parsed_args = self.arg_parser.parse_args()
         self.set_pg_confs()
         self.set_hge_confs()
+        self.set_dataset_confs()
 
     def set_pg_confs(self):
         self.pg_url, self.remote_pg_url, self.pg_docker_image = self.get_params(
@@ -258,6 +363,16 @@ class HGETestSetupArgs:
         self.skip_stack_build = self.parsed_args.skip_stack_build
         self.skip_remote_graphql_setup = self.parsed_args.skip_remote_graphql_setup
         self.hge_args =  self.parsed_args.hge_args[1:]
+        self.ab_hge_docker_image, self.ab_hge_executable = self.get_params(
+            ['ab_hge_docker_image', 'ab_hge_executable']
+        )
+
+    def set_dataset_confs(self):
+        self.scale_factor = int(self.get_param('scale_factor') or 1)
+        if self.parsed_args.no_snapshot:
+            self.snapshot_dir = None
+        else:
+            self.snapshot_dir = self.get_param('snapshot_dir') or setup_snapshot.default_snapshot_dir
 
     def set_pg_options(self):
         pg_opts = self.arg_parser.add_argument_group('Postgres').add_mutually_exclusive_group()
@@ -272,8 +387,18 @@ class HGETestSetupArgs:
         hge_opts.add_argument('--hge-docker-image', metavar='HASURA_BENCH_HGE_DOCKER_IMAGE', help='GraphQl engine docker image to be used for tests', required=False)
         hge_opts.add_argument('--skip-stack-build', help='Skip stack build if this option is set', action='store_true', required=False)
         hge_opts.add_argument('--skip-remote-graphql-setup', help='Skip setting up of remote graphql engine', action='store_true', required=False)
+        ab_opts = hge_opts.add_mutually_exclusive_group()
+        ab_opts.add_argument('--ab-hge-docker-image', metavar='HASURA_BENCH_AB_HGE_DOCKER_IMAGE', help='A/B mode: docker image of the graphql-engine (B) to be compared with the one under test (A)', required=False)
+        ab_opts.add_argument('--ab-hge-executable', metavar='HASURA_BENCH_AB_HGE_EXECUTABLE', help='A/B mode: graphql-engine executable (B) to be compared with the one under test (A)', required=False)
         self.arg_parser.add_argument('hge_args', nargs=argparse.REMAINDER)
 
+    def set_dataset_options(self):
+        dataset_opts = self.arg_parser.add_argument_group('Dataset')
+        dataset_opts.add_argument('--scale-factor', metavar='HASURA_BENCH_SCALE_FACTOR', help='Scale the sportsdb dataset up to this many times its size, by cloning its rows (default: 1)', type=int, required=False)
+        snapshot_opts = dataset_opts.add_mutually_exclusive_group()
+        snapshot_opts.add_argument('--snapshot-dir', metavar='HASURA_BENCH_SNAPSHOT_DIR', help='Directory of the snapshots of the sportsdb setup, which are restored instead of setting up from scratch (default: {})'.format(setup_snapshot.default_snapshot_dir), required=False)
+        snapshot_opts.add_argument('--no-snapshot', help='Always set up sportsdb from scratch, and do not save a snapshot', action='store_true', required=False)
+
     def default_env(self, attr):
         return 'HASURA_BENCH_' + attr.upper()
 
@@ -311,11 +436,17 @@ class HGETestSetupWithArgs(HGETestSetup, HGETestSetupArgs):
             hge_docker_image = self.hge_docker_image,
             skip_stack_build = self.skip_stack_build,
             skip_remote_graphql_setup = self.skip_remote_graphql_setup,
-            hge_args = self.hge_args
+            hge_args = self.hge_args,
+            ab_hge_docker_image = self.ab_hge_docker_image,
+            ab_hge_executable = self.ab_hge_executable,
+            scale_factor = self.scale_factor,
+            snapshot_dir = self.snapshot_dir
         )
 
 if __name__ == "__main__":
     test_setup = HGETestSetupWithArgs()
     with test_setup.graphql_engines_setup():
         print("Hasura GraphQL engine is running on URL:",test_setup.hge.url+ '/v1/graphql')
+        if test_setup.ab_mode:
+            print("Hasura GraphQL engine B is running on URL:",test_setup.ab_hge.url+ '/v1/graphql')
         input(Fore.BLUE+'Press Enter to stop GraphQL engine' + Style.RESET_ALL)
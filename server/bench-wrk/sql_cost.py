@@ -0,0 +1,112 @@
+"""
+Attribute the time spent in Postgres to the GraphQL operations of a benchmark
+run, using pg_stat_statements.
+
+The statements recorded by pg_stat_statements during the run are matched to
+the SQL that graphql-engine generates for each operation, as reported by
+/v1/graphql/explain. Constants and parameters are normalised away on both
+sides before comparing. The mean time in Postgres per request is then set
+against the mean latency of the operation, giving a breakdown of the time
+spent in Postgres and in graphql-engine (which also includes the network and
+the load generator).
+"""
+
+import difflib
+import re
+
+# Statements run by the benchmark harness itself, e.g. the telemetry sampler
+harness_statement = re.compile(r'pg_stat_(statements|activity|database)|pg_catalog|information_schema', re.IGNORECASE)
+
+# Minimum similarity of normalised statements to be considered a match
+min_similarity = 0.9
+
+
+def normalise_sql(sql):
+    sql = sql.lower()
+    # String literals, parameters and numbers
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\$\d+', '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    # Casts of constants, e.g. ('1')::integer or $1::text
+    sql = re.sub(r'\?\s*::\s*[\w ]+?(\[\])?(?=[\s,)]|$)', '?', sql)
+    return ' '.join(sql.split())
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def match_statements(operation_sqls, statements):
+    """
+    operation_sqls maps the name of each operation to the SQL graphql-engine
+    generates for it. Returns the statements matched to every operation, and
+    the statements which did not match any operation
+    """
+    normalised = {
+        op: [normalise_sql(s) for s in sqls]
+        for (op, sqls) in operation_sqls.items()
+    }
+    matched = {op: [] for op in operation_sqls}
+    unmatched = []
+    for st in statements:
+        if harness_statement.search(st['query']):
+            continue
+        st_sql = normalise_sql(st['query'])
+        best = (None, 0)
+        for (op, sqls) in normalised.items():
+            for sql in sqls:
+                # Cheap check first, similarity is quadratic
+                score = 1.0 if sql == st_sql else similarity(sql, st_sql)
+                if score > best[1]:
+                    best = (op, score)
+        if best[1] >= min_similarity:
+            matched[best[0]].append(st)
+        else:
+            unmatched.append(st)
+    return (matched, unmatched)
+
+
+def summarise_statements(statements):
+    calls = sum(st['calls'] for st in statements)
+    total_time = sum(st['total_time'] for st in statements)
+    hits = sum(st['shared_blks_hit'] for st in statements)
+    reads = sum(st['shared_blks_read'] for st in statements)
+    return {
+        'statements': len(statements),
+        'calls': calls,
+        'rows': sum(st['rows'] for st in statements),
+        'total_time_ms': total_time,
+        'mean_time_ms': total_time / calls if calls else None,
+        'shared_blks_hit': hits,
+        'shared_blks_read': reads,
+        'cache_hit_ratio': hits / float(hits + reads) if hits + reads else None
+    }
+
+
+def breakdown(statements, requests, mean_latency_ms):
+    """Time in Postgres vs time in graphql-engine, per request"""
+    out = summarise_statements(statements)
+    out['requests'] = requests
+    out['mean_latency_ms'] = mean_latency_ms
+    if requests and mean_latency_ms:
+        pg_ms = out['total_time_ms'] / requests
+        out['postgres_ms_per_request'] = pg_ms
+        out['hge_ms_per_request'] = max(0.0, mean_latency_ms - pg_ms)
+        out['postgres_share'] = min(1.0, pg_ms / mean_latency_ms)
+    return out
+
+
+def attribute(operation_sqls, statements, operation_stats):
+    """
+    operation_stats maps the name of each operation to its number of requests
+    and mean latency in milliseconds. Returns the breakdown for every
+    operation, and the totals of unmatched statements
+    """
+    (matched, unmatched) = match_statements(operation_sqls, statements)
+    return {
+        'operations': {
+            op: breakdown(matched[op], *operation_stats[op])
+            for op in operation_sqls
+        },
+        'unmatched': summarise_statements(unmatched)
+    }
@@ -0,0 +1,159 @@
+"""
+Startup benchmark of graphql-engine.
+
+graphql-engine is launched repeatedly against metadata of increasing size. The
+metadata is grown by adding copies of the sportsdb schema (empty tables, with
+their foreign keys), whose tables and relationships are tracked. Every launch
+measures:
+- time_to_listen: from the launch to the server port accepting connections
+- time_to_first_query: from the launch to the first successful query
+- schema_cache_build: from the 'postgres_connection' startup log to the
+  'catalog_migrate' one, during which the schema cache is built (the catalog
+  being already up to date)
+- api_init: the initialisation time reported by graphql-engine, in the
+  'starting API server' startup log
+- peak_rss_bytes: peak resident memory of graphql-engine, once it serves
+  queries
+Times are in seconds. Launch times include starting the docker container, or
+'cabal run' checking that the build is up to date.
+"""
+
+import datetime
+import json
+import time
+
+import numpy as np
+
+from run_hge import HGEError
+
+startup_metrics = ['time_to_listen', 'time_to_first_query', 'schema_cache_build', 'api_init', 'peak_rss_bytes']
+
+copy_schema_prefix = 'hge_startup_'
+
+
+def parse_log_time(timestamp):
+    # Milliseconds are left out when they are zero
+    for fmt in ['%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z']:
+        try:
+            return datetime.datetime.strptime(timestamp, fmt).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def startup_log_times(logs):
+    """Timings of the startup, from the 'startup' logs of graphql-engine"""
+    kind_times = {}
+    out = {}
+    for log in logs:
+        if log.get('type') != 'startup':
+            continue
+        detail = log.get('detail') or {}
+        kind = detail.get('kind')
+        info = detail.get('info')
+        if kind and kind not in kind_times:
+            kind_times[kind] = parse_log_time(log.get('timestamp', ''))
+        if kind == 'server' and isinstance(info, dict) and 'time_taken' in info:
+            out['api_init'] = info['time_taken']
+    (connected, migrated) = (kind_times.get('postgres_connection'), kind_times.get('catalog_migrate'))
+    if connected and migrated:
+        out['schema_cache_build'] = migrated - connected
+    return out
+
+
+def measure_startup(hge, poll_interval=0.01, timeout=300):
+    """Launch graphql-engine, measure its startup and stop it"""
+    hge.run(wait=False)
+    try:
+        deadline = hge.launch_time + timeout
+        out = {}
+        while True:
+            hge.check_if_running()
+            if 'time_to_listen' not in out and hge.is_listening():
+                out['time_to_listen'] = time.time() - hge.launch_time
+            if 'time_to_listen' in out and hge.is_serving():
+                out['time_to_first_query'] = time.time() - hge.launch_time
+                break
+            if time.time() > deadline:
+                raise HGEError("Timeout waiting for graphql-engine to start")
+            time.sleep(poll_interval)
+        out['peak_rss_bytes'] = hge.get_peak_rss()
+        out.update(startup_log_times(hge.get_logs_since(0)))
+        return out
+    finally:
+        hge.teardown()
+
+
+def metadata_size(metadata):
+    tables = metadata.get('tables') or []
+    permission_keys = ['select_permissions', 'insert_permissions', 'update_permissions', 'delete_permissions']
+    return {
+        'tables': len(tables),
+        'relationships': sum(
+            len(t.get('object_relationships') or []) + len(t.get('array_relationships') or [])
+            for t in tables
+        ),
+        'remote_relationships': sum(len(t.get('remote_relationships') or []) for t in tables),
+        'permissions': sum(len(t.get(k) or []) for t in tables for k in permission_keys),
+        'remote_schemas': len(metadata.get('remote_schemas') or []),
+        'bytes': len(json.dumps(metadata))
+    }
+
+
+def summarise_trials(trials):
+    """Median, min and max of every metric over the trials"""
+    out = {}
+    for metric in startup_metrics:
+        values = [t[metric] for t in trials if t.get(metric) is not None]
+        if values:
+            out[metric] = {
+                'median': float(np.median(values)),
+                'min': float(min(values)),
+                'max': float(max(values))
+            }
+    return out
+
+
+def add_schema_copy(pg, hge, source_schema, i):
+    """Add copy i of source_schema, and track its tables and relationships"""
+    schema = copy_schema_prefix + str(i)
+    pg.copy_schema_structure(source_schema, schema)
+    hge.track_all_tables_in_schema(schema)
+    hge.create_obj_fk_relationships(schema)
+    hge.create_arr_fk_relationships(schema)
+
+
+def drop_schema_copies(pg, count):
+    for i in range(count):
+        pg.drop_schema(copy_schema_prefix + str(i))
+
+
+def run_startup_benchmark(hge, mk_hge, pg, source_schema, schema_copies, trials):
+    """
+    For every number of copies of source_schema in schema_copies (in
+    increasing order), launch graphql-engines made by mk_hge() trials times.
+    hge is the running graphql-engine, through which the metadata is changed.
+    Yields the number of copies, the size of the metadata, and the
+    measurements of every trial
+    """
+    original_metadata = hge.export_metadata()
+    copies = 0
+    try:
+        for n in sorted(set(schema_copies)):
+            while copies < n:
+                add_schema_copy(pg, hge, source_schema, copies)
+                copies += 1
+            size = metadata_size(hge.export_metadata())
+            print("Startup benchmark with {} copies of schema {}: {tables} tables, {relationships} relationships".format(n, source_schema, **size))
+            results = []
+            for trial in range(trials):
+                result = measure_startup(mk_hge())
+                print("Trial {}: listening after {:.2f}s, first query after {:.2f}s".format(
+                    trial, result['time_to_listen'], result['time_to_first_query']
+                ))
+                results.append(result)
+            yield (n, size, results)
+    finally:
+        hge.replace_metadata(original_metadata)
+        # Including a copy which failed half way
+        drop_schema_copies(pg, copies + 1)
@@ -0,0 +1,393 @@
+"""
+Subscription fan-out benchmark.
+
+Opens a large number of live queries over the graphql-ws protocol and measures
+the time from a mutation being committed to the corresponding 'data' frame
+arriving on each subscriber. The subscribers are spread over worker processes,
+each running its own asyncio event loop. Commit times of the mutations are
+broadcast to the workers, which record the delivery latencies in
+HdrHistograms.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+import load_generator
+import telemetry
+
+
+SUBSCRIPTION = '''
+subscription bench_subscription($id: Int!) {
+  hge_events_by_pk(id: $id) {
+    id
+    duration
+  }
+}
+'''
+
+MUTATION = '''
+mutation bench_mutation($id: Int!, $token: String!) {
+  update_hge_events(where: {id: {_eq: $id}}, _set: {duration: $token}) {
+    affected_rows
+  }
+}
+'''
+
+TOKEN_PREFIX = 'bench-'
+
+
+class SubscriptionBenchError(Exception):
+    """Exception type for the subscriptions benchmark"""
+
+
+def mk_token(seq):
+    return TOKEN_PREFIX + str(seq)
+
+
+def parse_token(token):
+    if isinstance(token, str) and token.startswith(TOKEN_PREFIX):
+        return int(token[len(TOKEN_PREFIX):])
+    return None
+
+
+def ws_url(hge_url):
+    p = urlparse(hge_url)
+    scheme = 'wss' if p.scheme == 'https' else 'ws'
+    return p._replace(scheme=scheme, path='/v1/graphql').geturl()
+
+
+def raise_nofile_limit():
+    # Every subscriber connection needs a file descriptor
+    (_, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def record_latency(histogram, latency):
+    latency_us = max(load_generator.LOWEST_LATENCY, int(latency * 1000000))
+    histogram.record_value(min(latency_us, load_generator.HIGHEST_LATENCY))
+
+
+class SubscriberStats:
+    """
+    The commit of a mutation happens between the time it is sent and the
+    time its response arrives, so the latency of a delivery is bounded by the
+    arrival minus either time: histogram holds the lower bound (from the
+    response), and upper_histogram the upper bound (from the send time)
+    """
+
+    def __init__(self, subscriptions):
+        self.histogram = load_generator.new_histogram()
+        self.upper_histogram = load_generator.new_histogram()
+        self.awaiting_first_data = subscriptions
+        self.deliveries = 0
+        self.errors = 0
+        # Deliveries arriving before the response of their mutation, whose
+        # lower bound is negative and recorded as the lowest latency
+        self.clamped = 0
+        self.commits = {}
+        # Arrivals of mutations whose commit time is not yet known
+        self.pending = {}
+
+    def on_data(self, token, arrived_at):
+        seq = parse_token(token)
+        if seq is None:
+            return
+        self.deliveries += 1
+        if seq in self.commits:
+            self.record(arrived_at, *self.commits[seq])
+        else:
+            self.pending.setdefault(seq, []).append(arrived_at)
+
+    def on_commit(self, seq, sent_at, acked_at):
+        self.commits[seq] = (sent_at, acked_at)
+        for arrived_at in self.pending.pop(seq, []):
+            self.record(arrived_at, sent_at, acked_at)
+
+    def record(self, arrived_at, sent_at, acked_at):
+        if arrived_at < acked_at:
+            self.clamped += 1
+        record_latency(self.histogram, arrived_at - acked_at)
+        record_latency(self.upper_histogram, arrived_at - sent_at)
+
+    def as_result(self):
+        return {
+            'histogram': self.histogram.encode(),
+            'upper_histogram': self.upper_histogram.encode(),
+            'deliveries': self.deliveries,
+            'errors': self.errors,
+            'clamped': self.clamped,
+            # Arrivals for which commits were never seen
+            'unmatched': sum(len(v) for v in self.pending.values())
+        }
+
+
+async def run_connection(session, url, headers, subs, stats, ready, stop):
+    async with session.ws_connect(url, protocols=['graphql-ws'], max_msg_size=0) as ws:
+        await ws.send_json({'type': 'connection_init', 'payload': {'headers': headers}})
+        for (op_id, row_id) in subs:
+            await ws.send_json({
+                'id': str(op_id),
+                'type': 'start',
+                'payload': {'query': SUBSCRIPTION, 'variables': {'id': row_id}}
+            })
+        started = set()
+        while not stop.is_set():
+            try:
+                msg = await ws.receive(timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            arrived_at = time.time()
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                if msg.type in [aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR]:
+                    raise SubscriptionBenchError('Websocket closed by server: ' + repr(msg))
+                continue
+            frame = json.loads(msg.data)
+            if frame['type'] == 'connection_error':
+                raise SubscriptionBenchError('Connection failed: ' + msg.data)
+            if frame.get('id') is not None and frame['id'] not in started and (
+                    frame['type'] == 'error' or (frame.get('payload') or {}).get('errors')):
+                # The subscription would never be established
+                raise SubscriptionBenchError('Subscription {} failed: {}'.format(frame['id'], msg.data))
+            if frame['type'] == 'data':
+                op_id = frame['id']
+                if op_id not in started:
+                    started.add(op_id)
+                    stats.awaiting_first_data -= 1
+                    if stats.awaiting_first_data == 0:
+                        ready.set()
+                    continue
+                row = (frame['payload'].get('data') or {}).get('hge_events_by_pk')
+                if row:
+                    stats.on_data(row['duration'], arrived_at)
+            elif frame['type'] == 'error':
+                stats.errors += 1
+
+
+async def run_subscribers_async(url, headers, conn_subs, ready_queue, commit_queue, stop_event):
+    loop = asyncio.get_event_loop()
+    stats = SubscriberStats(sum(len(s) for s in conn_subs))
+    ready = asyncio.Event()
+    stop = asyncio.Event()
+
+    async def watch_ready():
+        await ready.wait()
+        ready_queue.put(True)
+
+    async def watch_commits():
+        while not stop_event.is_set():
+            try:
+                while True:
+                    (seq, sent_at, acked_at) = commit_queue.get_nowait()
+                    stats.on_commit(seq, sent_at, acked_at)
+            except queue.Empty:
+                pass
+            await asyncio.sleep(0.05)
+        stop.set()
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [
+            loop.create_task(run_connection(session, url, headers, subs, stats, ready, stop))
+            for subs in conn_subs
+        ]
+        await asyncio.gather(watch_ready(), watch_commits(), *tasks)
+    return stats
+
+
+def run_subscribers(url, headers, conn_subs, ready_queue, commit_queue, stop_event, result_queue):
+    raise_nofile_limit()
+    loop = load_generator.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        stats = loop.run_until_complete(
+            run_subscribers_async(url, headers, conn_subs, ready_queue, commit_queue, stop_event)
+        )
+        result_queue.put(stats.as_result())
+    except Exception as e:
+        ready_queue.put(False)
+        result_queue.put({'exception': repr(e)})
+        raise
+    finally:
+        loop.close()
+
+
+async def run_mutations(url, headers, row_ids, rate, duration, on_commit):
+    """Send mutations at a steady rate, updating the rows in a round robin manner"""
+    loop = asyncio.get_event_loop()
+    interval = 1.0 / rate
+    start = loop.time()
+    expected = {}
+
+    async def mutate(session, seq, row_id):
+        variables = {'id': row_id, 'token': mk_token(seq)}
+        # The mutation is committed between these two times
+        sent_at = time.time()
+        async with session.post(url, json={'query': MUTATION, 'variables': variables}, headers=headers) as resp:
+            body = await resp.json()
+        if resp.status != 200 or 'errors' in body:
+            raise SubscriptionBenchError('Mutation failed: ' + json.dumps(body))
+        on_commit(seq, sent_at, time.time())
+
+    async with aiohttp.ClientSession() as session:
+        tasks = []
+        seq = 0
+        while loop.time() - start < duration:
+            row_id = row_ids[seq % len(row_ids)]
+            expected[seq] = row_id
+            tasks.append(loop.create_task(mutate(session, seq, row_id)))
+            seq += 1
+            await asyncio.sleep(max(0.0, start + seq * interval - loop.time()))
+        await asyncio.gather(*tasks)
+    return expected
+
+
+# defaultEnabledEngineLogTypes of graphql-engine
+default_log_types = ['startup', 'http-log', 'webhook-log', 'websocket-log']
+
+poller_log_type = 'livequery-poller-log'
+
+
+def with_poller_logs(hge_args):
+    """
+    The arguments of graphql-engine, with livequery-poller-log added to the
+    log types enabled by HASURA_GRAPHQL_ENABLED_LOG_TYPES (or the default
+    ones), unless the arguments already choose the log types
+    """
+    if any(a == '--enabled-log-types' or a.startswith('--enabled-log-types=') for a in hge_args):
+        return hge_args
+    env_types = os.environ.get('HASURA_GRAPHQL_ENABLED_LOG_TYPES')
+    types = [t.strip() for t in env_types.split(',')] if env_types else list(default_log_types)
+    if poller_log_type not in types:
+        types.append(poller_log_type)
+    return hge_args + ['--enabled-log-types', ','.join(types)]
+
+
+def summarise_poller_logs(logs, cpu_seconds):
+    """
+    Per poller totals from 'livequery-poller-log' lines. The CPU time of the
+    server is attributed to the pollers in proportion to their poll time;
+    graphql-engine reports no memory per poller, which is not recorded
+    """
+    pollers = {}
+    for l in logs:
+        if l.get('type') != poller_log_type:
+            continue
+        detail = l['detail']
+        p = pollers.setdefault(detail['poller_id'], {
+            'poll_cycles': 0,
+            'total_time': 0.0,
+            'pg_execution_time': 0.0,
+            'push_time': 0.0
+        })
+        p['poll_cycles'] += 1
+        p['total_time'] += detail['total_time']
+        for batch in detail['batches']:
+            p['pg_execution_time'] += batch['pg_execution_time']
+            p['push_time'] += batch['push_time']
+    total_time = sum(p['total_time'] for p in pollers.values())
+    for p in pollers.values():
+        if cpu_seconds is not None and total_time:
+            p['attributed_cpu_seconds'] = cpu_seconds * p['total_time'] / total_time
+    return pollers
+
+
+def run_fanout(hge, row_ids, subscriptions, subs_per_connection, mutation_rate, duration, workers, settle_time=5, pg=None):
+    """
+    Open the subscriptions on rows row_ids, and run mutations at mutation_rate
+    for duration seconds. Returns the merged latency histogram, a summary and
+    the telemetry samples of the run
+    """
+    url = ws_url(hge.url)
+    headers = hge.admin_auth_headers()
+    subs = [(i, row_ids[i % len(row_ids)]) for i in range(subscriptions)]
+    subscribers_by_row = {}
+    for (_, row_id) in subs:
+        subscribers_by_row[row_id] = subscribers_by_row.get(row_id, 0) + 1
+    conns = [subs[i:i + subs_per_connection] for i in range(0, len(subs), subs_per_connection)]
+    workers = max(1, min(workers, len(conns)))
+
+    ready_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    commit_queues = [multiprocessing.Queue() for _ in range(workers)]
+    procs = [
+        multiprocessing.Process(
+            target=run_subscribers,
+            args=(url, headers, conns[i::workers], ready_queue, commit_queues[i], stop_event, result_queue)
+        )
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+
+    try:
+        print("Waiting for {} subscriptions to be established".format(subscriptions))
+        for _ in procs:
+            if not ready_queue.get(timeout=600):
+                raise SubscriptionBenchError('Failed to establish subscriptions')
+
+        def on_commit(seq, sent_at, acked_at):
+            for q in commit_queues:
+                q.put((seq, sent_at, acked_at))
+
+        sampler = telemetry.TelemetrySampler(hge, pg)
+        sampler.start()
+        log_marker = hge.get_log_marker()
+        start = time.time()
+        loop = load_generator.new_event_loop()
+        try:
+            expected = loop.run_until_complete(
+                run_mutations(hge.url + '/v1/graphql', headers, row_ids, mutation_rate, duration, on_commit)
+            )
+        finally:
+            loop.close()
+        # Let the pollers catch up with the last mutations
+        time.sleep(settle_time)
+        end = time.time()
+        samples = sampler.stop()
+    finally:
+        stop_event.set()
+
+    results = [result_queue.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join()
+    failed = [r['exception'] for r in results if 'exception' in r]
+    if failed:
+        raise SubscriptionBenchError('Subscribers failed: ' + ', '.join(failed))
+
+    histogram = load_generator.new_histogram()
+    upper_histogram = load_generator.new_histogram()
+    for r in results:
+        histogram.decode_and_add(r['histogram'])
+        upper_histogram.decode_and_add(r['upper_histogram'])
+    resource_usage = telemetry.summarise(samples, start, end)
+    logs = hge.get_logs_since(log_marker) if log_marker is not None else []
+    summary = {
+        'subscriptions': subscriptions,
+        'connections': len(conns),
+        'distinct_rows': len(row_ids),
+        'mutation_rate': mutation_rate,
+        'mutations': len(expected),
+        'duration': duration,
+        'deliveries': sum(r['deliveries'] for r in results),
+        'expected_deliveries': sum(subscribers_by_row[row_id] for row_id in expected.values()),
+        'unmatched_deliveries': sum(r['unmatched'] for r in results),
+        'errors': sum(r['errors'] for r in results),
+        # From the response of the mutations (a lower bound), and from the
+        # requests (an upper bound)
+        'latency': load_generator.get_histogram_summary(histogram),
+        'latency_upper_bound': load_generator.get_histogram_summary(upper_histogram),
+        'clamped_deliveries': sum(r['clamped'] for r in results),
+        'resource_usage': resource_usage,
+        'pollers': summarise_poller_logs(logs, resource_usage['process'].get('cpu_seconds')),
+        'live_queries_state': hge.dev_api('subscriptions')
+    }
+    return (histogram, summary, telemetry.in_window(samples, start, end))
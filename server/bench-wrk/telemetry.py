@@ -0,0 +1,151 @@
+"""
+Resource telemetry of graphql-engine and Postgres, sampled during a benchmark.
+
+Every sample has the time, and whatever is available of:
+- process: CPU time, resident memory and thread count of graphql-engine (from
+  /proc, or the docker stats API when it is run with docker)
+- gc: GHC RTS GC statistics, from EKG (/dev/ekg). Needs the developer APIs to
+  be enabled, and graphql-engine to be run with '+RTS -T'
+- postgres: backend counts by state, and the counters of pg_stat_database
+The samples are stored as a time series in hge_bench.telemetry, and summarised
+with each result, so that a latency regression can be attributed to GC, the
+database or CPU.
+"""
+
+import datetime
+import threading
+import time
+
+# Counters of pg_stat_database, whose differences over the run are summarised
+pg_database_counters = [
+    'xact_commit', 'xact_rollback', 'blks_read', 'blks_hit', 'tup_returned',
+    'tup_fetched', 'tup_inserted', 'tup_updated', 'tup_deleted', 'conflicts',
+    'temp_files', 'temp_bytes', 'deadlocks', 'blk_read_time', 'blk_write_time'
+]
+
+# Counters of the GHC RTS
+gc_counters = [
+    'num_gcs', 'bytes_allocated', 'bytes_copied', 'num_bytes_usage_samples',
+    'cumulative_bytes_used', 'gc_cpu_ms', 'gc_wall_ms', 'mutator_cpu_ms',
+    'mutator_wall_ms', 'cpu_ms', 'wall_ms'
+]
+
+
+class TelemetrySampler(threading.Thread):
+    """
+    Samples the telemetry of graphql-engine, and of Postgres if given, every
+    interval seconds. Can be used as a context manager around a benchmark run
+    """
+
+    def __init__(self, hge, pg=None, interval=1.0):
+        super().__init__(daemon=True)
+        self.hge = hge
+        self.pg = pg
+        self.interval = interval
+        self.samples = []
+        self.stop_event = threading.Event()
+
+    def sample(self):
+        s = {'time': time.time()}
+        process = self.hge.get_process_stats()
+        if process:
+            s['process'] = process
+        gc = self.hge.get_gc_stats()
+        if gc:
+            s['gc'] = gc
+        if self.pg:
+            s['postgres'] = self.pg.get_activity_stats()
+        return s
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.samples.append(self.sample())
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        return self.samples
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def in_window(samples, start=None, end=None):
+    return [
+        s for s in samples
+        if (start is None or s['time'] >= start) and (end is None or s['time'] <= end)
+    ]
+
+
+def deltas(first, last, keys):
+    return {k: last[k] - first[k] for k in keys if first.get(k) is not None and last.get(k) is not None}
+
+
+def summarise_process(samples):
+    samples = [s for s in samples if 'process' in s]
+    if len(samples) < 2:
+        return {}
+    (first, last) = (samples[0], samples[-1])
+    elapsed = last['time'] - first['time']
+    cpu = last['process']['cpu_seconds'] - first['process']['cpu_seconds']
+    rss = [s['process']['rss_bytes'] for s in samples if s['process']['rss_bytes'] is not None]
+    return {
+        'cpu_seconds': cpu,
+        'cpu_utilisation': cpu / elapsed if elapsed else None,
+        'max_rss_bytes': max(rss) if rss else None,
+        'max_threads': max((s['process']['threads'] or 0) for s in samples)
+    }
+
+
+def summarise_gc(samples):
+    samples = [s['gc'] for s in samples if 'gc' in s]
+    if len(samples) < 2:
+        return {}
+    out = deltas(samples[0], samples[-1], gc_counters)
+    out['max_bytes_used'] = max(s.get('max_bytes_used', 0) for s in samples)
+    cpu_ms = out.get('gc_cpu_ms', 0) + out.get('mutator_cpu_ms', 0)
+    if cpu_ms:
+        # Share of the CPU time spent in garbage collection
+        out['gc_cpu_ratio'] = out.get('gc_cpu_ms', 0) / float(cpu_ms)
+    return out
+
+
+def summarise_postgres(samples):
+    samples = [s['postgres'] for s in samples if 'postgres' in s]
+    if len(samples) < 2:
+        return {}
+    out = deltas(samples[0]['database'], samples[-1]['database'], pg_database_counters)
+    blocks = out.get('blks_hit', 0) + out.get('blks_read', 0)
+    if blocks:
+        out['cache_hit_ratio'] = out['blks_hit'] / float(blocks)
+    states = set(k for s in samples for k in s['backends'])
+    out['max_backends'] = {st: max(s['backends'].get(st, 0) for s in samples) for st in states}
+    return out
+
+
+def summarise(samples, start=None, end=None):
+    """Summary of the telemetry samples between start and end"""
+    samples = in_window(samples, start, end)
+    return {
+        'process': summarise_process(samples),
+        'gc': summarise_gc(samples),
+        'postgres': summarise_postgres(samples)
+    }
+
+
+def as_rows(samples):
+    """Rows of hge_bench.telemetry, to be inserted along with a result"""
+    return [
+        {
+            'time': datetime.datetime.fromtimestamp(s['time'], datetime.timezone.utc).isoformat(),
+            'process': s.get('process'),
+            'gc': s.get('gc'),
+            'postgres': s.get('postgres')
+        }
+        for s in samples
+    ]
@@ -0,0 +1,137 @@
+"""
+Round trips of results through the Parquet results store.
+
+    python3 -m pytest test_results_store.py
+"""
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+import results_store
+
+
+def subscription_result():
+    """As insert_subscription_result: latency_histogram is a jsonb column of subscription_results"""
+    return {
+        'cpu': {
+            'data': {'key': 'cpu vCPUs: 4', 'info': {'brand': 'cpu', 'count': 4}},
+            'on_conflict': results_store.object_relationships['cpu']['on_conflict']
+        },
+        'version': 'v1.3.0',
+        'subscriptions': 100,
+        'connections': 100,
+        'mutation_rate': 10,
+        'parameters': {'subscriptions': 100, 'mutation_rate': 10},
+        'summary': {'deliveries': 1000, 'errors': 0},
+        'latency_histogram': [{'percentile': 50.0, 'latency': 1.5}, {'percentile': 99.0, 'latency': 7.25}],
+        'telemetry': {
+            'data': [
+                {'time': '2020-06-01T12:00:00+00:00', 'process': {'rss_bytes': 100}},
+                {'time': '2020-06-01T12:00:01+00:00', 'process': {'rss_bytes': 200}}
+            ]
+        }
+    }
+
+
+def test_subscription_results_round_trip(tmp_path):
+    store = results_store.ParquetResultsStore(str(tmp_path))
+    store.setup()
+    result = subscription_result()
+    store.insert('subscription_results', result)
+    store.flush()
+    [read] = store.read_results('subscription_results')
+    assert read['latency_histogram'] == result['latency_histogram']
+    assert read['telemetry'] == result['telemetry']
+    assert read['cpu']['data'] == result['cpu']['data']
+    for k in ['version', 'subscriptions', 'connections', 'mutation_rate', 'parameters', 'summary']:
+        assert read[k] == result[k]
+
+
+def test_results_histogram_is_flattened():
+    """latency_histogram of results is an array relationship, stored as list columns"""
+    (row, _) = results_store.flatten_result({
+        'latency_histogram': {'data': [{'percentile': 50.0, 'latency': 1.5}]}
+    })
+    assert row == {'latency_histogram__latency': [1.5], 'latency_histogram__percentile': [50.0]}
+
+
+def latency_result(version, rps, time, p50):
+    return {
+        'cpu': {'data': {'key': 'cpu vCPUs: 4', 'info': {'brand': 'cpu', 'count': 4}}},
+        'query': {'data': {'name': 'q', 'query': 'query { q }'}},
+        'version': version,
+        'scale_factor': 1,
+        'requests_per_sec': rps,
+        'latencies_uri': 'file:///{}/{}/{}'.format(version, rps, p50),
+        'latency_histogram': {'data': [{'percentile': 50.0, 'latency': p50}]},
+        'time': time
+    }
+
+
+def max_rps_result(version, docker_image, max_rps):
+    return {
+        'cpu': {'data': {'key': 'cpu vCPUs: 4', 'info': {'brand': 'cpu', 'count': 4}}},
+        'query': {'data': {'name': 'q', 'query': 'query { q }'}},
+        'version': version,
+        'docker_image': docker_image,
+        'scale_factor': 1,
+        'max_rps': max_rps
+    }
+
+
+def test_get_results(tmp_path):
+    """As the latest_results and avg_query_max_rps views"""
+    store = results_store.ParquetResultsStore(str(tmp_path))
+    store.setup()
+    for r in [latency_result('v1', 100, '2020-06-01T12:00:00+00:00', 1.0),
+              latency_result('v1', 100, '2020-06-02T12:00:00+00:00', 2.0),
+              latency_result('v1', 200, '2020-06-01T12:00:00+00:00', 3.0),
+              latency_result('v2', 100, '2020-06-03T12:00:00+00:00', 4.0)]:
+        store.insert('results', r)
+    for r in [max_rps_result('v1', None, 1000), max_rps_result('v1', None, 2000), max_rps_result('v2', None, 5000)]:
+        store.insert('query_max_rps', r)
+    store.flush()
+    res = store.get_results('v1')
+    latest = sorted((r['requests_per_sec'], r['latency_histogram'][0]['latency']) for r in res['latency'])
+    assert latest == [(100, 2.0), (200, 3.0)]
+    # The rows with a null docker_image are averaged together
+    assert len(res['max_rps']) == 1
+    assert res['max_rps'][0]['max_rps'] == 1500
+    assert res['max_rps'][0]['docker_image'] is None
+    assert len(store.get_results()['latency']) == 3
+
+
+class ListResultsStore(results_store.ResultsStore):
+    """Stands in for the results HGE, with the given latest time of every table"""
+
+    def __init__(self, latest_times):
+        super().__init__()
+        self.latest_times = latest_times
+        self.written = {}
+
+    def write_batch(self, table, rows):
+        self.written.setdefault(table, []).extend(rows)
+
+    def get_results(self, version=None):
+        return {'latency': [], 'max_rps': []}
+
+    def latest_time(self, table):
+        return self.latest_times.get(table)
+
+
+def test_export_to_hge_after_latest_time(tmp_path):
+    store = results_store.ParquetResultsStore(str(tmp_path))
+    store.setup()
+    for (rps, time) in [(100, '2020-06-01T12:00:00+00:00'), (200, '2020-06-02T12:00:00+00:00'),
+                        (300, '2020-06-03T12:00:00+00:00')]:
+        store.insert('results', latency_result('v1', rps, time, 1.0))
+    store.insert('query_max_rps', max_rps_result('v1', None, 1000))
+    store.flush()
+    hge_store = ListResultsStore({'results': '2020-06-02T12:00:00+00:00'})
+    results_store.export_to_hge(store, hge_store, tables=['results', 'query_max_rps'])
+    assert [r['requests_per_sec'] for r in hge_store.written['results']] == [300]
+    # Tables without results in the results HGE are exported entirely
+    assert len(hge_store.written['query_max_rps']) == 1
+    assert hge_store.written['results'][0]['cpu']['on_conflict'] == results_store.object_relationships['cpu']['on_conflict']
@@ -0,0 +1,153 @@
+"""
+A webhook sink for the event benchmarks, fast enough not to be the
+bottleneck (tens of thousands of requests per second).
+
+Worker processes, each running an aiohttp server on its own event loop (uvloop
+when it is installed), listen to the same port with SO_REUSEPORT. For every
+request, the sink records the arrival time and some fields of the JSON
+payload, and responds after an optional delay, which simulates the latency of
+a real webhook. The records are collected when the sink is stopped.
+
+The response (a JSON body, and headers) can be set, so that the sink can also
+stand in for an authorization webhook.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+from aiohttp import web
+
+import load_generator
+
+
+class WebhookSinkError(Exception):
+    """Exception type for the webhook sink"""
+
+
+async def serve(host, port, delay, fields, response, count, records, stop_event):
+    (response_text, response_headers) = response
+
+    async def handle(request):
+        arrival = time.time()
+        body = await request.read()
+        if fields is not None:
+            try:
+                payload = json.loads(body)
+                records.append((arrival, tuple(payload.get(f) for f in fields)))
+            except (ValueError, AttributeError):
+                records.append((arrival, None))
+        count.value += 1
+        if delay:
+            await asyncio.sleep(delay)
+        return web.Response(text=response_text, headers=response_headers, content_type='application/json')
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=True)
+    await site.start()
+    try:
+        while not stop_event.is_set():
+            await asyncio.sleep(0.1)
+    finally:
+        await runner.cleanup()
+
+
+def run_sink_worker(host, port, delay, fields, response, count, queue, stop_event):
+    loop = load_generator.new_event_loop()
+    asyncio.set_event_loop(loop)
+    records = []
+    try:
+        loop.run_until_complete(serve(host, port, delay, fields, response, count, records, stop_event))
+    finally:
+        loop.close()
+        queue.put(records)
+
+
+class WebhookSink:
+    """
+    Records (arrival time, values of fields of the payload) for every request,
+    or only counts the requests if fields is None. delay_ms is the time taken
+    to respond, with response (a JSON object) and response_headers
+    """
+
+    def __init__(self, port, fields=('id', 'created_at'), delay_ms=0, workers=None, host='127.0.0.1',
+                 response={}, response_headers={}):
+        self.host = host
+        self.port = port
+        self.fields = tuple(fields) if fields is not None else None
+        self.delay = delay_ms / 1000.0
+        self.response = (json.dumps(response), dict(response_headers))
+        self.workers = workers or max(1, multiprocessing.cpu_count() // 2)
+        self.procs = []
+        self.counts = []
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(self.host, self.port)
+
+    def start(self, timeout=30):
+        ctx = multiprocessing.get_context('fork')
+        self.queue = ctx.Queue()
+        self.stop_event = ctx.Event()
+        for _ in range(self.workers):
+            # Not shared between workers, so no lock is needed
+            count = ctx.Value('q', 0, lock=False)
+            proc = ctx.Process(
+                target=run_sink_worker,
+                args=(self.host, self.port, self.delay, self.fields, self.response, count, self.queue, self.stop_event),
+                daemon=True
+            )
+            proc.start()
+            self.procs.append(proc)
+            self.counts.append(count)
+        deadline = time.time() + timeout
+        while not self.is_listening():
+            if time.time() > deadline or not all(p.is_alive() for p in self.procs):
+                self.stop()
+                raise WebhookSinkError('The webhook sink did not start on port {}'.format(self.port))
+            time.sleep(0.1)
+        print("Webhook sink listening at {} ({} workers)".format(self.url, self.workers))
+
+    def is_listening(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            return sock.connect_ex((self.host, self.port)) == 0
+
+    def received(self):
+        """Number of requests received so far"""
+        return sum(c.value for c in self.counts)
+
+    def wait_for(self, n, timeout, poll_interval=0.1):
+        """Wait till n requests are received. Returns whether they were"""
+        deadline = time.time() + timeout
+        while self.received() < n:
+            if time.time() > deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def stop(self):
+        """Stop the workers. Returns the records of all the requests received"""
+        self.stop_event.set()
+        records = []
+        # Collect before joining, as the workers block till their records are read
+        for proc in self.procs:
+            if proc.is_alive() or not self.queue.empty():
+                records.extend(self.queue.get(timeout=60))
+        for proc in self.procs:
+            proc.join()
+        self.procs = []
+        self.counts = []
+        return sorted(records, key=lambda r: r[0])
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.procs:
+            self.stop()
@@ -0,0 +1,200 @@
+"""
+Mixed workloads: a weighted mix of named GraphQL operations, each with
+generators for its variables. A workload is defined in a YAML scenario file:
+
+    name: events_mix
+    operations:
+      - name: event_by_pk
+        weight: 6
+        role: user
+        query: |
+          query event_by_pk($id: Int!) {
+            hge_events_by_pk(id: $id) { id event_status }
+          }
+        variables:
+          id:
+            zipf: {schema: hge, table: events, column: id, exponent: 1.1}
+      - name: events_page
+        weight: 3
+        query: |
+          query events_page($limit: Int!) {
+            hge_events(limit: $limit) { id last_update }
+          }
+        variables:
+          limit:
+            uniform: {min: 1, max: 100}
+
+Variable generators:
+- uniform: a random integer between min and max, or, given schema, table and
+  column, a random value among those present in the column.
+- zipf: a value of the column, drawn with a Zipf distribution over the values
+  (in a random, but fixed order) so that a few values are hot.
+- choice: a random item of the given list.
+Any other value is sent as it is.
+
+role, if given, is sent as the X-Hasura-Role header, and headers adds any
+other headers to the requests of the operation.
+"""
+
+import bisect
+import itertools
+import json
+import random
+
+import ruamel.yaml as yaml
+
+
+class WorkloadError(Exception):
+    pass
+
+
+class Constant:
+
+    def __init__(self, value):
+        self.value = value
+
+    def sample(self, rng):
+        return self.value
+
+
+class Choice:
+
+    def __init__(self, values):
+        if not values:
+            raise WorkloadError('choice needs at least one value')
+        self.values = values
+
+    def sample(self, rng):
+        return rng.choice(self.values)
+
+
+class UniformInt:
+
+    def __init__(self, low, high):
+        self.low = int(low)
+        self.high = int(high)
+
+    def sample(self, rng):
+        return rng.randint(self.low, self.high)
+
+
+class ColumnValues:
+    """Values of a column. The values are fetched by resolve"""
+
+    def __init__(self, schema, table, column):
+        self.schema = schema
+        self.table = table
+        self.column = column
+        self.values = None
+
+    def resolve(self, pg, seed):
+        self.values = pg.get_column_values(self.table, self.column, self.schema)
+        if not self.values:
+            raise WorkloadError('No values in column {}.{}.{}'.format(self.schema, self.table, self.column))
+        # Do not let the hot values of a skewed distribution be the lowest keys
+        random.Random(seed).shuffle(self.values)
+
+    def sample(self, rng):
+        return rng.choice(self.values)
+
+
+class ZipfColumnValues(ColumnValues):
+
+    def __init__(self, schema, table, column, exponent=1.0):
+        super().__init__(schema, table, column)
+        self.exponent = float(exponent)
+        self.cum_weights = None
+
+    def resolve(self, pg, seed):
+        super().resolve(pg, seed)
+        # The value at rank k is drawn with probability proportional to 1/k^s
+        self.cum_weights = list(itertools.accumulate(
+            1.0 / (k ** self.exponent) for k in range(1, len(self.values) + 1)
+        ))
+
+    def sample(self, rng):
+        i = bisect.bisect_left(self.cum_weights, rng.random() * self.cum_weights[-1])
+        return self.values[min(i, len(self.values) - 1)]
+
+
+def parse_generator(spec):
+    if not isinstance(spec, dict) or len(spec) != 1:
+        return Constant(spec)
+    ((kind, args),) = spec.items()
+    if kind == 'choice':
+        return Choice(list(args))
+    elif kind == 'uniform' and 'table' in args:
+        return ColumnValues(args.get('schema', 'public'), args['table'], args['column'])
+    elif kind == 'uniform':
+        return UniformInt(args['min'], args['max'])
+    elif kind == 'zipf':
+        return ZipfColumnValues(args.get('schema', 'public'), args['table'], args['column'], args.get('exponent', 1.0))
+    return Constant(spec)
+
+
+class Operation:
+
+    def __init__(self, name, query, weight=1, variables={}, role=None, headers={}):
+        self.name = name
+        self.query = query
+        self.weight = float(weight)
+        self.variables = {k: parse_generator(v) for (k, v) in variables.items()}
+        self.headers = dict(headers)
+        if role:
+            self.headers['X-Hasura-Role'] = role
+
+    def sample_variables(self, rng):
+        return {k: g.sample(rng) for (k, g) in self.variables.items()}
+
+    def request_body(self, rng):
+        q = {'query': self.query}
+        if self.variables:
+            q['variables'] = self.sample_variables(rng)
+        return json.dumps(q)
+
+
+class Workload:
+
+    def __init__(self, name, operations, seed=0, text=None):
+        if not operations:
+            raise WorkloadError('Workload {} has no operations'.format(name))
+        self.name = name
+        self.operations = operations
+        self.seed = seed
+        # The scenario file, stored along with the results
+        self.text = text
+        self.cum_weights = list(itertools.accumulate(op.weight for op in operations))
+
+    def resolve(self, pg):
+        """Fetch the column values used by the variable generators"""
+        for op in self.operations:
+            for g in op.variables.values():
+                if isinstance(g, ColumnValues):
+                    g.resolve(pg, self.seed)
+
+    def sample(self, rng):
+        """Returns the operation name, the request body and the headers of a request"""
+        i = bisect.bisect_right(self.cum_weights, rng.random() * self.cum_weights[-1])
+        op = self.operations[min(i, len(self.operations) - 1)]
+        return (op.name, op.request_body(rng), op.headers)
+
+    def weights(self):
+        total = self.cum_weights[-1]
+        return {op.name: op.weight / total for op in self.operations}
+
+
+def load_workload(scenario_file):
+    with open(scenario_file) as f:
+        text = f.read()
+    spec = yaml.safe_load(text)
+    operations = [
+        Operation(
+            op['name'], op['query'],
+            weight = op.get('weight', 1),
+            variables = op.get('variables') or {},
+            role = op.get('role'),
+            headers = op.get('headers') or {}
+        )
+        for op in spec.get('operations') or []
+    ]
+    return Workload(spec['name'], operations, seed=spec.get('seed', 0), text=text)